@@ -6,6 +6,9 @@ const API_BASE = '/api';
 class ApiClient {
     constructor() {
         this.csrfToken = null;
+        // URL -> { etag, data } of recent GET responses, for conditional requests
+        this.etags = new Map();
+        this.maxEtags = 50;
     }
     
     // Initialize CSRF token
@@ -29,19 +32,49 @@ class ApiClient {
             }
         };
         
+        // Let the browser set the multipart boundary for uploads
+        if (options.body instanceof FormData) {
+            delete defaultOptions.headers['Content-Type'];
+        }
+        
         // Add CSRF token for non-GET requests
         if (options.method && options.method !== 'GET' && this.csrfToken) {
             defaultOptions.headers['X-CSRFToken'] = this.csrfToken;
         }
         
-        const response = await fetch(url, { ...defaultOptions, ...options });
+        // Revalidate GETs we already hold a copy of
+        const isGet = !options.method || options.method === 'GET';
+        const cached = isGet ? this.etags.get(url) : null;
+        if (cached) {
+            defaultOptions.headers['If-None-Match'] = cached.etag;
+        }
+        
+        const response = await fetch(url, { ...defaultOptions, ...options, headers: defaultOptions.headers });
+        
+        // Callers may mutate what they get, so hand out copies
+        if (response.status === 304 && cached) {
+            return structuredClone(cached.data);
+        }
         
         if (!response.ok) {
             const error = await response.json().catch(() => ({ error: 'Request failed' }));
             throw new ApiError(response.status, error);
         }
         
-        return response.json();
+        const data = await response.json();
+        const etag = response.headers.get('ETag');
+        if (isGet && etag) {
+            this.rememberEtag(url, etag, data);
+        }
+        return data;
+    }
+    
+    rememberEtag(url, etag, data) {
+        this.etags.delete(url);
+        this.etags.set(url, { etag, data: structuredClone(data) });
+        if (this.etags.size > this.maxEtags) {
+            this.etags.delete(this.etags.keys().next().value);
+        }
     }
     
     // GET request
@@ -93,8 +126,19 @@ class ApiClient {
     async upload(endpoint, formData) {
         return this.request(`${API_BASE}${endpoint}`, {
             method: 'POST',
-            body: formData,
-            headers: {} // Remove Content-Type to let browser set it
+            body: formData
+        });
+    }
+    
+    // Send bytes start..start + blob.size of a total-byte resumable upload
+    async uploadChunk(endpoint, blob, start, total) {
+        return this.request(`${API_BASE}${endpoint}`, {
+            method: 'PATCH',
+            headers: {
+                'Content-Type': 'application/octet-stream',
+                'Content-Range': `bytes ${start}-${start + blob.size - 1}/${total}`
+            },
+            body: blob
         });
     }
 }
@@ -117,7 +161,7 @@ const authAPI = {
     
     register: (userData) => api.post('/auth/register/', userData),
     
-    logout: () => api.post('/auth/logout/'),
+    logout: () => api.post('/auth/logout/').finally(() => api.etags.clear()),
     
     getCurrentUser: () => api.get('/auth/user/'),
     
@@ -137,6 +181,15 @@ const authAPI = {
 const todoAPI = {
     getAll: (params = {}) => api.get('/todos/', params),
     
+    // Todos and recurring occurrences due in [start, end), by local day
+    getCalendar: (start, end, tz = Intl.DateTimeFormat().resolvedOptions().timeZone) =>
+        api.get('/calendar/', { start, end, tz }),
+    
+    // Kanban columns with their first cards; each column's `next` loads more
+    getBoard: (groupBy = 'status', limit = 20) => api.get('/board/', { group_by: groupBy, limit }),
+    
+    getBoardColumn: (next) => api.request(next),
+    
     create: (todoData) => api.post('/todos/', todoData),
     
     get: (id) => api.get(`/todos/${id}/`),
@@ -151,6 +204,8 @@ const todoAPI = {
     
     reorder: (positions) => api.post('/todos/reorder/', { positions }),
     
+    move: (id, placement) => api.post('/todos/reorder/', { todo_id: id, ...placement }),
+    
     bulkAction: (action, todoIds) => api.post('/todos/bulk_action/', { 
         action, 
         todo_ids: todoIds 
@@ -164,15 +219,50 @@ const todoAPI = {
     
     getAttachments: (todoId) => api.get(`/todos/${todoId}/attachments/`),
     
-    uploadAttachment: (todoId, file) => {
-        const formData = new FormData();
-        formData.append('file', file);
-        return api.upload(`/todos/${todoId}/attachments/`, formData);
+    // Small files go in one request, bigger ones in resumable chunks
+    uploadAttachment: (todoId, file, { onProgress } = {}) => {
+        if (file.size <= SINGLE_UPLOAD_LIMIT) {
+            const formData = new FormData();
+            formData.append('file', file);
+            return api.upload(`/todos/${todoId}/attachments/`, formData);
+        }
+        return uploadInChunks(todoId, file, onProgress);
     },
     
+    downloadUrl: (attachment) => `${API_BASE}/attachments/${attachment.id}/download/`,
+    
     deleteAttachment: (attachmentId) => api.delete(`/attachments/${attachmentId}/`)
 };
 
+// Resumable uploads
+const SINGLE_UPLOAD_LIMIT = 4 * 1024 * 1024;
+const UPLOAD_RETRIES = 5;
+
+// Upload file in chunks, picking up where the server is after a failed
+// chunk; resolves to the attachment
+async function uploadInChunks(todoId, file, onProgress) {
+    let upload = await api.post(`/todos/${todoId}/uploads/`, { filename: file.name, size: file.size });
+    let offset = upload.offset;
+    let failures = 0;
+    
+    while (!upload.attachment) {
+        const chunk = file.slice(offset, offset + upload.chunk_size);
+        try {
+            upload = await api.uploadChunk(`/uploads/${upload.id}/`, chunk, offset, file.size);
+            offset = upload.offset;
+            failures = 0;
+            if (onProgress) onProgress(offset / file.size);
+        } catch (error) {
+            const retryable = error.status === undefined || [400, 409, 500, 502, 503].includes(error.status);
+            if (!retryable || ++failures > UPLOAD_RETRIES) throw error;
+            await new Promise(resolve => setTimeout(resolve, 1000 * 2 ** failures));
+            // Ask the server how much arrived before trying again
+            offset = (await api.get(`/uploads/${upload.id}/`)).offset;
+        }
+    }
+    return upload.attachment;
+}
+
 // Category API
 const categoryAPI = {
     getAll: () => api.get('/categories/'),
@@ -222,74 +312,72 @@ const userAPI = {
 
 // Export functions
 const exportAPI = {
-    exportTodos: (format = 'json') => api.get('/todos/export/', { format }),
+    // The export streams as a file download rather than through fetch, so
+    // large accounts never have to fit in memory
+    exportTodos: (format = 'json', options = {}) => {
+        const url = new URL(`${window.location.origin}${API_BASE}/todos/export/`);
+        Object.entries({ format, ...options }).forEach(([key, value]) => {
+            if (value !== null && value !== undefined) {
+                url.searchParams.append(key, value);
+            }
+        });
+        const link = document.createElement('a');
+        link.href = url.toString();
+        link.click();
+    },
     
-    importTodos: (file) => {
+    // Resolves to the import report; dryRun only validates the file
+    importTodos: (file, { format, dryRun = false } = {}) => {
         const formData = new FormData();
         formData.append('file', file);
+        formData.append('dry_run', dryRun);
+        if (format) {
+            formData.append('format', format);
+        }
         return api.upload('/todos/import/', formData);
     }
 };
 
-// WebSocket connection for real-time updates (if needed)
+// Server-sent events for real-time updates
 class RealtimeConnection {
     constructor() {
-        this.ws = null;
-        this.reconnectInterval = 5000;
-        this.reconnectAttempts = 0;
-        this.maxReconnectAttempts = 5;
+        this.source = null;
         this.listeners = {};
     }
     
-    connect(userId) {
-        if (this.ws) return;
-        
-        const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
-        const wsUrl = `${protocol}//${window.location.host}/ws/todos/${userId}/`;
+    connect() {
+        if (this.source || !window.EventSource) return;
         
-        this.ws = new WebSocket(wsUrl);
+        this.source = new EventSource(`${API_BASE}/events/`, { withCredentials: true });
         
-        this.ws.onopen = () => {
-            console.log('WebSocket connected');
-            this.reconnectAttempts = 0;
+        this.source.onopen = () => {
+            console.log('Event stream connected');
+            this.emit('connected');
         };
         
-        this.ws.onmessage = (event) => {
+        this.source.onmessage = (event) => {
             const data = JSON.parse(event.data);
             this.emit(data.type, data.payload);
         };
         
-        this.ws.onerror = (error) => {
-            console.error('WebSocket error:', error);
-        };
-        
-        this.ws.onclose = () => {
-            console.log('WebSocket disconnected');
-            this.ws = null;
-            this.attemptReconnect(userId);
+        // EventSource reconnects by itself when a stream ends; it only gives
+        // up (CLOSED) when the server refuses the stream
+        this.source.onerror = () => {
+            if (this.source && this.source.readyState === EventSource.CLOSED) {
+                console.log('Event stream unavailable');
+                this.source = null;
+                this.emit('disconnected');
+            }
         };
     }
     
     disconnect() {
-        if (this.ws) {
-            this.ws.close();
-            this.ws = null;
+        if (this.source) {
+            this.source.close();
+            this.source = null;
         }
     }
     
-    attemptReconnect(userId) {
-        if (this.reconnectAttempts >= this.maxReconnectAttempts) {
-            console.error('Max reconnection attempts reached');
-            return;
-        }
-        
-        this.reconnectAttempts++;
-        setTimeout(() => {
-            console.log(`Attempting to reconnect... (${this.reconnectAttempts}/${this.maxReconnectAttempts})`);
-            this.connect(userId);
-        }, this.reconnectInterval);
-    }
-    
     on(event, callback) {
         if (!this.listeners[event]) {
             this.listeners[event] = [];
@@ -310,15 +398,6 @@ class RealtimeConnection {
             callback(data);
         });
     }
-    
-    send(type, payload) {
-        if (!this.ws || this.ws.readyState !== WebSocket.OPEN) {
-            console.error('WebSocket is not connected');
-            return;
-        }
-        
-        this.ws.send(JSON.stringify({ type, payload }));
-    }
 }
 
 // Create realtime connection instance
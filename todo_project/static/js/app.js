@@ -63,8 +63,8 @@ async function initializeApp() {
         
         // Setup realtime connection if user is authenticated
         if (auth.user) {
-            // realtime.connect(auth.user.id);
-            // setupRealtimeHandlers();
+            setupRealtimeHandlers();
+            realtime.connect();
         }
         
         console.log('App initialization complete');
@@ -319,30 +319,46 @@ async function deleteCompleted() {
 }
 
 // Setup Realtime Handlers
+let realtimeHandlersReady = false;
+let realtimeRefreshTimer = null;
+
+// Coalesce bursts of events into one reload
+function scheduleRealtimeRefresh() {
+    clearTimeout(realtimeRefreshTimer);
+    realtimeRefreshTimer = setTimeout(() => {
+        loadTodos();
+        loadActivity();
+    }, 300);
+}
+
 function setupRealtimeHandlers() {
-    realtime.on('todo.created', (data) => {
-        if (data.user_id !== auth.user.id) {
-            showInfo(`New task created: ${data.title}`);
-            loadTodos();
-        }
-    });
+    if (realtimeHandlersReady) return;
+    realtimeHandlersReady = true;
     
-    realtime.on('todo.updated', (data) => {
-        if (data.user_id !== auth.user.id) {
-            loadTodos();
-        }
+    // Poll only while the event stream is unavailable; catch up on
+    // anything missed whenever it (re)connects
+    realtime.on('connected', () => {
+        stopPeriodicRefresh();
+        scheduleRealtimeRefresh();
     });
+    realtime.on('disconnected', startPeriodicRefresh);
+    
+    [
+        'todo.created', 'todo.updated', 'todo.deleted', 'todo.shared', 'todo.unshared',
+        'todos.bulk', 'todos.reordered', 'comment.created', 'comment.updated', 'comment.deleted',
+        // Sent instead of the events a slow connection missed
+        'resync'
+    ].forEach(type => realtime.on(type, scheduleRealtimeRefresh));
     
-    realtime.on('todo.deleted', (data) => {
+    realtime.on('todo.created', (data) => {
         if (data.user_id !== auth.user.id) {
-            loadTodos();
+            showInfo(`New task created: ${data.title}`);
         }
     });
     
     realtime.on('todo.shared', (data) => {
         if (data.shared_with.includes(auth.user.id)) {
             showInfo(`A task was shared with you: ${data.title}`);
-            loadTodos();
         }
     });
 }
@@ -447,6 +463,8 @@ window.shareTodo = async function() {
 let refreshInterval;
 
 function startPeriodicRefresh() {
+    if (refreshInterval) return;
+    
     // Refresh data every 5 minutes
     refreshInterval = setInterval(() => {
         if (auth.isAuthenticated) {
@@ -466,8 +484,11 @@ function stopPeriodicRefresh() {
 // Start refresh when app loads
 startPeriodicRefresh();
 
-// Stop refresh when user logs out
-window.addEventListener('logout', stopPeriodicRefresh);
+// Stop refresh and the event stream when user logs out
+window.addEventListener('logout', () => {
+    stopPeriodicRefresh();
+    realtime.disconnect();
+});
 
 // Service Worker Registration (for PWA)
 if ('serviceWorker' in navigator) {
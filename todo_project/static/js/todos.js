@@ -496,14 +496,13 @@ async function handleDrop(e) {
             const [draggedTodo] = todos.splice(draggedIndex, 1);
             todos.splice(targetIndex, 0, draggedTodo);
             
-            // Update positions
-            const positions = {};
-            todos.forEach((todo, index) => {
-                positions[todo.id] = index;
-            });
+            // Moving down lands after the target, moving up lands before it
+            const placement = draggedIndex < targetIndex
+                ? { after_id: targetId }
+                : { before_id: targetId };
             
             try {
-                await todoAPI.reorder(positions);
+                await todoAPI.move(draggedId, placement);
                 renderTodos();
             } catch (error) {
                 console.error('Failed to reorder todos:', error);
@@ -525,20 +524,11 @@ function handleDragEnd(e) {
 }
 
 // Export Todos
-async function exportTodos() {
+function exportTodos() {
     try {
         const format = 'json'; // Could add format selector
-        const response = await exportAPI.exportTodos(format);
-        
-        const filename = `todos_${new Date().toISOString().split('T')[0]}.${format}`;
-        
-        if (format === 'json') {
-            exportToJSON(response, filename);
-        } else if (format === 'csv') {
-            exportToCSV(response, filename);
-        }
-        
-        showSuccess('Tasks exported successfully!');
+        exportAPI.exportTodos(format, { include: 'categories,subtasks,comments' });
+        showSuccess('Export started');
     } catch (error) {
         console.error('Export failed:', error);
         showError('Failed to export tasks');
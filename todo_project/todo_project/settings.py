@@ -155,4 +155,77 @@ AUTH_USER_MODEL = 'todos.User'
 
 # File upload settings
 FILE_UPLOAD_MAX_MEMORY_SIZE = 5242880  # 5MB
-DATA_UPLOAD_MAX_MEMORY_SIZE = 5242880  # 5MB
\ No newline at end of file
+DATA_UPLOAD_MAX_MEMORY_SIZE = 5242880  # 5MB
+# Bigger uploads are spooled to disk and hashed as they arrive, for blob storage
+FILE_UPLOAD_HANDLERS = [
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'todos.storage.HashingUploadHandler',
+]
+
+# Cache shared by every worker process. It holds the per-user data versions
+# that invalidate cached payloads and ETags (todos/caching.py), so it is
+# required: with a per-process cache such as LocMemCache, Django's default,
+# each worker keeps its own versions and serves data other workers changed.
+# migrate creates its table (todos migration 0020). Redis or Memcached are
+# faster and bump versions with an atomic incr, e.g.
+#   'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+#   'LOCATION': 'redis://127.0.0.1:6379',
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'todo_cache',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+}
+TODO_CACHE_ALIAS = 'default'
+TODO_CACHE_TIMEOUT = 60  # seconds a cached payload may be served
+TODO_CACHE_LOCAL_SIZE = 256  # entries kept in each process in front of CACHES
+
+# Activity log settings
+# Entries are buffered and written in batches; set TODO_ACTIVITY_SYNC to write
+# each one inside the request instead
+TODO_ACTIVITY_SYNC = False
+TODO_ACTIVITY_BATCH_SIZE = 100
+TODO_ACTIVITY_FLUSH_INTERVAL = 1.0  # seconds
+TODO_ACTIVITY_RETENTION_DAYS = 90  # Older entries are archived by archive_activity
+
+# Delta sync settings
+TODO_SYNC_TOMBSTONE_DAYS = 30  # Sync tokens older than this must reload everything
+# Seconds of recent changes re-sent below each token, covering transactions
+# that commit out of id order (None: 60, or 0 on SQLite, which cannot)
+TODO_SYNC_SAFETY_WINDOW = None
+
+# Push events (server-sent events at /api/events/, served under ASGI)
+TODO_EVENTS_BROKER = 'todos.events.LocalBroker'
+TODO_EVENTS_QUEUE_SIZE = 100  # A stream further behind than this is told to resync
+TODO_EVENTS_HEARTBEAT = 15  # seconds
+TODO_EVENTS_STREAM_LIFETIME = 300  # seconds, then the browser reconnects
+
+# Attachments (resumable uploads at /api/todos/<id>/uploads/)
+TODO_ATTACHMENT_MAX_SIZE = 512 * 1024 * 1024  # bytes
+TODO_UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024  # Largest chunk per request
+TODO_UPLOAD_EXPIRY_HOURS = 24  # Unfinished uploads are deleted by prune_uploads after this
+# Set to 'x-accel-redirect' (nginx, with an internal location at
+# TODO_ATTACHMENT_ACCEL_PREFIX aliased to MEDIA_ROOT) or 'x-sendfile' to have
+# the front server send attachment files
+TODO_ATTACHMENT_SENDFILE = None
+TODO_ATTACHMENT_ACCEL_PREFIX = '/protected-media/'
+
+# Thumbnails of avatars and image attachments, rendered by a process pool;
+# TODO_THUMBNAIL_SYNC renders them in the request instead
+TODO_THUMBNAIL_SYNC = False
+TODO_THUMBNAIL_WORKERS = 2
+TODO_THUMBNAIL_QUALITY = 80  # WebP quality
+
+# Reminders (python manage.py run_reminders)
+TODO_REMINDER_POLL_INTERVAL = 30  # seconds between reloads of the queue
+TODO_REMINDER_BATCH_SIZE = 500  # reminders claimed and mailed together
+TODO_REMINDER_QUEUE_SIZE = 20000  # reminders held in memory at most
+
+# Recurring todos (python manage.py roll_forward_recurring, e.g. hourly)
+TODO_RECURRENCE_CATCH_UP = 30  # Missed occurrences created per series at most
+
+# Summary digests (python manage.py send_digests, nightly)
+TODO_DIGEST_CHUNK_SIZE = 1000  # users summarized and mailed together
+TODO_DIGEST_WEEKDAY = 0  # weekly digests go out on Mondays
+TODO_DIGEST_ITEMS = 5  # due todos listed per digest
@@ -0,0 +1,135 @@
+# todos/activity.py
+
+import atexit
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from . import caching
+from .models import ActivityLog, Todo, User
+
+logger = logging.getLogger(__name__)
+
+# Settings, with defaults:
+#   TODO_ACTIVITY_SYNC            write each entry inside the request (False)
+#   TODO_ACTIVITY_BATCH_SIZE      queued entries that trigger a flush (100)
+#   TODO_ACTIVITY_FLUSH_INTERVAL  seconds between flushes otherwise (1.0)
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_FLUSH_INTERVAL = 1.0
+
+class ActivitySink:
+    """
+    Buffers ActivityLog entries in-process and writes them with bulk_create
+    from a background thread, once batch_size entries are queued or every
+    interval seconds. Entries are queued once the logging transaction
+    commits, so a rolled back action leaves none behind, and keep the time
+    they were logged; a todo deleted before the flush is recorded as null,
+    like on_delete=SET_NULL would.
+    """
+    
+    def __init__(self, batch_size=None, interval=None, sync=None):
+        self.batch_size = batch_size
+        self.interval = interval
+        self.sync = sync
+        self.pending = []
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.wake = threading.Event()
+        self.worker = None
+        self.pid = None
+    
+    def setting(self, value, name, default):
+        return value if value is not None else getattr(settings, name, default)
+    
+    def log(self, **fields):
+        """Record an activity; fields are those of ActivityLog"""
+        return self.log_many([fields])[0]
+    
+    def log_many(self, entries):
+        """Record several activities, each a dict of ActivityLog fields"""
+        entries = [ActivityLog(**fields) for fields in entries]
+        if not entries:
+            return entries
+        if self.setting(self.sync, 'TODO_ACTIVITY_SYNC', False):
+            ActivityLog.objects.bulk_create(entries)
+            caching.bump_version(*{entry.user_id for entry in entries})
+            return entries
+        
+        transaction.on_commit(lambda: self.enqueue(entries))
+        return entries
+    
+    def enqueue(self, entries):
+        with self.lock:
+            self.pending.extend(entries)
+            full = len(self.pending) >= self.setting(self.batch_size, 'TODO_ACTIVITY_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+        self.ensure_worker()
+        if full:
+            self.wake.set()
+    
+    def ensure_worker(self):
+        # Threads do not survive fork(), so each worker process starts its own
+        if self.worker is not None and self.pid == os.getpid() and self.worker.is_alive():
+            return
+        with self.lock:
+            if self.worker is None or self.pid != os.getpid() or not self.worker.is_alive():
+                self.pid = os.getpid()
+                self.worker = threading.Thread(target=self.run, name='activity-sink', daemon=True)
+                self.worker.start()
+    
+    def run(self):
+        while True:
+            self.wake.wait(self.setting(self.interval, 'TODO_ACTIVITY_FLUSH_INTERVAL', DEFAULT_FLUSH_INTERVAL))
+            self.wake.clear()
+            try:
+                self.flush()
+            finally:
+                close_old_connections()
+    
+    def flush(self):
+        """Write every queued entry now; returns the number written"""
+        with self.flush_lock:
+            with self.lock:
+                entries, self.pending = self.pending, []
+            if not entries:
+                return 0
+            
+            # Drop references that disappeared while the entries were queued
+            todo_ids = {entry.todo_id for entry in entries if entry.todo_id}
+            existing = set(Todo.objects.filter(pk__in=todo_ids).values_list('pk', flat=True))
+            users = set(User.objects.filter(pk__in={entry.user_id for entry in entries}).values_list('pk', flat=True))
+            entries = [entry for entry in entries if entry.user_id in users]
+            for entry in entries:
+                if entry.todo_id and entry.todo_id not in existing:
+                    entry.todo_id = None
+            
+            try:
+                ActivityLog.objects.bulk_create(entries)
+                written = entries
+            except Exception:
+                logger.exception('Activity batch failed, writing entries one by one')
+                written = []
+                for entry in entries:
+                    try:
+                        entry.save()
+                        written.append(entry)
+                    except Exception:
+                        logger.exception('Dropped activity entry %s for user %s', entry.action, entry.user_id)
+            
+            # bulk_create sends no post_save, so invalidate cached feeds here
+            caching.bump_version(*{entry.user_id for entry in written})
+            return len(written)
+
+sink = ActivitySink()
+atexit.register(sink.flush)
+
+def log(**fields):
+    return sink.log(**fields)
+
+def log_many(entries):
+    return sink.log_many(entries)
+
+def flush():
+    return sink.flush()
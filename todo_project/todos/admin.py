@@ -3,8 +3,8 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from .models import (
-    User, Category, Todo, TodoComment, TodoAttachment, 
-    ActivityLog, TodoTemplate, UserPreferences
+    User, Category, Tag, Todo, TodoComment, TodoAttachment, 
+    ActivityLog, ActivityArchive, TodoTemplate, UserPreferences
 )
 
 # Custom User Admin
@@ -33,6 +33,19 @@ class CategoryAdmin(admin.ModelAdmin):
             return qs
         return qs.filter(user=request.user)
 
+# Tag Admin
+@admin.register(Tag)
+class TagAdmin(admin.ModelAdmin):
+    list_display = ['name', 'user']
+    search_fields = ['name', 'user__username']
+    ordering = ['name']
+    
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        if request.user.is_superuser:
+            return qs
+        return qs.filter(user=request.user)
+
 # Todo Admin
 @admin.register(Todo)
 class TodoAdmin(admin.ModelAdmin):
@@ -120,6 +133,22 @@ class ActivityLogAdmin(admin.ModelAdmin):
         # Activity logs should not be editable
         return False
 
+# ActivityArchive Admin
+@admin.register(ActivityArchive)
+class ActivityArchiveAdmin(admin.ModelAdmin):
+    list_display = ['user', 'month', 'count', 'first_timestamp', 'last_timestamp']
+    list_filter = ['month']
+    search_fields = ['user__username']
+    ordering = ['-month']
+    exclude = ['data']
+    
+    def has_add_permission(self, request):
+        # Archives are written by the archive_activity command
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
 # TodoTemplate Admin
 @admin.register(TodoTemplate)
 class TodoTemplateAdmin(admin.ModelAdmin):
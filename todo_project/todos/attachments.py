@@ -0,0 +1,313 @@
+# todos/attachments.py
+
+import mimetypes
+import os
+import re
+from datetime import timedelta
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+from django.utils import timezone
+from django.utils.http import content_disposition_header, http_date, parse_etags, parse_http_date_safe
+
+from . import activity, storage, thumbnails
+from .models import AttachmentUpload, TodoAttachment
+
+# Attachment storage and transfer. Small files may be posted in one
+# multipart request, which Django spools to disk past
+# FILE_UPLOAD_MAX_MEMORY_SIZE. Big ones go through a resumable upload: the
+# client opens an upload with the file's size, then PATCHes chunks with a
+# Content-Range, each streamed into a part file under MEDIA_ROOT, and can
+# ask where the upload stands to resume after a failure. The last chunk
+# moves the part file into place. Downloads are file responses with Range
+# and conditional request support; the whole-file case streams through the
+# server's sendfile, and a front server can take over entirely with
+# X-Accel-Redirect or X-Sendfile (TODO_ATTACHMENT_SENDFILE).
+
+# Largest attachment in bytes (TODO_ATTACHMENT_MAX_SIZE)
+DEFAULT_MAX_SIZE = 512 * 1024 * 1024
+
+# Largest chunk one request may carry (TODO_UPLOAD_CHUNK_SIZE)
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Hours an unfinished upload is kept after its last chunk (TODO_UPLOAD_EXPIRY_HOURS)
+DEFAULT_EXPIRY_HOURS = 24
+
+# None to send files from Django, 'x-accel-redirect' (nginx) or 'x-sendfile'
+# (Apache, lighttpd) to have the front server send them (TODO_ATTACHMENT_SENDFILE)
+DEFAULT_SENDFILE = None
+
+# Internal location nginx maps onto MEDIA_ROOT (TODO_ATTACHMENT_ACCEL_PREFIX)
+DEFAULT_ACCEL_PREFIX = '/protected-media/'
+
+# Bytes read from the request or the file at a time
+BLOCK_SIZE = 64 * 1024
+
+UPLOAD_DIR = 'uploads'
+
+class UploadTooLarge(ValueError):
+    pass
+
+class UploadConflict(ValueError):
+    """A chunk that does not start where the upload stands"""
+    
+    def __init__(self, offset):
+        super().__init__(f'Upload is at byte {offset}')
+        self.offset = offset
+
+def max_size():
+    return getattr(settings, 'TODO_ATTACHMENT_MAX_SIZE', DEFAULT_MAX_SIZE)
+
+def chunk_size():
+    return getattr(settings, 'TODO_UPLOAD_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+
+def check_size(size):
+    if size > max_size():
+        raise UploadTooLarge(f'Attachments may be at most {max_size()} bytes')
+
+def clean_filename(name):
+    return os.path.basename(str(name).replace('\\', '/')).strip()[:255] or 'attachment'
+
+def create_attachment(todo, user, content, filename, size):
+    """Store content (a django File) as an attachment of todo and log it"""
+    attachment = TodoAttachment(todo=todo, uploaded_by=user, filename=filename, file_size=size)
+    with transaction.atomic():
+        # A file placed for a save that rolls back is left to collect_blobs()
+        attachment.file.save(filename, content, save=False)
+        attachment.blob_id = storage.digest_of(attachment.file.name)
+        attachment.save()
+        transaction.on_commit(lambda: thumbnails.schedule_preview(attachment))
+    activity.log(user=user, action='attached', todo=todo, todo_title=todo.title,
+                 details={'filename': filename, 'file_size': size})
+    return attachment
+
+def attach(todo, user, uploaded_file):
+    """Attachment from a file posted in one request; raises UploadTooLarge"""
+    check_size(uploaded_file.size)
+    return create_attachment(todo, user, uploaded_file, clean_filename(uploaded_file.name), uploaded_file.size)
+
+# Resumable uploads
+
+def part_path(upload):
+    return default_storage.path(f'{UPLOAD_DIR}/{upload.pk}.part')
+
+class PartFile(File):
+    """A received part file; storage moves it into place instead of copying it"""
+    
+    def temporary_file_path(self):
+        return self.name
+
+def start_upload(todo, user, filename, size):
+    """Open a resumable upload of size bytes; raises UploadTooLarge"""
+    check_size(size)
+    upload = AttachmentUpload.objects.create(todo=todo, user=user, filename=clean_filename(filename), size=size)
+    path = part_path(upload)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, 'wb').close()
+    return upload
+
+CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+|\*)$')
+
+def parse_content_range(header, size):
+    """(start, end) of a chunk's Content-Range, end inclusive; raises ValueError"""
+    match = CONTENT_RANGE_RE.match((header or '').strip())
+    if not match:
+        raise ValueError('Chunks need a Content-Range of bytes start-end/size')
+    start, end, total = match.groups()
+    start, end = int(start), int(end)
+    if end < start or end >= size or total not in ('*', str(size)):
+        raise ValueError(f'Content-Range does not fit an upload of {size} bytes')
+    return start, end
+
+def write_chunk(upload, stream, start, length):
+    """
+    Write length bytes from stream at byte start of the upload and return
+    where it stands afterwards, which is short of start + length if the
+    body ended early (what did arrive is kept). Raises UploadConflict if
+    start is not where the upload stands and UploadTooLarge for a chunk
+    over the chunk size.
+    """
+    if start != upload.received:
+        raise UploadConflict(upload.received)
+    if length > chunk_size():
+        raise UploadTooLarge(f'Chunks may be at most {chunk_size()} bytes')
+    
+    written = 0
+    with open(part_path(upload), 'r+b') as part:
+        part.seek(start)
+        while written < length:
+            block = stream.read(min(BLOCK_SIZE, length - written))
+            if not block:
+                break
+            part.write(block)
+            written += len(block)
+    
+    # Another request may have moved the upload on meanwhile
+    updated = AttachmentUpload.objects.filter(pk=upload.pk, received=start).update(
+        received=start + written, updated_at=timezone.now()
+    )
+    if not updated:
+        raise UploadConflict(AttachmentUpload.objects.filter(pk=upload.pk).values_list('received', flat=True).first() or 0)
+    upload.received = start + written
+    return upload.received
+
+def complete_upload(upload):
+    """Turn a fully received upload into its attachment"""
+    path = part_path(upload)
+    with transaction.atomic():
+        with open(path, 'rb') as part:
+            attachment = create_attachment(upload.todo, upload.user, PartFile(part, path), upload.filename, upload.size)
+        upload.delete()
+    return attachment
+
+def prune_uploads(hours=None):
+    """Delete uploads idle for longer than the expiry, with their part files; returns how many"""
+    hours = getattr(settings, 'TODO_UPLOAD_EXPIRY_HOURS', DEFAULT_EXPIRY_HOURS) if hours is None else hours
+    deleted, _ = AttachmentUpload.objects.filter(updated_at__lt=timezone.now() - timedelta(hours=hours)).delete()
+    return deleted
+
+def remove_part(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+# Blobs
+
+# Rows that hold a reference to a blob, as (model, blob field)
+BLOB_REFERENCES = [(TodoAttachment, 'blob')]
+
+def collect_blobs(grace=None):
+    """Repair blob reference counts and delete unreferenced blobs and orphaned files; returns (blobs, files)"""
+    return storage.collect_garbage(BLOB_REFERENCES, grace=storage.ORPHAN_GRACE if grace is None else grace)
+
+def adopt_legacy_files():
+    """Move attachments stored before content addressing into blobs; returns how many"""
+    adopted = 0
+    legacy = list(TodoAttachment.objects.filter(blob__isnull=True).exclude(file='').values_list('pk', 'file'))
+    for pk, name in legacy:
+        try:
+            with transaction.atomic(), storage.blob_storage.open(name, 'rb') as file:
+                blob = storage.blob_storage.save(name, file)
+                TodoAttachment.objects.filter(pk=pk).update(file=blob, blob_id=storage.digest_of(blob))
+        except FileNotFoundError:
+            continue
+        storage.blob_storage.remove(name)
+        adopted += 1
+    return adopted
+
+# Downloads
+
+def etag(attachment):
+    # Attachments never change; older ones, without a digest, go by id and size
+    return f'"{attachment.blob_id or f"{attachment.pk.hex}-{attachment.file_size}"}"'
+
+def not_modified(request, attachment):
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match:
+        return if_none_match.strip() == '*' or etag(attachment) in parse_etags(if_none_match)
+    if_modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+    return if_modified_since is not None and int(attachment.uploaded_at.timestamp()) <= if_modified_since
+
+def range_applies(request, attachment):
+    """Whether a Range is honoured: If-Range must name this version, if given"""
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    return if_range == etag(attachment) or parse_http_date_safe(if_range) == int(attachment.uploaded_at.timestamp())
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+def parse_range(header, size):
+    """
+    (start, end) of a single-range Range header, end inclusive, or None to
+    send the whole file (no header, several ranges or an unknown unit).
+    Raises ValueError when the range lies past the end of the file.
+    """
+    match = RANGE_RE.match((header or '').strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:
+        # The last n bytes
+        if int(last) == 0:
+            raise ValueError(header)
+        return max(0, size - int(last)), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise ValueError(header)
+    return start, min(int(last), size - 1) if last else size - 1
+
+class RangeFile:
+    """Reads length bytes of a file from where it is positioned"""
+    
+    def __init__(self, file, length):
+        self.file = file
+        self.remaining = length
+    
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+    
+    def close(self):
+        self.file.close()
+
+def validators(response, attachment):
+    response['ETag'] = etag(attachment)
+    response['Last-Modified'] = http_date(attachment.uploaded_at.timestamp())
+    response['Cache-Control'] = 'private, max-age=0, must-revalidate'
+    return response
+
+def sendfile_response(attachment, mode):
+    """An empty response telling the front server which file to send"""
+    content_type, _ = mimetypes.guess_type(attachment.filename)
+    response = HttpResponse(content_type=content_type or 'application/octet-stream')
+    response['Content-Disposition'] = content_disposition_header(True, attachment.filename)
+    if mode == 'x-accel-redirect':
+        prefix = getattr(settings, 'TODO_ATTACHMENT_ACCEL_PREFIX', DEFAULT_ACCEL_PREFIX)
+        response['X-Accel-Redirect'] = prefix + quote(attachment.file.name)
+    else:
+        response['X-Sendfile'] = attachment.file.path
+    return response
+
+def download_response(request, attachment):
+    """The attachment's file, honouring conditional and Range requests"""
+    if not_modified(request, attachment):
+        return validators(HttpResponseNotModified(), attachment)
+    
+    mode = getattr(settings, 'TODO_ATTACHMENT_SENDFILE', DEFAULT_SENDFILE)
+    if mode:
+        # The front server handles Range itself
+        return validators(sendfile_response(attachment, mode), attachment)
+    
+    size = attachment.file_size
+    byte_range = None
+    if 'Range' in request.headers and range_applies(request, attachment):
+        try:
+            byte_range = parse_range(request.headers['Range'], size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+    
+    file = attachment.file.open('rb')
+    if byte_range is None:
+        # A real file, which WSGI servers send with sendfile()
+        response = FileResponse(file, as_attachment=True, filename=attachment.filename)
+    else:
+        start, end = byte_range
+        file.seek(start)
+        response = FileResponse(RangeFile(file, end - start + 1), status=206, as_attachment=True, filename=attachment.filename)
+        response['Content-Length'] = end - start + 1
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Accept-Ranges'] = 'bytes'
+    return validators(response, attachment)
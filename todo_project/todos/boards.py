@@ -0,0 +1,132 @@
+# todos/boards.py
+
+from django.core.exceptions import ValidationError
+from django.db.models import Count, F, Q, Window
+from django.db.models.functions import RowNumber
+
+from .models import Category, Todo
+from .ordering import KEYS
+from .pagination import KeysetPagination
+
+# Kanban boards. board() returns every column of a board in one query: it
+# ranks the todos within their column with ROW_NUMBER() OVER (PARTITION BY
+# the grouping field ORDER BY the list order), keeps the first few of each
+# and counts every column with COUNT(*) over the same partition. The rest
+# of a column is read only when asked for, as keyset pages of that column
+# alone (ColumnPagination) continuing from its last card.
+
+# Grouping -> Todo field that decides the column
+GROUPINGS = {
+    'category': 'category_id',
+    'priority': 'priority',
+    'status': 'completed',
+}
+
+# Cards per column (?limit=)
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+# Column key of todos without a category
+NO_CATEGORY = 'none'
+
+STATUS_COLUMNS = [('open', 'Open', False), ('completed', 'Completed', True)]
+
+CARD_FIELDS = ('id', 'title', 'priority', 'completed', 'due_date', 'category_id', 'tags', 'is_pinned', 'position', 'created_at')
+
+class ColumnPagination(KeysetPagination):
+    """Keyset pages of one column, in the list order"""
+    ordering = KEYS
+    page_size = DEFAULT_LIMIT
+    page_size_query_param = 'limit'
+    max_page_size = MAX_LIMIT
+
+def parse_group_by(value):
+    value = value or 'status'
+    if value not in GROUPINGS:
+        raise ValueError(f"group_by must be one of {', '.join(GROUPINGS)}")
+    return value
+
+def parse_limit(value):
+    if value is None or value == '':
+        return DEFAULT_LIMIT
+    if not value.isdigit() or not 1 <= int(value) <= MAX_LIMIT:
+        raise ValueError(f'limit must be between 1 and {MAX_LIMIT}')
+    return int(value)
+
+def board_todos(user):
+    return Todo.objects.visible_to(user).filter(is_archived=False)
+
+def columns(user, group_by, present):
+    """(key, title, field value, extra) of every column, present being the field values with todos"""
+    if group_by == 'priority':
+        return [(value, title, value, {}) for value, title in reversed(Todo.PRIORITY_CHOICES)]
+    if group_by == 'status':
+        return [(key, title, value, {}) for key, title, value in STATUS_COLUMNS]
+    categories = Category.objects.filter(Q(user=user) | Q(pk__in=[pk for pk in present if pk]))
+    return [(NO_CATEGORY, 'Uncategorized', None, {})] + [
+        (str(category.pk), category.name, category.pk, {'color': category.color, 'icon': category.icon})
+        for category in categories
+    ]
+
+def column_filter(group_by, key):
+    """Filter for the todos of the column key; raises ValueError for an unknown one"""
+    field = GROUPINGS[group_by]
+    if group_by == 'priority':
+        if key not in dict(Todo.PRIORITY_CHOICES):
+            raise ValueError(f'Unknown column: {key}')
+        return Q(priority=key)
+    if group_by == 'status':
+        values = {column: value for column, _, value in STATUS_COLUMNS}
+        if key not in values:
+            raise ValueError(f'Unknown column: {key}')
+        return Q(completed=values[key])
+    if key == NO_CATEGORY:
+        return Q(category__isnull=True)
+    try:
+        return Q(**{field: Category._meta.pk.to_python(key)})
+    except ValidationError:
+        raise ValueError(f'Unknown column: {key}')
+
+def card(todo):
+    return {
+        'id': str(todo.pk),
+        'title': todo.title,
+        'priority': todo.priority,
+        'completed': todo.completed,
+        'due_date': todo.due_date,
+        'category': str(todo.category_id) if todo.category_id else None,
+        'tags': todo.tags,
+        'is_pinned': todo.is_pinned,
+    }
+
+def board(user, group_by, limit, next_link):
+    """
+    Every column of the user's board grouped by group_by, with its total
+    and first limit cards; next_link(key, last todo) links the rest
+    """
+    field = GROUPINGS[group_by]
+    order = [F(key[1:]).desc() if key.startswith('-') else F(key).asc() for key in KEYS]
+    ranked = board_todos(user).only(*CARD_FIELDS).annotate(
+        rank=Window(RowNumber(), partition_by=[F(field)], order_by=order),
+        column_total=Window(Count('pk'), partition_by=[F(field)]),
+    ).filter(rank__lte=limit).order_by(field, 'rank')
+    
+    cards, totals = {}, {}
+    for todo in ranked:
+        value = getattr(todo, field)
+        cards.setdefault(value, []).append(todo)
+        totals[value] = todo.column_total
+    
+    result = []
+    for key, title, value, extra in columns(user, group_by, totals):
+        todos = cards.get(value, [])
+        total = totals.get(value, 0)
+        result.append({
+            'key': key,
+            'title': title,
+            **extra,
+            'count': total,
+            'cards': [card(todo) for todo in todos],
+            'next': next_link(key, todos[-1]) if total > len(todos) else None,
+        })
+    return {'group_by': group_by, 'columns': result}
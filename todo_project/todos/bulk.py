@@ -0,0 +1,289 @@
+# todos/bulk.py
+
+import logging
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import activity, attachments, caching, events, recurrence, rollups, search, storage, sync
+from .models import (
+    ActivityLog, AttachmentUpload, Category, Tag, Todo, TodoAttachment, TodoComment, TodoSearchDocument
+)
+from .tags import sync_tags_bulk
+
+logger = logging.getLogger(__name__)
+
+# Todos per transaction, so no single write holds SQLite's lock for long
+CHUNK_SIZE = 500
+
+# Rows deleted with a todo, by their foreign key to it, children first
+DEPENDENTS = (
+    (TodoComment, 'todo_id'),
+    (TodoAttachment, 'todo_id'),
+    (AttachmentUpload, 'todo_id'),
+    (TodoSearchDocument, 'todo_id'),
+    (Todo.shared_with.through, 'todo_id'),
+    (Todo.tag_index.through, 'todo_id'),
+)
+
+# Helpers
+
+def update(todos, changes, after=None):
+    """
+    Apply changes to todos with one UPDATE and move their contribution in
+    the stats rollup; after(snapshot) gives the new stored state when
+    changes hold expressions. Returns the (pk, title) of every updated row.
+    """
+    rows = list(todos.values_list('pk', 'title'))
+    if not rows:
+        return rows
+    todos = Todo.objects.filter(pk__in=[pk for pk, _ in rows])
+    old = rollups.snapshots(todos)
+    # update() skips auto_now, so stamp updated_at explicitly
+    todos.update(updated_at=timezone.now(), **changes)
+    after = after or (lambda snapshot: {**snapshot, **changes})
+    rollups.apply_changes((snapshot, after(snapshot)) for snapshot in old)
+    return rows
+
+def retag(todos, edit):
+    """Rewrite Todo.tags with edit(tags) and resync the tag index and search"""
+    changed = []
+    for todo in todos.only('pk', 'user_id', 'title', 'tags'):
+        tags = todo.tags if isinstance(todo.tags, list) else []
+        new_tags = edit(tags)
+        if new_tags != tags:
+            todo.tags = new_tags
+            todo.updated_at = timezone.now()
+            changed.append(todo)
+    Todo.objects.bulk_update(changed, ['tags', 'updated_at'])
+    sync_tags_bulk(changed)
+    search.index_tags(changed)
+    return [(todo.pk, todo.title) for todo in changed]
+
+# Actions: each applies itself to one chunk of todos and returns the
+# (pk, title) of the todos it changed
+
+def complete(todos, params, result):
+    rows = update(todos.filter(completed=False), {'completed': True, 'completed_at': timezone.now()})
+    recurrence.advance(pk for pk, _ in rows)
+    return rows
+
+def incomplete(todos, params, result):
+    return update(todos.filter(completed=True), {'completed': False, 'completed_at': None})
+
+def archive(todos, params, result):
+    return update(todos.filter(is_archived=False), {'is_archived': True})
+
+def unarchive(todos, params, result):
+    return update(todos.filter(is_archived=True), {'is_archived': False})
+
+def set_category(todos, params, result):
+    return update(todos.exclude(category_id=params['category']), {'category_id': params['category']})
+
+def set_priority(todos, params, result):
+    return update(todos.exclude(priority=params['priority']), {'priority': params['priority']})
+
+def shift_due(todos, params, result):
+    delta = timedelta(days=params['days'])
+    return update(
+        todos.filter(due_date__isnull=False), {'due_date': F('due_date') + delta},
+        after=lambda snapshot: {**snapshot, 'due_date': snapshot['due_date'] + delta}
+    )
+
+def add_tags(todos, params, result):
+    def edit(tags):
+        present = Tag.normalize(tags)
+        return tags + [tag for tag in params['tags'] if Tag.normalize([tag]).isdisjoint(present)]
+    return retag(todos, edit)
+
+def remove_tags(todos, params, result):
+    removed = Tag.normalize(params['tags'])
+    return retag(todos, lambda tags: [tag for tag in tags if Tag.normalize([tag]).isdisjoint(removed)])
+
+def set_tags(todos, params, result):
+    return retag(todos, lambda tags: list(params['tags']))
+
+def chunks(ids):
+    for start in range(0, len(ids), CHUNK_SIZE):
+        yield ids[start:start + CHUNK_SIZE]
+
+def raw_delete(queryset):
+    """One DELETE for queryset, skipping the collector and the per-row delete signals"""
+    return queryset._raw_delete(queryset.db)
+
+def delete(todos, params, result):
+    """
+    Delete todos with their subtasks and every row that depends on them in
+    one DELETE per table and chunk, doing in bulk what the delete signals
+    do for single todos: rollup, change log, blob references, caches and
+    events
+    """
+    rows = list(todos.values_list('pk', 'title'))
+    if not rows:
+        return rows
+    roots = list(Todo.objects.filter(pk__in=[pk for pk, _ in rows]).only('pk', 'path'))
+    ids = list(dict.fromkeys([
+        *(root.pk for root in roots), *Todo.objects.descendants_of(roots).values_list('pk', flat=True)
+    ]))
+    
+    snapshots, seen_by, actors = [], defaultdict(list), set()
+    blobs, files, parts = Counter(), [], []
+    for chunk in chunks(ids):
+        for snapshot in Todo.objects.filter(pk__in=chunk).order_by().values('pk', *Todo.STATS_FIELDS):
+            snapshots.append(snapshot)
+            seen_by[snapshot['user_id']].append(snapshot['pk'])
+        for user_id, todo_id in Todo.shared_with.through.objects.filter(todo_id__in=chunk).values_list('user_id', 'todo_id'):
+            seen_by[user_id].append(todo_id)
+        actors.update(ActivityLog.objects.filter(todo_id__in=chunk).values_list('user_id', flat=True).distinct())
+        for blob_id, name in TodoAttachment.objects.filter(todo_id__in=chunk).values_list('blob_id', 'file'):
+            if blob_id:
+                blobs[blob_id] += 1
+            elif name:
+                files.append(name)
+        parts += [attachments.part_path(upload) for upload in AttachmentUpload.objects.filter(todo_id__in=chunk).only('pk')]
+    
+    for user_id, todo_ids in seen_by.items():
+        sync.record([user_id], 'todo', todo_ids, deleted=True)
+    # Ancestors left standing lose subtree counts
+    sync.record_todos({pk for root in roots for pk in sync.ancestor_ids(root)} - set(ids))
+    for snapshot in snapshots:
+        if snapshot['category_id']:
+            sync.record([snapshot['user_id']], 'category', [snapshot['category_id']])
+    
+    for chunk in chunks(ids):
+        for model, field in DEPENDENTS:
+            count = raw_delete(model.objects.filter(**{f'{field}__in': chunk}))
+            if count:
+                result['deleted'][model._meta.label] += count
+        ActivityLog.objects.filter(todo_id__in=chunk).update(todo=None)
+        result['deleted'][Todo._meta.label] += raw_delete(Todo.objects.filter(pk__in=chunk))
+    
+    rollups.apply_changes((snapshot, None) for snapshot in snapshots)
+    for digest, count in blobs.items():
+        storage.release(digest, count)
+    # Attachments from before blob storage own their files
+    for name in files:
+        transaction.on_commit(lambda name=name: storage.blob_storage.delete(name))
+    for path in parts:
+        transaction.on_commit(lambda path=path: attachments.remove_part(path))
+    
+    caching.bump_version(*seen_by, *actors)
+    for user_id, todo_ids in seen_by.items():
+        events.publish([user_id], 'todos.bulk', action='delete', ids=todo_ids)
+    return rows
+
+# Parameter validation: each returns the cleaned params or raises ValueError
+
+def no_params(user, params):
+    return {}
+
+def category_param(user, params):
+    category = params.get('category')
+    if category is None:
+        return {'category': None}
+    try:
+        category = Category._meta.pk.to_python(category)
+    except ValidationError:
+        raise ValueError('Invalid category')
+    if not Category.objects.filter(user=user, pk=category).exists():
+        raise ValueError('Category not found')
+    return {'category': str(category)}
+
+def priority_param(user, params):
+    priority = params.get('priority')
+    if priority not in dict(Todo.PRIORITY_CHOICES):
+        raise ValueError(f"priority must be one of {', '.join(dict(Todo.PRIORITY_CHOICES))}")
+    return {'priority': priority}
+
+def days_param(user, params):
+    days = params.get('days')
+    if not isinstance(days, int) or isinstance(days, bool) or not days:
+        raise ValueError('days must be a non-zero integer')
+    return {'days': days}
+
+def tags_param(user, params):
+    tags = params.get('tags')
+    if not isinstance(tags, list) or not all(isinstance(tag, str) and tag.strip() for tag in tags):
+        raise ValueError('tags must be a list of names')
+    return {'tags': [tag.strip() for tag in tags]}
+
+# Action name -> (function, parameter validator, ActivityLog action)
+ACTIONS = {
+    'complete': (complete, no_params, 'completed'),
+    'incomplete': (incomplete, no_params, 'updated'),
+    'archive': (archive, no_params, 'updated'),
+    'unarchive': (unarchive, no_params, 'updated'),
+    'set_category': (set_category, category_param, 'updated'),
+    'set_priority': (set_priority, priority_param, 'updated'),
+    'shift_due': (shift_due, days_param, 'updated'),
+    'add_tags': (add_tags, tags_param, 'updated'),
+    'remove_tags': (remove_tags, tags_param, 'updated'),
+    'set_tags': (set_tags, tags_param, 'updated'),
+    'delete': (delete, no_params, 'deleted'),
+}
+
+def run(user, action, todo_ids, params=None, chunk_size=CHUNK_SIZE):
+    """
+    Apply action to the user's todos among todo_ids, chunk_size ids per
+    transaction, logging one activity per changed todo. A chunk that fails
+    is rolled back and reported without stopping the others. Returns counts
+    (requested, matched, affected, and rows deleted per model for delete)
+    with the ids that were not found or failed. Raises ValueError for an
+    unknown action, bad params or malformed ids.
+    """
+    if action not in ACTIONS:
+        raise ValueError(f"action must be one of {', '.join(ACTIONS)}")
+    function, validate, logged_action = ACTIONS[action]
+    params = validate(user, params or {})
+    try:
+        ids = list(dict.fromkeys(Todo._meta.pk.to_python(pk) for pk in todo_ids))
+    except (ValidationError, TypeError):
+        raise ValueError('Invalid todo id')
+    
+    result = {
+        'action': action, 'requested': len(ids), 'matched': 0, 'affected': 0,
+        'deleted': Counter(), 'not_found': [], 'failed': [],
+    }
+    for start in range(0, len(ids), chunk_size):
+        chunk = ids[start:start + chunk_size]
+        todos = Todo.objects.filter(user=user, pk__in=chunk)
+        deleted = result['deleted'].copy()
+        try:
+            with transaction.atomic(), rollups.batched(), sync.batched():
+                found = dict(todos.values_list('pk', 'category_id'))
+                rows = function(todos, params, result)
+                # Deleted todos log their own tombstones
+                if action != 'delete':
+                    sync.record_todos((pk for pk, _ in rows), user_id=user.pk)
+                categories = {found[pk] for pk, _ in rows} | {params.get('category')}
+                sync.record([user.pk], 'category', [pk for pk in categories if pk])
+        except DatabaseError:
+            logger.exception('Bulk %s failed for %d todos of user %s', action, len(chunk), user.pk)
+            result['deleted'] = deleted
+            result['failed'] += chunk
+            continue
+        
+        shared = list(Todo.shared_with.through.objects.filter(
+            todo_id__in=[pk for pk, _ in rows]
+        ).values_list('user_id', flat=True))
+        caching.bump_version(*shared)
+        # Deleted todos publish their own events
+        if rows and action != 'delete':
+            events.publish([user.pk, *shared], 'todos.bulk', action=action, ids=[pk for pk, _ in rows])
+        result['matched'] += len(found)
+        result['affected'] += len(rows)
+        result['not_found'] += [pk for pk in chunk if pk not in found]
+        activity.log_many([{
+            'user': user, 'action': logged_action,
+            # Deleted todos can only be referenced by title
+            'todo_id': None if action == 'delete' else pk,
+            'todo_title': title, 'details': {'bulk': action, **params}
+        } for pk, title in rows])
+    
+    caching.bump_version(user.pk)
+    result['deleted'] = dict(result['deleted'])
+    return result
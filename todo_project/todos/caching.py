@@ -0,0 +1,152 @@
+# todos/caching.py
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+# Settings, with defaults:
+#   TODO_CACHE_ALIAS        Django cache used as the shared tier ('default')
+#   TODO_CACHE_TIMEOUT      seconds a payload may be served (60)
+#   TODO_CACHE_LOCAL_SIZE   entries kept by the in-process LRU tier (256)
+DEFAULT_TIMEOUT = 60
+DEFAULT_LOCAL_SIZE = 256
+
+KEY_PREFIX = 'todos'
+
+# Seconds the time of each version is kept, longer than conditional.py
+# remembers an ETag, past which a Last-Modified would not be honoured anyway
+MODIFIED_TIMEOUT = 7 * 86400
+
+class LRUCache:
+    """Thread-safe in-process LRU with per-entry expiry, bounded to maxsize entries"""
+    
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+    
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return default
+            expires, value = entry
+            if expires <= time.monotonic():
+                del self.entries[key]
+                return default
+            self.entries.move_to_end(key)
+            return value
+    
+    def set(self, key, value, timeout):
+        if self.maxsize <= 0 or timeout <= 0:
+            return
+        with self.lock:
+            self.entries[key] = (time.monotonic() + timeout, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+    
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+local_cache = LRUCache(getattr(settings, 'TODO_CACHE_LOCAL_SIZE', DEFAULT_LOCAL_SIZE))
+
+def shared_cache():
+    return caches[getattr(settings, 'TODO_CACHE_ALIAS', 'default')]
+
+def version_key(user_id):
+    return f'{KEY_PREFIX}:version:{user_id}'
+
+def modified_key(user_id, version):
+    return f'{KEY_PREFIX}:modified:{user_id}:{version}'
+
+def new_version():
+    # Time based, so a version key lost to eviction never restarts at a
+    # number that old payload keys were stored under
+    return time.time_ns()
+
+def get_version(user_id):
+    """Current data version of a user, read from the shared tier"""
+    cache = shared_cache()
+    key = version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        seed(cache, user_id)
+        version = cache.get(key)
+    # A backend that stores nothing (DummyCache) gets a fresh version each time
+    return version if version is not None else new_version()
+
+def seed(cache, user_id):
+    """Start a missing version key; False if another process got there first"""
+    version = new_version()
+    if not cache.add(version_key(user_id), version, None):
+        return False
+    cache.set(modified_key(user_id, version), time.time(), MODIFIED_TIMEOUT)
+    return True
+
+def version_time(user_id, version):
+    """
+    Aware datetime the user's data changed to version; now when that was
+    not recorded, which only costs a client a full response
+    """
+    modified = shared_cache().get(modified_key(user_id, version))
+    return datetime.fromtimestamp(modified if modified is not None else time.time(), tz=dt_timezone.utc)
+
+def _bump(user_id):
+    cache = shared_cache()
+    if seed(cache, user_id):
+        return
+    try:
+        version = cache.incr(version_key(user_id))
+    except ValueError:
+        # Evicted since add(); seeding a new one invalidates just the same
+        seed(cache, user_id)
+        return
+    cache.set(modified_key(user_id, version), time.time(), MODIFIED_TIMEOUT)
+
+def bump_version(*user_ids):
+    """
+    Invalidate every cached payload of the given users. The bump runs once
+    the current transaction commits, so no reader can cache the old rows
+    under the new version.
+    """
+    for user_id in set(user_ids):
+        if user_id is not None:
+            transaction.on_commit(lambda user_id=user_id: _bump(user_id))
+
+def payload_key(user_id, version, name, params):
+    digest = hashlib.md5(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()
+    return f'{KEY_PREFIX}:{name}:{user_id}:{version}:{digest}'
+
+def cached(user_id, name, params, compute):
+    """
+    Payload for (name, params) at the user's current data version, from the
+    in-process LRU, then the shared cache, then compute(). A hit costs one
+    shared cache read for the version; entries also expire after
+    TODO_CACHE_TIMEOUT for data that changes with the clock (e.g. overdue).
+    """
+    key = payload_key(user_id, get_version(user_id), name, params)
+    timeout = getattr(settings, 'TODO_CACHE_TIMEOUT', DEFAULT_TIMEOUT)
+    
+    payload = local_cache.get(key)
+    if payload is not None:
+        return payload
+    
+    # The shared tier stores the expiry with the payload, so a copy pulled
+    # into the local tier lives no longer than the original
+    cache = shared_cache()
+    entry = cache.get(key)
+    if entry is None:
+        entry = (time.time() + timeout, compute())
+        cache.set(key, entry, timeout)
+    expires, payload = entry
+    local_cache.set(key, payload, expires - time.time())
+    return payload
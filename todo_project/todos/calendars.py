@@ -0,0 +1,76 @@
+# todos/calendars.py
+
+from collections import defaultdict
+
+from django.utils import timezone
+
+from . import recurrence
+from .models import Category, Todo
+
+# Calendar views. calendar_days() fills a calendar's range in a fixed number
+# of queries: the visible todos due in [start, end), found with a plain
+# range on due_date that the (user, due_date) index covers (a __date lookup
+# wraps the column in a function and scans), the series whose computed
+# occurrences fall in the range (todos/recurrence.py), and the categories
+# they use. Todos come back grouped by local day with only what a calendar
+# cell shows, read with values() rather than as models.
+
+# Longest range one request covers, in days
+MAX_DAYS = 92
+
+CELL_FIELDS = ('id', 'title', 'due_date', 'priority', 'completed', 'category_id', 'is_recurring')
+
+# What expand() reads of a series
+SERIES_FIELDS = (
+    'id', 'title', 'due_date', 'priority', 'category_id', 'reminder_date',
+    'is_recurring', 'recurrence_pattern', 'recurrence_end_date',
+)
+
+def cell(todo_id, title, due_date, priority, completed, category_id, recurring, occurrence=False):
+    return {
+        'id': str(todo_id),
+        'title': title,
+        'time': due_date.strftime('%H:%M'),
+        'priority': priority,
+        'completed': completed,
+        'category': str(category_id) if category_id else None,
+        'recurring': recurring,
+        # Computed from a recurring todo rather than stored; id is the series'
+        'occurrence': occurrence,
+    }
+
+def calendar_days(user, start, end, tz):
+    """
+    The todos visible to user due in [start, end) and the occurrences of
+    their series, as {'days': {local date: [cells by time]}, 'categories'}
+    """
+    todos = Todo.objects.visible_to(user).filter(is_archived=False)
+    days = defaultdict(list)
+    category_ids = set()
+    
+    due = todos.filter(due_date__gte=start, due_date__lt=end).order_by('due_date', 'pk').values_list(*CELL_FIELDS)
+    for todo_id, title, due_date, priority, completed, category_id, recurring in due:
+        local = timezone.localtime(due_date, tz)
+        days[local.date().isoformat()].append(cell(todo_id, title, local, priority, completed, category_id, recurring))
+        category_ids.add(category_id)
+    
+    for item in recurrence.expand(todos.only(*SERIES_FIELDS), start, end):
+        todo, local = item.todo, timezone.localtime(item.due_date, tz)
+        days[local.date().isoformat()].append(
+            cell(todo.pk, todo.title, local, todo.priority, False, todo.category_id, True, occurrence=True)
+        )
+        category_ids.add(todo.category_id)
+    
+    for cells in days.values():
+        cells.sort(key=lambda entry: entry['time'])
+    categories = Category.objects.filter(pk__in=category_ids - {None}).values('id', 'name', 'color', 'icon')
+    return {
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'tz': str(tz),
+        'days': dict(sorted(days.items())),
+        'categories': {
+            str(category['id']): {'name': category['name'], 'color': category['color'], 'icon': category['icon']}
+            for category in categories
+        },
+    }
@@ -0,0 +1,24 @@
+# todos/checks.py
+
+from django.conf import settings
+from django.core.checks import Warning, register
+
+# Backends that keep entries in one process, or none at all
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+@register()
+def check_shared_cache(app_configs, **kwargs):
+    """The cache holding data versions must be shared by all workers"""
+    alias = getattr(settings, 'TODO_CACHE_ALIAS', 'default')
+    backend = settings.CACHES.get(alias, {}).get('BACKEND')
+    if backend not in PROCESS_LOCAL_CACHES:
+        return []
+    return [Warning(
+        f"The '{alias}' cache ({backend}) is not shared between processes",
+        hint="Each worker would keep its own data versions and serve stale payloads and ETags; "
+             "configure DatabaseCache, Redis or Memcached (TODO_CACHE_ALIAS names the cache).",
+        id='todos.W001',
+    )]
@@ -0,0 +1,140 @@
+# todos/conditional.py
+
+import functools
+import hashlib
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.utils.dateparse import parse_datetime
+from django.utils.http import http_date, parse_http_date_safe, parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from . import caching
+
+# Conditional GET. A response's validator is derived from the user's data
+# version (see caching.py) and the URL, and its Last-Modified from the
+# version's time. Some payloads also change with the clock (overdue flags,
+# statistics windows), so each rendering records until when it is valid
+# and its strong ETag covers that deadline too. A request whose
+# If-None-Match names a still valid ETag of the current version is answered
+# 304 without running the view.
+
+# Seconds an issued ETag is remembered (TODO_ETAG_TIMEOUT)
+DEFAULT_ETAG_TIMEOUT = 86400
+
+def digest(*parts):
+    return hashlib.sha1(':'.join(str(part) for part in parts).encode()).hexdigest()
+
+def etag_key(etag):
+    return f'{caching.KEY_PREFIX}:etag:{digest(etag)}'
+
+def base_key(base):
+    return f'{caching.KEY_PREFIX}:etag-base:{base}'
+
+def expired(valid_until):
+    return valid_until != 0 and time.time() >= valid_until
+
+def remember(base, valid_until):
+    """ETag for a fresh rendering of base valid until the datetime valid_until (None: until the data changes)"""
+    timeout = getattr(settings, 'TODO_ETAG_TIMEOUT', DEFAULT_ETAG_TIMEOUT)
+    deadline = 0
+    if valid_until is not None:
+        deadline = valid_until.timestamp()
+        timeout = max(1, min(timeout, int(deadline - time.time()) + 1))
+    etag = f'"{digest(base, deadline)}"'
+    caching.shared_cache().set_many({etag_key(etag): (base, deadline), base_key(base): deadline}, timeout)
+    return etag
+
+def current_etag(request, base, last_modified):
+    """The client's ETag if its copy is current, True if only its date is, else None"""
+    cache = caching.shared_cache()
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match:
+        for etag in parse_etags(if_none_match):
+            entry = cache.get(etag_key(etag))
+            if entry is not None and entry[0] == base and not expired(entry[1]):
+                return etag
+        return None
+    
+    if_modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+    if if_modified_since is not None and int(last_modified.timestamp()) <= if_modified_since:
+        deadline = cache.get(base_key(base))
+        if deadline is not None and not expired(deadline):
+            return True
+    return None
+
+def conditional(request, respond, valid_until=None):
+    """
+    respond() unless the client's copy of this URL is current, in which
+    case a bodiless 304. valid_until(response) may return the datetime the
+    payload goes stale regardless of data changes.
+    """
+    if request.method not in ('GET', 'HEAD') or not request.user.is_authenticated:
+        return respond()
+    
+    version = caching.get_version(request.user.pk)
+    base = digest(request.user.pk, version, request.get_full_path())
+    last_modified = caching.version_time(request.user.pk, version)
+    
+    etag = current_etag(request, base, last_modified)
+    if etag:
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = respond()
+        if response.status_code != status.HTTP_200_OK:
+            return response
+        etag = remember(base, valid_until(response) if valid_until else None)
+    
+    if etag is not True:
+        response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified.timestamp())
+    # Let clients keep a copy but always revalidate it
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+def conditional_get(valid_for=None):
+    """
+    Decorator for function views (innermost, below @api_view), optionally
+    treating the payload as stale after valid_for seconds
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            expires = None
+            if valid_for is not None:
+                expires = lambda response: timezone.now() + timedelta(seconds=valid_for)
+            return conditional(request, lambda: view(request, *args, **kwargs), expires)
+        return wrapper
+    return decorator
+
+class ConditionalGetMixin:
+    """Conditional GET for a ViewSet's list and retrieve actions"""
+    
+    def conditional_valid_until(self, response):
+        """Datetime the payload goes stale on its own, or None"""
+        return None
+    
+    def list(self, request, *args, **kwargs):
+        return conditional(request, lambda: super(ConditionalGetMixin, self).list(request, *args, **kwargs),
+                           self.conditional_valid_until)
+    
+    def retrieve(self, request, *args, **kwargs):
+        return conditional(request, lambda: super(ConditionalGetMixin, self).retrieve(request, *args, **kwargs),
+                           self.conditional_valid_until)
+
+def next_overdue(todos, now=None):
+    """Earliest future due date among the open serialized todos (and their subtasks)"""
+    now = now or timezone.now()
+    earliest = None
+    for todo in todos:
+        due_date = parse_datetime(todo['due_date']) if todo.get('due_date') else None
+        if due_date and not todo.get('completed') and due_date > now:
+            earliest = min(earliest or due_date, due_date)
+        nested = next_overdue(todo.get('subtasks') or [], now)
+        if nested:
+            earliest = min(earliest or nested, nested)
+    return earliest
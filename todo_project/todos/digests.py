@@ -0,0 +1,171 @@
+# todos/digests.py
+
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import Count, F, Q, Sum, Window
+from django.db.models.functions import RowNumber
+from django.template.loader import get_template
+from django.utils import timezone
+
+from .models import DailyStats, DigestRun, Todo, User, UserPreferences
+
+# Summary digests. send_digests() mails the daily or weekly summary to every
+# user who opted in, a chunk of users at a time in id order. A chunk's
+# summaries come from a few grouped queries over the whole chunk: the
+# DailyStats rollup for what was created and completed, one aggregate for
+# the open and overdue counts and one windowed query for each user's next
+# due todos. They are rendered with one compiled template and mailed over
+# one connection kept open for the run. The last user of each mailed chunk
+# is recorded in the day's DigestRun, so an interrupted run resumes after
+# it, repeating at most the chunk that was in flight.
+
+# Users summarized and mailed together (TODO_DIGEST_CHUNK_SIZE)
+DEFAULT_CHUNK_SIZE = 1000
+
+# Day of the week weekly digests go out on, Monday being 0 (TODO_DIGEST_WEEKDAY)
+DEFAULT_WEEKDAY = 0
+
+# Due todos listed in a digest (TODO_DIGEST_ITEMS)
+DEFAULT_ITEMS = 5
+
+TEMPLATE = 'emails/digest.txt'
+
+# Kind -> (UserPreferences field opting in, days summarized)
+KINDS = {
+    'daily': ('email_daily_summary', 1),
+    'weekly': ('email_weekly_summary', 7),
+}
+
+def setting(name, default):
+    return getattr(settings, name, default)
+
+def start_of(day):
+    """Aware midnight starting a local day"""
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+def recipients(kind):
+    """Active users with an email address who get kind digests"""
+    field = KINDS[kind][0]
+    opted_in = Q(**{f'preferences__{field}': True})
+    if UserPreferences._meta.get_field(field).default:
+        # Users without preferences have the defaults
+        opted_in |= Q(preferences__isnull=True)
+    return User.objects.filter(opted_in, is_active=True, notification_enabled=True).exclude(email='')
+
+def summarize(user_ids, kind, today, now=None):
+    """
+    {user id: summary} of the days before today and the todos due in as
+    many days from today, for all of user_ids in three queries
+    """
+    now = now or timezone.now()
+    days = KINDS[kind][1]
+    horizon = start_of(today + timedelta(days=days))
+    items = setting('TODO_DIGEST_ITEMS', DEFAULT_ITEMS)
+    summaries = {
+        user_id: {'created': 0, 'completed': 0, 'open': 0, 'overdue': 0, 'due': 0, 'upcoming': []}
+        for user_id in user_ids
+    }
+    
+    history = DailyStats.objects.filter(
+        user_id__in=user_ids, date__gte=today - timedelta(days=days), date__lt=today
+    ).values('user_id').annotate(created=Sum('created'), completed=Sum('completed')).order_by()
+    for row in history:
+        summaries[row['user_id']].update(created=row['created'], completed=row['completed'])
+    
+    open_todos = Todo.objects.filter(user_id__in=user_ids, completed=False, is_archived=False)
+    counts = open_todos.values('user_id').annotate(
+        open=Count('pk'),
+        overdue=Count('pk', filter=Q(due_date__lt=now)),
+        due=Count('pk', filter=Q(due_date__lt=horizon)),
+    ).order_by()
+    for row in counts:
+        summaries[row['user_id']].update(open=row['open'], overdue=row['overdue'], due=row['due'])
+    
+    # The first few due of each user, ranked within the user
+    upcoming = open_todos.filter(due_date__lt=horizon).annotate(
+        rank=Window(RowNumber(), partition_by=F('user_id'), order_by=[F('due_date').asc(), F('pk').asc()])
+    ).filter(rank__lte=items).order_by('user_id', 'due_date', 'pk').values('user_id', 'title', 'due_date')
+    for row in upcoming:
+        summaries[row['user_id']]['upcoming'].append({
+            'title': row['title'],
+            'overdue': row['due_date'] < now,
+            # Formatted here rather than by the template's date filter, which
+            # costs more than the rest of the rendering
+            'when': timezone.localtime(row['due_date']).strftime('%a %d %b %H:%M'),
+        })
+    return summaries
+
+def describe_period(kind, today):
+    """The days before today a digest covers, for its text"""
+    days = KINDS[kind][1]
+    first_day, last_day = today - timedelta(days=days), today - timedelta(days=1)
+    if first_day == last_day:
+        return first_day.strftime('%A %d %B')
+    return f"{first_day.strftime('%d %B')} to {last_day.strftime('%d %B')}"
+
+def build_message(user, summary, kind, period, template):
+    """The digest email for one user, or None when there is nothing to tell"""
+    if not (summary['open'] or summary['created'] or summary['completed']):
+        return None
+    body = template.render({
+        **summary,
+        'name': user.get_full_name() or user.username,
+        'kind': kind,
+        'period': period,
+        'more': summary['due'] - len(summary['upcoming']),
+    })
+    return EmailMessage(
+        subject=f"Your {kind} todo summary",
+        body=body,
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[user.email],
+    )
+
+def send_digests(kind, today=None, chunk_size=None, now=None):
+    """
+    Mail kind digests for today to every user who opted in, resuming the
+    day's run where it stopped; returns its DigestRun. A failure to send
+    is raised after the chunks before it are recorded.
+    """
+    if kind not in KINDS:
+        raise ValueError(f"kind must be one of {', '.join(KINDS)}")
+    now = now or timezone.now()
+    today = today or timezone.localdate(now)
+    chunk_size = chunk_size or setting('TODO_DIGEST_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+    run, _ = DigestRun.objects.get_or_create(kind=kind, date=today)
+    if run.finished_at:
+        return run
+    
+    template = get_template(TEMPLATE)
+    period = describe_period(kind, today)
+    users = recipients(kind).order_by('pk').only('pk', 'username', 'email', 'first_name', 'last_name')
+    connection = None
+    try:
+        while chunk := list(users.filter(pk__gt=run.last_user_id)[:chunk_size]):
+            summaries = summarize([user.pk for user in chunk], kind, today, now)
+            messages = [
+                message for message in (
+                    build_message(user, summaries[user.pk], kind, period, template) for user in chunk
+                ) if message is not None
+            ]
+            if messages:
+                if connection is None:
+                    connection = get_connection()
+                    connection.open()
+                run.sent += connection.send_messages(messages) or 0
+            run.last_user_id = chunk[-1].pk
+            run.save(update_fields=['last_user_id', 'sent'])
+        run.finished_at = timezone.now()
+        run.save(update_fields=['finished_at'])
+    finally:
+        if connection is not None:
+            connection.close()
+    return run
+
+def due_kinds(today):
+    """Kinds of digest sent on a day: daily ones, and weekly ones on TODO_DIGEST_WEEKDAY"""
+    if today.weekday() == setting('TODO_DIGEST_WEEKDAY', DEFAULT_WEEKDAY):
+        return ['daily', 'weekly']
+    return ['daily']
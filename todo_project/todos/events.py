@@ -0,0 +1,134 @@
+# todos/events.py
+
+import asyncio
+import json
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+# Push events over server-sent events. Changes publish {type, payload}
+# events to a broker once their transaction commits; every open stream is a
+# subscription with a bounded queue on its event loop. A consumer too slow
+# to keep up loses its backlog and gets a single resync event instead, so
+# it reloads through delta sync rather than holding memory on the server.
+
+# Events a subscriber may have pending (TODO_EVENTS_QUEUE_SIZE)
+DEFAULT_QUEUE_SIZE = 100
+
+# Seconds between keepalive comments (TODO_EVENTS_HEARTBEAT)
+DEFAULT_HEARTBEAT = 15
+
+# Seconds a stream stays open before the client reconnects (TODO_EVENTS_STREAM_LIFETIME)
+DEFAULT_STREAM_LIFETIME = 300
+
+# Broker class (TODO_EVENTS_BROKER)
+DEFAULT_BROKER = 'todos.events.LocalBroker'
+
+RESYNC = {'type': 'resync', 'payload': {}}
+
+class Subscription:
+    """One stream's bounded queue of events, fed from any thread"""
+    
+    def __init__(self, broker, user_id, maxsize):
+        self.broker = broker
+        self.user_id = user_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize)
+    
+    def deliver(self, event):
+        """Queue event; runs on the subscription's loop"""
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+    
+    async def get(self, timeout):
+        """Next event, or None after timeout seconds"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+    
+    def close(self):
+        self.broker.unsubscribe(self)
+
+class LocalBroker:
+    """In-process pub/sub: events reach the streams served by this process only"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers = defaultdict(set)
+    
+    def subscribe(self, user_id, maxsize):
+        subscription = Subscription(self, user_id, maxsize)
+        with self.lock:
+            self.subscribers[user_id].add(subscription)
+        return subscription
+    
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscribers = self.subscribers.get(subscription.user_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self.subscribers[subscription.user_id]
+    
+    def publish(self, user_ids, event):
+        with self.lock:
+            subscriptions = [
+                subscription for user_id in user_ids
+                for subscription in self.subscribers.get(user_id, ())
+            ]
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, event)
+            except RuntimeError:
+                # Its event loop is gone
+                self.unsubscribe(subscription)
+
+_broker = None
+_broker_lock = threading.Lock()
+
+def broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = import_string(getattr(settings, 'TODO_EVENTS_BROKER', DEFAULT_BROKER))()
+        return _broker
+
+def publish(user_ids, type, **payload):
+    """Send a {type, payload} event to each of user_ids once the current transaction commits"""
+    user_ids = {user_id for user_id in user_ids if user_id is not None}
+    if not user_ids:
+        return
+    event = {'type': type, 'payload': payload}
+    transaction.on_commit(lambda: broker().publish(user_ids, event))
+
+# Streaming
+
+def format_event(event):
+    return f'data: {json.dumps(event, cls=DjangoJSONEncoder)}\n\n'
+
+def subscribe(user_id):
+    return broker().subscribe(user_id, getattr(settings, 'TODO_EVENTS_QUEUE_SIZE', DEFAULT_QUEUE_SIZE))
+
+async def stream(subscription):
+    """Server-sent events for subscription until the stream lifetime runs out"""
+    heartbeat = getattr(settings, 'TODO_EVENTS_HEARTBEAT', DEFAULT_HEARTBEAT)
+    lifetime = getattr(settings, 'TODO_EVENTS_STREAM_LIFETIME', DEFAULT_STREAM_LIFETIME)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + lifetime
+    try:
+        # Reconnect delay for EventSource, in milliseconds
+        yield 'retry: 3000\n\n'
+        while (remaining := deadline - loop.time()) > 0:
+            event = await subscription.get(min(heartbeat, remaining))
+            yield ': keepalive\n\n' if event is None else format_event(event)
+    finally:
+        subscription.close()
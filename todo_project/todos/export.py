@@ -0,0 +1,160 @@
+# todos/export.py
+
+import csv
+import json
+import zlib
+from itertools import islice
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from .models import Category, Todo, TodoComment
+
+# Streaming export. Todos are read with a chunked iterator in tree order
+# (parents before their subtasks) and encoded chunk by chunk, so memory
+# stays flat however many todos a user has and the response starts before
+# the query finishes. Comments are fetched per chunk of todos.
+
+# Todos per fetch and per encoded chunk
+CHUNK_SIZE = 2000
+
+INCLUDES = ('comments', 'subtasks', 'categories')
+
+TODO_FIELDS = (
+    'id', 'parent_todo_id', 'title', 'description', 'category_id', 'priority',
+    'due_date', 'completed', 'completed_at', 'created_at', 'updated_at',
+    'is_pinned', 'is_archived', 'position', 'tags', 'estimated_minutes',
+    'actual_minutes', 'is_recurring', 'recurrence_pattern', 'recurrence_end_date',
+    'reminder_date',
+)
+CATEGORY_FIELDS = ('id', 'name', 'color', 'icon', 'created_at')
+COMMENT_FIELDS = ('id', 'todo_id', 'user__username', 'comment', 'created_at', 'updated_at')
+
+# Renderers only select ?format=; the export itself bypasses rendering
+class NDJSONRenderer(JSONRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+class CSVRenderer(JSONRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+RENDERERS = [JSONRenderer, NDJSONRenderer, CSVRenderer]
+
+def parse_include(value):
+    """Set of optional sections from ?include=a,b; raises ValueError"""
+    include = {part.strip() for part in (value or '').split(',') if part.strip()}
+    unknown = include - set(INCLUDES)
+    if unknown:
+        raise ValueError(f"include must be among {', '.join(INCLUDES)}")
+    return include
+
+# Records
+
+def todo_record(row, category_names):
+    record = {**row}
+    record['parent_todo'] = record.pop('parent_todo_id')
+    record['category'] = record.pop('category_id')
+    record['category_name'] = category_names.get(record['category'])
+    return record
+
+def comment_record(row):
+    record = {**row}
+    record['user'] = record.pop('user__username')
+    del record['todo_id']
+    return record
+
+def category_records(user):
+    return Category.objects.filter(user=user).order_by('name').values(*CATEGORY_FIELDS)
+
+def todo_chunks(user, include, chunk_size=None):
+    """Lists of todo records, chunk_size at a time, with comments if included"""
+    chunk_size = chunk_size or CHUNK_SIZE
+    category_names = dict(Category.objects.filter(user=user).values_list('pk', 'name'))
+    todos = Todo.objects.filter(user=user)
+    if 'subtasks' not in include:
+        todos = todos.filter(parent_todo__isnull=True)
+    rows = todos.order_by('path').values(*TODO_FIELDS).iterator(chunk_size=chunk_size)
+    
+    while chunk := [todo_record(row, category_names) for row in islice(rows, chunk_size)]:
+        if 'comments' in include:
+            comments = {record['id']: [] for record in chunk}
+            for row in TodoComment.objects.filter(todo_id__in=comments).order_by('created_at').values(*COMMENT_FIELDS):
+                comments[row['todo_id']].append(comment_record(row))
+            for record in chunk:
+                record['comments'] = comments[record['id']]
+        yield chunk
+
+# Encoders: each yields text pieces, one per chunk of todos
+
+def dumps(value):
+    return json.dumps(value, cls=DjangoJSONEncoder)
+
+def encode_json(user, include, chunk_size=None):
+    yield '{"exported_at": %s' % dumps(timezone.now())
+    if 'categories' in include:
+        yield ', "categories": [%s]' % ', '.join(dumps(record) for record in category_records(user))
+    yield ', "todos": ['
+    separator = ''
+    for chunk in todo_chunks(user, include, chunk_size):
+        yield separator + ',\n'.join(dumps(record) for record in chunk)
+        separator = ',\n'
+    yield ']}\n'
+
+def encode_ndjson(user, include, chunk_size=None):
+    if 'categories' in include:
+        yield ''.join(dumps({'type': 'category', **record}) + '\n' for record in category_records(user))
+    for chunk in todo_chunks(user, include, chunk_size):
+        yield ''.join(dumps({'type': 'todo', **record}) + '\n' for record in chunk)
+
+class Echo:
+    """File-like object whose write() hands back what csv.writer wrote"""
+    
+    def write(self, value):
+        return value
+
+def csv_cell(value):
+    if isinstance(value, (list, dict)):
+        return dumps(value)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return '' if value is None else value
+
+def encode_csv(user, include, chunk_size=None):
+    """One row per todo; categories appear by name and comments as a JSON column"""
+    writer = csv.writer(Echo())
+    columns = list(todo_record(dict.fromkeys(TODO_FIELDS), {}))
+    if 'comments' in include:
+        columns.append('comments')
+    yield writer.writerow(columns)
+    for chunk in todo_chunks(user, include, chunk_size):
+        yield ''.join(writer.writerow([csv_cell(record[column]) for column in columns]) for record in chunk)
+
+ENCODERS = {
+    'json': (encode_json, 'application/json'),
+    'ndjson': (encode_ndjson, 'application/x-ndjson'),
+    'csv': (encode_csv, 'text/csv'),
+}
+
+def gzipped(pieces):
+    """Gzip text pieces as they come, flushing each so the client gets them right away"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for piece in pieces:
+        yield compressor.compress(piece.encode()) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+def export_response(user, format, include=(), compress=False):
+    """A streaming download of the user's todos in format (json, ndjson or csv)"""
+    encode, content_type = ENCODERS[format]
+    pieces = encode(user, set(include))
+    filename = f"todos_{timezone.localdate().isoformat()}.{format}"
+    if compress:
+        response = StreamingHttpResponse(gzipped(pieces), content_type='application/gzip')
+        filename += '.gz'
+    else:
+        response = StreamingHttpResponse((piece.encode() for piece in pieces), content_type=f'{content_type}; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response['Cache-Control'] = 'no-store'
+    return response
@@ -0,0 +1,413 @@
+# todos/imports.py
+
+import csv
+import gzip
+import io
+import json
+import logging
+from datetime import datetime
+
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from . import activity, caching, events, ordering, rollups, search, sync
+from .models import PATH_SEP, Category, Todo
+from .tags import sync_tags_bulk
+
+logger = logging.getLogger(__name__)
+
+# Streaming import. The upload is parsed a record at a time (JSON through
+# an incremental array reader), validated and written BATCH_SIZE rows per
+# transaction with bulk_create, with the derived data (search, tags, stats
+# rollup, sync log) updated per batch instead of per row by signals.
+# Accepts what the export produces, plus plain arrays, NDJSON and CSV from
+# other tools.
+
+# Rows validated and written per transaction
+BATCH_SIZE = 1000
+
+# Row errors listed in the report; the rest are only counted
+ERROR_LIMIT = 100
+
+# Characters read from the upload at a time
+BLOCK_SIZE = 65536
+
+# Longest single JSON value accepted, so a malformed file cannot be buffered whole
+MAX_VALUE_SIZE = 1024 * 1024
+
+FORMATS = {'.json': 'json', '.ndjson': 'ndjson', '.jsonl': 'ndjson', '.csv': 'csv'}
+
+# Todo fields taken from each record, validated by the model fields
+FIELDS = (
+    'title', 'description', 'priority', 'due_date', 'completed', 'completed_at',
+    'is_pinned', 'is_archived', 'tags', 'estimated_minutes', 'actual_minutes',
+    'is_recurring', 'recurrence_pattern', 'recurrence_end_date', 'reminder_date',
+)
+
+class ImportFileError(ValueError):
+    """The upload as a whole cannot be read"""
+
+# Readers: each yields (row number, section, record) where section is
+# 'categories' or 'todos', and record a dict or the ValueError for a row
+# that could not be parsed
+
+class JSONStream:
+    """Incremental reader for the arrays of a JSON document in a text stream"""
+    
+    def __init__(self, stream, block_size=BLOCK_SIZE):
+        self.stream = stream
+        self.block_size = block_size
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+    
+    def fill(self):
+        """Append the next block to the unread part of the buffer; False at the end"""
+        if self.eof:
+            return False
+        block = self.stream.read(self.block_size)
+        if not block:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + block
+        self.pos = 0
+        return True
+    
+    def peek(self):
+        """Next non-whitespace character, or '' at the end"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ''
+    
+    def expect(self, chars):
+        char = self.peek()
+        if not char or char not in chars:
+            raise ImportFileError(f"Invalid JSON: expected {' or '.join(repr(c) for c in chars)}")
+        self.pos += 1
+        return char
+    
+    def value(self):
+        """Decode the next complete value"""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError as e:
+                if len(self.buffer) - self.pos > MAX_VALUE_SIZE or not self.fill():
+                    raise ImportFileError(f'Invalid JSON: {e.msg}')
+                continue
+            # A number at the end of the buffer may go on in the next block
+            if end == len(self.buffer) and self.fill():
+                continue
+            self.pos = end
+            return value
+    
+    def array(self):
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.expect(',]') == ']':
+                return
+    
+    def items(self):
+        """(section, item) for a top-level array of todos or an export document"""
+        if self.peek() == '[':
+            for item in self.array():
+                yield 'todos', item
+            return
+        self.expect('{')
+        if self.peek() == '}':
+            return
+        while True:
+            key = self.value()
+            self.expect(':')
+            if key in ('categories', 'todos') and self.peek() == '[':
+                for item in self.array():
+                    yield key, item
+            else:
+                self.value()
+            if self.expect(',}') == '}':
+                return
+
+def read_json(stream):
+    for number, (section, item) in enumerate(JSONStream(stream).items(), 1):
+        yield number, section, item if isinstance(item, dict) else ValueError('Not an object')
+
+def read_ndjson(stream):
+    for number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield number, 'todos', ValueError('Invalid JSON')
+            continue
+        if not isinstance(record, dict):
+            yield number, 'todos', ValueError('Not an object')
+            continue
+        section = 'categories' if record.get('type') == 'category' else 'todos'
+        yield number, section, record
+
+def csv_value(column, value):
+    if value == '':
+        return None
+    # List columns hold JSON as exported, or comma separated tags from elsewhere
+    if column in ('tags', 'comments'):
+        try:
+            return json.loads(value)
+        except ValueError:
+            return [part.strip() for part in value.split(',') if part.strip()]
+    return value
+
+def read_csv(stream):
+    reader = csv.DictReader(stream)
+    if reader.fieldnames is None:
+        return
+    for row in reader:
+        # Header is line 1
+        yield reader.line_num, 'todos', {column: csv_value(column, value) for column, value in row.items() if column}
+
+READERS = {'json': read_json, 'ndjson': read_ndjson, 'csv': read_csv}
+
+def detect_format(filename, format=None):
+    """Format named explicitly or by the file's extension (ignoring .gz); raises ImportFileError"""
+    if format:
+        if format not in READERS:
+            raise ImportFileError(f"format must be one of {', '.join(READERS)}")
+        return format
+    name = filename.lower().removesuffix('.gz')
+    for extension, format in FORMATS.items():
+        if name.endswith(extension):
+            return format
+    raise ImportFileError('Cannot tell the file format, pass format=json|ndjson|csv')
+
+def open_text(upload):
+    """Text stream of an upload, decompressed when it starts with the gzip magic number"""
+    upload.seek(0)
+    raw = upload.file
+    compressed = raw.read(2) == b'\x1f\x8b'
+    raw.seek(0)
+    if compressed:
+        raw = gzip.GzipFile(fileobj=raw)
+    return io.TextIOWrapper(raw, encoding='utf-8-sig', newline='')
+
+# Validation
+
+def clean_todo(record):
+    """Todo field values of a record; raises ValueError naming the bad field"""
+    values = {}
+    for name in FIELDS:
+        value = record.get(name)
+        if value is None or value == '':
+            continue
+        if name == 'tags':
+            if isinstance(value, str):
+                value = [part.strip() for part in value.split(',') if part.strip()]
+            if not isinstance(value, list) or not all(isinstance(tag, str) for tag in value):
+                raise ValueError('tags: must be a list of names')
+        try:
+            value = Todo._meta.get_field(name).clean(value, None)
+        except ValidationError as e:
+            raise ValueError(f"{name}: {' '.join(e.messages)}")
+        if isinstance(value, datetime) and timezone.is_naive(value):
+            value = timezone.make_aware(value)
+        values[name] = value
+    if not values.get('title'):
+        raise ValueError('title: This field is required.')
+    
+    if values.get('completed'):
+        values.setdefault('completed_at', timezone.now())
+    else:
+        values['completed_at'] = None
+    return values
+
+def category_name(record):
+    """Category a todo record names, ignoring ids from another account"""
+    name = record.get('category_name') or record.get('category')
+    if not isinstance(name, str) or not name.strip():
+        return None
+    try:
+        Category._meta.pk.to_python(name)
+        # An exported id without its name: not resolvable here
+        return record.get('category_name')
+    except ValidationError:
+        return name.strip()
+
+class CategoryCache:
+    """Category ids by name for one import, creating missing ones unless dry_run"""
+    
+    def __init__(self, user, dry_run=False):
+        self.user = user
+        self.dry_run = dry_run
+        self.ids = {}
+        self.created = []
+    
+    def resolve(self, categories):
+        """Resolve {name: defaults} in one query, creating the missing ones"""
+        missing = [name for name in categories if name not in self.ids]
+        if not missing:
+            return
+        self.ids.update(Category.objects.filter(user=self.user, name__in=missing).values_list('name', 'pk'))
+        for name in missing:
+            if name in self.ids:
+                continue
+            self.created.append(name)
+            if self.dry_run:
+                self.ids[name] = None
+            else:
+                self.ids[name] = Category.objects.create(user=self.user, name=name, **categories[name]).pk
+
+def category_defaults(record):
+    defaults = {}
+    for field in ('color', 'icon'):
+        value = record.get(field)
+        if isinstance(value, str) and value and len(value) <= Category._meta.get_field(field).max_length:
+            defaults[field] = value
+    return defaults
+
+# Import
+
+class Importer:
+    """One import run for a user; feed() rows, then finish() for the report"""
+    
+    def __init__(self, user, dry_run=False, batch_size=BATCH_SIZE):
+        self.user = user
+        self.dry_run = dry_run
+        self.batch_size = batch_size
+        self.categories = CategoryCache(user, dry_run)
+        # Record id -> (pk, path, depth) of imported todos, for subtasks
+        self.parents = {}
+        self.batch = []
+        self.position = (Todo.objects.filter(user=user).aggregate(last=Max('position'))['last'] or 0) + ordering.GAP
+        self.report = {
+            'dry_run': dry_run, 'rows': 0, 'valid': 0, 'created': 0, 'failed': 0,
+            'errors': [], 'categories_created': self.categories.created,
+        }
+    
+    def error(self, number, message):
+        self.report['failed'] += 1
+        if len(self.report['errors']) < ERROR_LIMIT:
+            self.report['errors'].append({'row': number, 'error': str(message)})
+    
+    def feed(self, number, section, record):
+        if section == 'categories':
+            name = record.get('name') if isinstance(record, dict) else None
+            if isinstance(name, str) and name.strip():
+                self.categories.resolve({name.strip()[:50]: category_defaults(record)})
+            return
+        self.report['rows'] += 1
+        if isinstance(record, Exception):
+            self.error(number, record)
+            return
+        self.batch.append((number, record))
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+    
+    def flush(self):
+        batch, self.batch = self.batch, []
+        cleaned = []
+        for number, record in batch:
+            try:
+                values = clean_todo(record)
+            except ValueError as e:
+                self.error(number, e)
+                continue
+            name = category_name(record)
+            if name is not None and len(name) > Category._meta.get_field('name').max_length:
+                self.error(number, 'category: name is too long')
+                continue
+            cleaned.append((number, record, values, name))
+        self.categories.resolve({name: {} for _, _, _, name in cleaned if name is not None})
+        
+        todos = []
+        rows = {}
+        for number, record, values, name in cleaned:
+            todo = self.build(number, record, values, name)
+            if todo is not None:
+                todos.append(todo)
+                rows[todo.pk] = (number, record.get('id'))
+        self.report['valid'] += len(todos)
+        if todos and not self.dry_run:
+            self.write(todos, rows)
+    
+    def build(self, number, record, values, name):
+        """Unsaved Todo for a valid row, placed under its parent if it has one"""
+        todo = Todo(user=self.user, category_id=self.categories.ids.get(name), position=self.position, **values)
+        parent = record.get('parent_todo')
+        path, depth = '', -1
+        if parent:
+            if str(parent) not in self.parents:
+                self.error(number, 'parent_todo: not found among the earlier rows')
+                return None
+            todo.parent_todo_id, path, depth = self.parents[str(parent)]
+            if depth + 1 > Todo.MAX_DEPTH:
+                self.error(number, f'parent_todo: subtasks cannot be nested more than {Todo.MAX_DEPTH} levels deep')
+                return None
+        todo.path, todo.depth = path + todo.pk.hex + PATH_SEP, depth + 1
+        if record.get('id'):
+            self.parents[str(record['id'])] = (todo.pk, todo.path, todo.depth)
+        self.position += ordering.GAP
+        return todo
+    
+    def write(self, todos, rows):
+        try:
+            with transaction.atomic(), rollups.batched(), sync.batched():
+                Todo.objects.bulk_create(todos)
+                search.index_todos(todos)
+                sync_tags_bulk([todo for todo in todos if todo.tags])
+                rollups.apply_changes((None, todo.get_stats_snapshot()) for todo in todos)
+                sync.record_todos((todo.pk for todo in todos), user_id=self.user.pk)
+                sync.record([self.user.pk], 'category', {todo.category_id for todo in todos if todo.category_id})
+        except DatabaseError:
+            logger.exception('Importing %d todos for user %s failed', len(todos), self.user.pk)
+            self.report['valid'] -= len(todos)
+            for todo in todos:
+                number, record_id = rows[todo.pk]
+                self.parents.pop(str(record_id), None)
+                self.error(number, 'Could not be saved')
+            return
+        self.report['created'] += len(todos)
+    
+    def finish(self):
+        self.flush()
+        if self.report['created']:
+            caching.bump_version(self.user.pk)
+            events.publish([self.user.pk], 'todos.imported', count=self.report['created'])
+            activity.log(
+                user=self.user, action='created', todo_title=f"Imported {self.report['created']} todos",
+                details={'import': self.report['created']}
+            )
+        return self.report
+
+def import_todos(user, upload, format=None, dry_run=False, batch_size=BATCH_SIZE):
+    """
+    Import the todos of an uploaded file (optionally gzipped) and return
+    the report: rows read, valid, created and failed, the first row errors,
+    and the categories created (or, with dry_run, that would be). Nothing
+    is written with dry_run. If the file turns out to be unreadable part
+    way, the rows before that point are still imported and the report
+    carries an error. Raises ImportFileError for an unknown format.
+    """
+    reader = READERS[detect_format(upload.name, format)]
+    importer = Importer(user, dry_run, batch_size)
+    stream = open_text(upload)
+    try:
+        for number, section, record in reader(stream):
+            importer.feed(number, section, record)
+    except ImportFileError as e:
+        importer.report['error'] = str(e)
+    except (UnicodeDecodeError, OSError, EOFError, csv.Error) as e:
+        importer.report['error'] = f'Cannot read the file: {e}'
+    finally:
+        stream.detach()
+    return importer.finish()
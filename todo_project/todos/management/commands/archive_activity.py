@@ -0,0 +1,29 @@
+# todos/management/commands/archive_activity.py
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from todos import retention
+
+class Command(BaseCommand):
+    help = 'Move activity log entries past the retention horizon into compressed archive segments'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int,
+                            help='Archive entries older than this many days (default: TODO_ACTIVITY_RETENTION_DAYS)')
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Entries moved per transaction')
+        parser.add_argument('--no-compact', action='store_true',
+                            help='Skip merging segments of the same user and month')
+    
+    def handle(self, *args, **options):
+        before = None
+        if options['days'] is not None:
+            before = timezone.now() - timedelta(days=options['days'])
+        moved = retention.archive_activity(before, chunk_size=options['chunk_size'])
+        merged = 0 if options['no_compact'] else retention.compact_archives()
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {moved} activity entries, compacted {merged} segment groups'
+        ))
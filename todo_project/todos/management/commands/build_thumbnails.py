@@ -0,0 +1,29 @@
+# todos/management/commands/build_thumbnails.py
+
+from django.core.management.base import BaseCommand
+
+from todos import thumbnails
+from todos.models import TodoAttachment, User
+
+class Command(BaseCommand):
+    help = 'Render the missing thumbnails of avatars and image attachments'
+    
+    def handle(self, *args, **options):
+        rendered = 0
+        for user in list(User.objects.exclude(avatar='').exclude(avatar__isnull=True)):
+            if not user.avatar_digest:
+                # Avatars uploaded before thumbnails existed
+                try:
+                    with user.avatar.open('rb'):
+                        user.avatar_digest = thumbnails.hash_file(user.avatar)
+                except FileNotFoundError:
+                    continue
+                User.objects.filter(pk=user.pk).update(avatar_digest=user.avatar_digest)
+            for size in thumbnails.AVATAR_SIZES:
+                rendered += thumbnails.derivative(user.avatar.path, user.avatar_digest, size, crop=True) is not None
+        
+        for attachment in TodoAttachment.objects.filter(blob__isnull=False).iterator():
+            if thumbnails.is_image(attachment.filename):
+                for size in thumbnails.PREVIEW_SIZES:
+                    rendered += thumbnails.derivative(attachment.file.path, attachment.blob_id, size, crop=False) is not None
+        self.stdout.write(self.style.SUCCESS(f'{rendered} thumbnails are in place'))
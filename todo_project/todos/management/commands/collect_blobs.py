@@ -0,0 +1,21 @@
+# todos/management/commands/collect_blobs.py
+
+from django.core.management.base import BaseCommand
+
+from todos import attachments
+
+class Command(BaseCommand):
+    help = 'Repair attachment blob reference counts and delete blobs and files nothing refers to'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--grace', type=int,
+                            help='Leave files without a blob younger than this many seconds (default: 3600)')
+        parser.add_argument('--adopt-legacy', action='store_true',
+                            help='First move attachments stored before content addressing into blobs')
+    
+    def handle(self, *args, **options):
+        if options['adopt_legacy']:
+            adopted = attachments.adopt_legacy_files()
+            self.stdout.write(f'Moved {adopted} attachments into blobs')
+        blobs, files = attachments.collect_blobs(options['grace'])
+        self.stdout.write(self.style.SUCCESS(f'Deleted {blobs} unreferenced blobs and {files} orphaned files'))
@@ -0,0 +1,16 @@
+# todos/management/commands/prune_sync_tombstones.py
+
+from django.core.management.base import BaseCommand
+
+from todos import sync
+
+class Command(BaseCommand):
+    help = 'Delete delta sync tombstones older than the tombstone horizon'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int,
+                            help='Delete tombstones older than this many days (default: TODO_SYNC_TOMBSTONE_DAYS)')
+    
+    def handle(self, *args, **options):
+        deleted = sync.prune_tombstones(options['days'])
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} sync tombstones'))
@@ -0,0 +1,16 @@
+# todos/management/commands/prune_uploads.py
+
+from django.core.management.base import BaseCommand
+
+from todos import attachments
+
+class Command(BaseCommand):
+    help = 'Delete unfinished attachment uploads and their part files'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int,
+                            help='Delete uploads idle for longer than this many hours (default: TODO_UPLOAD_EXPIRY_HOURS)')
+    
+    def handle(self, *args, **options):
+        deleted = attachments.prune_uploads(options['hours'])
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} unfinished uploads'))
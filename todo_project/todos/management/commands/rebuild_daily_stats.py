@@ -0,0 +1,18 @@
+# todos/management/commands/rebuild_daily_stats.py
+
+from django.core.management.base import BaseCommand
+
+from todos import rollups
+
+class Command(BaseCommand):
+    help = 'Rebuild or backfill the DailyStats rollup from the todo table'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='users',
+                            help='Only rebuild this user id (repeatable)')
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help='Users recomputed per transaction')
+    
+    def handle(self, *args, **options):
+        count = rollups.rebuild(options['users'], chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt daily stats for {count} users'))
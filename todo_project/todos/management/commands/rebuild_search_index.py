@@ -0,0 +1,19 @@
+# todos/management/commands/rebuild_search_index.py
+
+from django.core.management.base import BaseCommand
+
+from todos import search
+from todos.models import TodoSearchDocument
+
+class Command(BaseCommand):
+    help = 'Rebuild the todo search documents and full-text index'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+    
+    def handle(self, *args, **options):
+        search.rebuild_index(chunk_size=options['chunk_size'])
+        backend = 'FTS5' if search.fts_enabled() else 'ORM fallback'
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {TodoSearchDocument.objects.count()} todos ({backend})'
+        ))
@@ -0,0 +1,18 @@
+# todos/management/commands/roll_forward_recurring.py
+
+from django.core.management.base import BaseCommand
+
+from todos import recurrence
+
+class Command(BaseCommand):
+    help = 'Create the occurrences of recurring todos that went by uncompleted'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--catch-up', type=int,
+                            help='Most missed occurrences created per series (default: TODO_RECURRENCE_CATCH_UP)')
+        parser.add_argument('--batch-size', type=int, default=recurrence.BATCH_SIZE,
+                            help='Series handled per transaction')
+    
+    def handle(self, *args, **options):
+        created = recurrence.roll_forward(catch_up=options['catch_up'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Created {created} occurrences of recurring todos'))
@@ -0,0 +1,29 @@
+# todos/management/commands/run_reminders.py
+
+import signal
+
+from django.core.management.base import BaseCommand
+
+from todos.reminders import Scheduler
+
+class Command(BaseCommand):
+    help = 'Email todo reminders as they come due, until stopped (SIGTERM or Ctrl-C)'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Send the reminders due now and exit, e.g. from cron')
+        parser.add_argument('--batch-size', type=int,
+                            help='Reminders claimed and mailed together (default: TODO_REMINDER_BATCH_SIZE)')
+    
+    def handle(self, *args, **options):
+        scheduler = Scheduler(batch_size=options['batch_size'])
+        if options['once']:
+            sent = scheduler.run_once()
+            self.stdout.write(self.style.SUCCESS(f'Sent {sent} reminders'))
+            return
+        
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda *args: scheduler.stop())
+        self.stdout.write('Dispatching reminders')
+        scheduler.run()
+        self.stdout.write(self.style.SUCCESS(f'Stopped after sending {scheduler.sent} reminders'))
@@ -0,0 +1,31 @@
+# todos/management/commands/send_digests.py
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from todos import digests
+
+class Command(BaseCommand):
+    help = 'Email the daily (and on TODO_DIGEST_WEEKDAY, weekly) todo summaries, resuming an interrupted run'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--kind', choices=list(digests.KINDS),
+                            help='Send only this kind of digest (default: those due today)')
+        parser.add_argument('--date', help='Day to send for, YYYY-MM-DD (default: today)')
+        parser.add_argument('--chunk-size', type=int,
+                            help='Users summarized and mailed together (default: TODO_DIGEST_CHUNK_SIZE)')
+    
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        if options['date']:
+            try:
+                today = parse_date(options['date'])
+            except ValueError:
+                today = None
+            if today is None:
+                raise CommandError('--date must be YYYY-MM-DD')
+        
+        for kind in [options['kind']] if options['kind'] else digests.due_kinds(today):
+            run = digests.send_digests(kind, today, options['chunk_size'])
+            self.stdout.write(self.style.SUCCESS(f'Sent {run.sent} {kind} digests for {today}'))
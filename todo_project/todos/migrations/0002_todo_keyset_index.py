@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todos', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='todo',
+            index=models.Index(fields=['user', 'position', '-created_at', 'id'], name='todos_todo_user_id_a9646b_idx'),
+        ),
+    ]
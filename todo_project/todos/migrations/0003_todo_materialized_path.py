@@ -0,0 +1,49 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:18
+
+from django.db import migrations, models
+
+
+def backfill_paths(apps, schema_editor):
+    Todo = apps.get_model('todos', 'Todo')
+    parents = dict(Todo.objects.values_list('pk', 'parent_todo_id').iterator())
+    paths = {}
+
+    for pk in parents:
+        chain = []
+        node = pk
+        while node is not None and node not in paths and node not in chain:
+            chain.append(node)
+            node = parents.get(node)
+        path, depth = paths.get(node, ('', -1))
+        for node in reversed(chain):
+            path, depth = path + node.hex + '/', depth + 1
+            paths[node] = (path, depth)
+
+    todos = []
+    for pk, (path, depth) in paths.items():
+        todos.append(Todo(pk=pk, path=path, depth=depth))
+        if len(todos) >= 500:
+            Todo.objects.bulk_update(todos, ['path', 'depth'])
+            todos = []
+    Todo.objects.bulk_update(todos, ['path', 'depth'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todos', '0002_todo_keyset_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='todo',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='todo',
+            name='path',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=1024),
+        ),
+        migrations.RunPython(backfill_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,106 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:20
+
+from django.db import OperationalError, migrations, models
+import django.db.models.deletion
+
+# The FTS5 index over todos_todosearchdocument, as of this migration. Kept
+# here rather than imported from todos.search so later changes to the app
+# cannot alter what this migration does.
+FTS_SCHEMA = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS todos_todo_fts USING fts5(
+        title, description, tags, comments,
+        content='todos_todosearchdocument', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS todos_todo_fts_ai AFTER INSERT ON todos_todosearchdocument BEGIN
+        INSERT INTO todos_todo_fts(rowid, title, description, tags, comments)
+        VALUES (new.id, new.title, new.description, new.tags, new.comments);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS todos_todo_fts_ad AFTER DELETE ON todos_todosearchdocument BEGIN
+        INSERT INTO todos_todo_fts(todos_todo_fts, rowid, title, description, tags, comments)
+        VALUES ('delete', old.id, old.title, old.description, old.tags, old.comments);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS todos_todo_fts_au AFTER UPDATE ON todos_todosearchdocument BEGIN
+        INSERT INTO todos_todo_fts(todos_todo_fts, rowid, title, description, tags, comments)
+        VALUES ('delete', old.id, old.title, old.description, old.tags, old.comments);
+        INSERT INTO todos_todo_fts(rowid, title, description, tags, comments)
+        VALUES (new.id, new.title, new.description, new.tags, new.comments);
+    END
+    """,
+]
+
+DROP_FTS = [
+    "DROP TRIGGER IF EXISTS todos_todo_fts_ai",
+    "DROP TRIGGER IF EXISTS todos_todo_fts_ad",
+    "DROP TRIGGER IF EXISTS todos_todo_fts_au",
+    "DROP TABLE IF EXISTS todos_todo_fts",
+]
+
+
+def create_documents(apps, schema_editor):
+    Todo = apps.get_model('todos', 'Todo')
+    TodoSearchDocument = apps.get_model('todos', 'TodoSearchDocument')
+    documents = []
+    for todo in Todo.objects.order_by().prefetch_related('comments').iterator(chunk_size=1000):
+        tags = todo.tags if isinstance(todo.tags, list) else []
+        documents.append(TodoSearchDocument(
+            todo=todo,
+            title=todo.title,
+            description=todo.description,
+            tags=' '.join(str(tag) for tag in tags),
+            comments=' '.join(comment.comment for comment in todo.comments.all()),
+        ))
+        if len(documents) >= 1000:
+            TodoSearchDocument.objects.bulk_create(documents)
+            documents = []
+    TodoSearchDocument.objects.bulk_create(documents)
+
+
+def create_index(apps, schema_editor):
+    # FTS5 is SQLite only, and optional there; search falls back to the ORM
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        try:
+            for statement in FTS_SCHEMA:
+                cursor.execute(statement)
+        except OperationalError:
+            return
+        cursor.execute("INSERT INTO todos_todo_fts(todos_todo_fts) VALUES ('rebuild')")
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for statement in DROP_FTS:
+            cursor.execute(statement)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todos', '0003_todo_materialized_path'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TodoSearchDocument',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('title', models.CharField(max_length=200)),
+                ('description', models.TextField(blank=True)),
+                ('tags', models.TextField(blank=True)),
+                ('comments', models.TextField(blank=True)),
+                ('todo', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='search_document', to='todos.todo')),
+            ],
+        ),
+        migrations.RunPython(create_index, drop_index),
+        migrations.RunPython(create_documents, migrations.RunPython.noop),
+    ]
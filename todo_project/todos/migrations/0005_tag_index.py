@@ -0,0 +1,55 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:22
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def index_tags(apps, schema_editor):
+    Todo = apps.get_model('todos', 'Todo')
+    Tag = apps.get_model('todos', 'Tag')
+    TodoTag = Todo.tag_index.through
+
+    tag_ids = {}
+    links = []
+    todos = Todo.objects.order_by().values_list('pk', 'user_id', 'tags').iterator(chunk_size=1000)
+    for todo_id, user_id, tags in todos:
+        if not isinstance(tags, list):
+            continue
+        names = {str(name).strip().lower()[:50] for name in tags} - {''}
+        for name in names:
+            if (user_id, name) not in tag_ids:
+                tag_ids[(user_id, name)] = Tag.objects.create(user_id=user_id, name=name).pk
+            links.append(TodoTag(todo_id=todo_id, tag_id=tag_ids[(user_id, name)]))
+        if len(links) >= 1000:
+            TodoTag.objects.bulk_create(links)
+            links = []
+    TodoTag.objects.bulk_create(links)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todos', '0004_todo_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tags', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['name'],
+                'unique_together': {('user', 'name')},
+            },
+        ),
+        migrations.AddField(
+            model_name='todo',
+            name='tag_index',
+            field=models.ManyToManyField(blank=True, editable=False, related_name='todos', to='todos.tag'),
+        ),
+        migrations.RunPython(index_tags, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todos', '0005_tag_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='todo',
+            index=models.Index(fields=['user', 'created_at'], name='todos_todo_user_id_2a11d7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='todo',
+            index=models.Index(fields=['user', 'completed_at'], name='todos_todo_user_id_8597a6_idx'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:40
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todos', '0008_activity_timestamp_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('count', models.PositiveIntegerField()),
+                ('first_timestamp', models.DateTimeField()),
+                ('last_timestamp', models.DateTimeField()),
+                ('data', models.BinaryField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-last_timestamp'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='activitylog',
+            index=models.Index(fields=['user', '-timestamp'], name='todos_activ_user_id_87744a_idx'),
+        ),
+        migrations.AddField(
+            model_name='activityarchive',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='activity_archives', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='activityarchive',
+            index=models.Index(fields=['user', '-last_timestamp'], name='todos_activ_user_id_63d83d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='activityarchive',
+            index=models.Index(fields=['user', 'month'], name='todos_activ_user_id_bf733b_idx'),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:53
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+def backfill_changes(apps, schema_editor):
+    Category = apps.get_model('todos', 'Category')
+    Todo = apps.get_model('todos', 'Todo')
+    TodoComment = apps.get_model('todos', 'TodoComment')
+    SyncChange = apps.get_model('todos', 'SyncChange')
+    
+    audience = {}
+    for todo_id, user_id in Todo.objects.order_by().values_list('pk', 'user_id').iterator(chunk_size=1000):
+        audience[todo_id] = [user_id]
+    for todo_id, user_id in Todo.shared_with.through.objects.values_list('todo_id', 'user_id').iterator(chunk_size=1000):
+        audience[todo_id].append(user_id)
+    
+    rows = [('category', pk, [user_id]) for pk, user_id in Category.objects.values_list('pk', 'user_id')]
+    rows += [('todo', pk, users) for pk, users in audience.items()]
+    rows += [
+        ('comment', pk, audience[todo_id])
+        for pk, todo_id in TodoComment.objects.values_list('pk', 'todo_id').iterator(chunk_size=1000)
+    ]
+    changes = []
+    for model, object_id, users in rows:
+        changes += [SyncChange(user_id=user_id, model=model, object_id=object_id) for user_id in users]
+        if len(changes) >= 1000:
+            SyncChange.objects.bulk_create(changes)
+            changes = []
+    SyncChange.objects.bulk_create(changes)
+
+class Migration(migrations.Migration):
+    
+    dependencies = [
+        ('todos', '0009_activity_retention'),
+    ]
+    
+    operations = [
+        migrations.CreateModel(
+            name='SyncChange',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('model', models.CharField(choices=[('todo', 'Todo'), ('category', 'Category'), ('comment', 'Comment')], max_length=10)),
+                ('object_id', models.UUIDField()),
+                ('deleted', models.BooleanField(default=False)),
+                ('changed_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sync_changes', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'id'], name='todos_syncc_user_id_d22073_idx'), models.Index(fields=['user', 'model', 'object_id'], name='todos_syncc_user_id_9d4b2e_idx'), models.Index(fields=['deleted', 'changed_at'], name='todos_syncc_deleted_a92967_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_changes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.7 on 2026-10-17 08:36
+
+from django.db import migrations, models
+import django.db.models.deletion
+import todos.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todos', '0011_attachment_uploads'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('digest', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('size', models.BigIntegerField()),
+                ('ref_count', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='todoattachment',
+            name='file',
+            field=models.FileField(storage=todos.storage.BlobStorage(), upload_to='attachments/%Y/%m/%d/'),
+        ),
+        migrations.AddField(
+            model_name='todoattachment',
+            name='blob',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='attachments', to='todos.blob'),
+        ),
+    ]
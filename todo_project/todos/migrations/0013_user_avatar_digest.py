@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 08:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todos', '0012_blob_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='avatar_digest',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-17 08:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todos', '0013_user_avatar_digest'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='todo',
+            index=models.Index(condition=models.Q(('reminder_date__isnull', False), ('reminder_sent', False)), fields=['reminder_date'], name='todo_reminder_due'),
+        ),
+    ]
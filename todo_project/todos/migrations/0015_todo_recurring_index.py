@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-17 08:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todos', '0014_todo_reminder_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='todo',
+            index=models.Index(condition=models.Q(('is_recurring', True)), fields=['due_date'], name='todo_recurring_due'),
+        ),
+    ]
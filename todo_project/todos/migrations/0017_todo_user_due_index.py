@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-17 08:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todos', '0016_digest_run'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='todo',
+            index=models.Index(fields=['user', 'due_date'], name='todos_todo_user_id_b502e4_idx'),
+        ),
+    ]
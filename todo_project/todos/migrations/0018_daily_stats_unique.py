@@ -0,0 +1,77 @@
+# Generated by Django 4.2.7 on 2026-10-17 09:34
+
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+# Users rebuilt per set of grouped queries
+CHUNK_SIZE = 500
+
+
+def backfill_daily_stats(apps, schema_editor):
+    """
+    Recompute every user's rollup from the todo table, as
+    rollups.rebuild() does: nothing filled it for todos that existed
+    before 0007, archived_open is new, and rows split across duplicates
+    are merged before the unique constraints go on
+    """
+    DailyStats = apps.get_model('todos', 'DailyStats')
+    Todo = apps.get_model('todos', 'Todo')
+    User = apps.get_model('todos', 'User')
+    users = list(User.objects.order_by('pk').values_list('pk', flat=True))
+    tz = timezone.get_default_timezone()
+    
+    for start in range(0, len(users), CHUNK_SIZE):
+        chunk = users[start:start + CHUNK_SIZE]
+        todos = Todo.objects.filter(user_id__in=chunk).order_by()
+        rows = defaultdict(lambda: defaultdict(int))
+        
+        def grouped(queryset, field, **aggregates):
+            return queryset.annotate(day=TruncDate(field, tzinfo=tz)).values(
+                'user_id', 'day', 'category_id'
+            ).annotate(total=Count('id'), **aggregates)
+        
+        for row in grouped(todos, 'created_at'):
+            rows[(row['user_id'], row['day'], row['category_id'])]['created'] = row['total']
+        completed = todos.filter(completed=True, completed_at__isnull=False)
+        for row in grouped(completed, 'completed_at', duration=Sum(F('completed_at') - F('created_at'))):
+            counters = rows[(row['user_id'], row['day'], row['category_id'])]
+            counters['completed'] = row['total']
+            counters['completion_seconds'] = max(0, int(row['duration'].total_seconds())) if row['duration'] else 0
+        for row in grouped(todos.filter(completed=False, due_date__isnull=False), 'due_date'):
+            rows[(row['user_id'], row['day'], row['category_id'])]['due_open'] = row['total']
+        for row in grouped(todos.filter(completed=False, is_archived=True), 'created_at'):
+            rows[(row['user_id'], row['day'], row['category_id'])]['archived_open'] = row['total']
+        
+        DailyStats.objects.filter(user_id__in=chunk).delete()
+        DailyStats.objects.bulk_create([
+            DailyStats(user_id=user_id, date=date, category_id=category_id, **counters)
+            for (user_id, date, category_id), counters in rows.items()
+        ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todos', '0017_todo_user_due_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dailystats',
+            name='archived_open',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_daily_stats, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='dailystats',
+            constraint=models.UniqueConstraint(fields=('user', 'date', 'category'), name='daily_stats_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailystats',
+            constraint=models.UniqueConstraint(condition=models.Q(('category__isnull', True)), fields=('user', 'date'), name='daily_stats_unique_uncategorized'),
+        ),
+    ]
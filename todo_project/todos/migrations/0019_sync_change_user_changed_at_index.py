@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-17 09:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todos', '0018_daily_stats_unique'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='syncchange',
+            index=models.Index(fields=['user', 'changed_at'], name='todos_syncc_user_id_be2d64_idx'),
+        ),
+    ]
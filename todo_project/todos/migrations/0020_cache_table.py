@@ -0,0 +1,20 @@
+# Generated by Django 4.2.7 on 2026-10-17 12:10
+
+from django.core.management import call_command
+from django.db import migrations
+
+
+def create_cache_table(apps, schema_editor):
+    """Create the table of every DatabaseCache in CACHES; existing ones are left alone"""
+    call_command('createcachetable', database=schema_editor.connection.alias, verbosity=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todos', '0019_sync_change_user_changed_at_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_cache_table, migrations.RunPython.noop),
+    ]
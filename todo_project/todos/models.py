@@ -1,13 +1,19 @@
 # todos/models.py
 
 from django.db import models
+from django.db.models import Count, F, Func, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Concat, Substr
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.utils import timezone
 import uuid
 
+from .storage import blob_storage
+
 class User(AbstractUser):
     """Extended User model with additional fields"""
     avatar = models.ImageField(upload_to='avatars/', null=True, blank=True)
+    avatar_digest = models.CharField(max_length=64, blank=True, editable=False)  # SHA-256 of the avatar, names its thumbnails
     bio = models.TextField(max_length=500, blank=True)
     theme_preference = models.CharField(max_length=10, default='light')
     notification_enabled = models.BooleanField(default=True)
@@ -32,6 +38,101 @@ class Category(models.Model):
     def __str__(self):
         return f"{self.name} ({self.user.username})"
 
+class Tag(models.Model):
+    """Normalized tag, indexing the names stored in Todo.tags"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='tags')
+    name = models.CharField(max_length=50)
+    
+    class Meta:
+        unique_together = ['user', 'name']
+        ordering = ['name']
+    
+    def __str__(self):
+        return f"{self.name} ({self.user.username})"
+    
+    @staticmethod
+    def normalize(names):
+        """Set of lowercased, trimmed tag names from a Todo.tags value"""
+        if not isinstance(names, list):
+            return set()
+        normalized = (str(name).strip().lower()[:50] for name in names)
+        return {name for name in normalized if name}
+
+def subquery_count(queryset):
+    """Correlated COUNT(*) over queryset, usable as an annotation"""
+    return Subquery(
+        queryset.order_by().annotate(
+            total=Func(F('pk'), function='COUNT')
+        ).values('total'),
+        output_field=IntegerField()
+    )
+
+# Materialized path: each todo's path is its ancestors' ids plus its own,
+# as 32 char hex segments ending in PATH_SEP. Every character used sorts
+# below PATH_END, so a subtree is the range [path, path + PATH_END).
+PATH_SEP = '/'
+PATH_END = '~'
+
+class TodoQuerySet(models.QuerySet):
+    """QuerySet helpers shared by the todo API views"""
+    
+    def visible_to(self, user):
+        """Todos owned by or shared with user, without a DISTINCT join"""
+        shared_ids = Todo.shared_with.through.objects.filter(user=user).values('todo_id')
+        return self.filter(Q(user=user) | Q(pk__in=shared_ids))
+    
+    def with_list_data(self):
+        """
+        Annotate and prefetch everything TodoSerializer reads, so serializing
+        any number of rows costs a fixed number of queries: the main query
+        (with comment/attachment/subtree counts as subqueries) plus one
+        prefetch each for user, category and shared_with.
+        """
+        return self.with_subtree_counts().annotate(
+            num_comments=subquery_count(TodoComment.objects.filter(todo=OuterRef('pk'))),
+            num_attachments=subquery_count(TodoAttachment.objects.filter(todo=OuterRef('pk'))),
+        ).prefetch_related('user', 'category', 'shared_with')
+    
+    def subtree_of(self, todo):
+        """todo and all of its descendants, via a range scan on path"""
+        return self.filter(path__gte=todo.path, path__lt=todo.path + PATH_END)
+    
+    def descendants_of(self, todos, max_depth=None):
+        """
+        All descendants of every todo in todos in a single query, optionally
+        limited to max_depth levels below each of them
+        """
+        condition = Q()
+        for todo in todos:
+            branch = Q(path__gt=todo.path, path__lt=todo.path + PATH_END)
+            if max_depth is not None:
+                branch &= Q(depth__lte=todo.depth + max_depth)
+            condition |= branch
+        if not condition:
+            return self.none()
+        return self.filter(condition)
+    
+    def with_tags(self, names, match_all=False):
+        """Todos tagged with any (or, with match_all, every) one of names"""
+        names = Tag.normalize(list(names))
+        links = Todo.tag_index.through.objects.filter(tag__name__in=names)
+        if match_all:
+            links = links.values('todo_id').annotate(
+                matched=Count('tag__name', distinct=True)
+            ).filter(matched=len(names))
+        return self.filter(pk__in=links.values('todo_id'))
+    
+    def with_subtree_counts(self):
+        """Annotate num_descendants, the size of each todo's subtree"""
+        return self.annotate(
+            num_descendants=subquery_count(
+                Todo.objects.filter(
+                    path__gt=OuterRef('path'),
+                    path__lt=Concat(OuterRef('path'), Value(PATH_END))
+                )
+            )
+        )
+
 class Todo(models.Model):
     """Main Todo model"""
     PRIORITY_CHOICES = [
@@ -65,6 +166,8 @@ class Todo(models.Model):
     is_archived = models.BooleanField(default=False)
     position = models.IntegerField(default=0)
     parent_todo = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='subtasks')
+    path = models.CharField(max_length=1024, db_index=True, editable=False, default='')
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
     
     # Sharing
     is_shared = models.BooleanField(default=False)
@@ -77,6 +180,7 @@ class Todo(models.Model):
     
     # Tags
     tags = models.JSONField(default=list, blank=True)
+    tag_index = models.ManyToManyField(Tag, related_name='todos', blank=True, editable=False)
     
     # Time tracking
     estimated_minutes = models.IntegerField(null=True, blank=True, validators=[MinValueValidator(0)])
@@ -86,17 +190,51 @@ class Todo(models.Model):
     reminder_date = models.DateTimeField(null=True, blank=True)
     reminder_sent = models.BooleanField(default=False)
     
+    objects = TodoQuerySet.as_manager()
+    
+    # Deepest nesting that still fits in path
+    MAX_DEPTH = 30
+    
     class Meta:
         ordering = ['position', '-created_at']
         indexes = [
             models.Index(fields=['user', 'completed']),
             models.Index(fields=['due_date']),
+            # Date ranges of a user's todos, e.g. calendar views
+            models.Index(fields=['user', 'due_date']),
             models.Index(fields=['created_at']),
+            models.Index(fields=['user', 'position', '-created_at', 'id']),
+            models.Index(fields=['user', 'created_at']),
+            models.Index(fields=['user', 'completed_at']),
+            # Reminders still to send, for the scheduler (todos/reminders.py)
+            models.Index(
+                fields=['reminder_date'], name='todo_reminder_due',
+                condition=Q(reminder_sent=False, reminder_date__isnull=False),
+            ),
+            # Series of recurring todos (todos/recurrence.py)
+            models.Index(fields=['due_date'], name='todo_recurring_due', condition=Q(is_recurring=True)),
         ]
     
     def __str__(self):
         return f"{self.title} ({self.user.username})"
     
+    # Fields whose stored values the daily stats rollup is derived from
+    STATS_FIELDS = ('user_id', 'category_id', 'created_at', 'completed', 'completed_at', 'due_date', 'is_archived')
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored state so rollups can apply deltas on save
+        instance.stats_snapshot = instance.get_stats_snapshot()
+        return instance
+    
+    def get_stats_snapshot(self):
+        """Current values of STATS_FIELDS, or None if any of them is deferred"""
+        loaded = self.__dict__
+        if any(field not in loaded for field in self.STATS_FIELDS):
+            return None
+        return {field: loaded[field] for field in self.STATS_FIELDS}
+    
     def save(self, *args, **kwargs):
         # Set completed_at when todo is marked as completed
         if self.completed and not self.completed_at:
@@ -105,21 +243,81 @@ class Todo(models.Model):
         elif not self.completed:
             self.completed_at = None
         
+        old_path, old_depth = self.path, self.depth
+        self.path, self.depth = self.build_path()
+        
         super().save(*args, **kwargs)
+        
+        if old_path and old_path != self.path:
+            self.move_descendants(old_path, old_depth)
+    
+    def build_path(self):
+        """Path and depth derived from the parent's"""
+        segment = self.pk.hex + PATH_SEP
+        if self.parent_todo_id is None:
+            return segment, 0
+        parent = self.parent_todo
+        return parent.path + segment, parent.depth + 1
+    
+    def move_descendants(self, old_path, old_depth):
+        """Re-root every descendant under the new path with one UPDATE"""
+        Todo.objects.filter(
+            path__gt=old_path, path__lt=old_path + PATH_END
+        ).update(
+            path=Concat(Value(self.path), Substr('path', len(old_path) + 1)),
+            depth=F('depth') + (self.depth - old_depth)
+        )
+    
+    def delete_subtree(self):
+        """Delete this todo and all its descendants in one collector pass"""
+        return Todo.objects.subtree_of(self).delete()
+
+class Blob(models.Model):
+    """
+    A stored file's content, kept once however many attachments refer to it
+    (see todos/storage.py)
+    """
+    digest = models.CharField(max_length=64, primary_key=True)  # SHA-256, hex
+    size = models.BigIntegerField()  # in bytes
+    ref_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.digest} ({self.ref_count} references)"
 
 class TodoAttachment(models.Model):
     """Attachments for todos"""
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     todo = models.ForeignKey(Todo, on_delete=models.CASCADE, related_name='attachments')
-    file = models.FileField(upload_to='attachments/%Y/%m/%d/')
+    # Stored as blobs/<digest>; attachments from before have their own file under attachments/
+    file = models.FileField(upload_to='attachments/%Y/%m/%d/', storage=blob_storage)
+    blob = models.ForeignKey(Blob, on_delete=models.PROTECT, null=True, blank=True, related_name='attachments')
     filename = models.CharField(max_length=255)
-    file_size = models.IntegerField()  # in bytes
+    file_size = models.BigIntegerField()  # in bytes
     uploaded_at = models.DateTimeField(auto_now_add=True)
     uploaded_by = models.ForeignKey(User, on_delete=models.CASCADE)
     
     def __str__(self):
         return f"Attachment for {self.todo.title}"
 
+class AttachmentUpload(models.Model):
+    """
+    A resumable attachment upload in progress: chunks are appended to a
+    part file under MEDIA_ROOT (see todos/attachments.py) until `received`
+    reaches `size`, when it becomes a TodoAttachment
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    todo = models.ForeignKey(Todo, on_delete=models.CASCADE, related_name='uploads')
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()  # in bytes
+    received = models.BigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Upload of {self.filename} ({self.received}/{self.size})"
+
 class TodoComment(models.Model):
     """Comments on todos"""
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -135,6 +333,86 @@ class TodoComment(models.Model):
     def __str__(self):
         return f"Comment by {self.user.username} on {self.todo.title}"
 
+class TodoSearchDocument(models.Model):
+    """
+    Denormalized search text for a todo. The integer primary key doubles as
+    the rowid of the SQLite FTS5 index built over this table (see
+    todos/search.py); on other databases it is searched directly.
+    """
+    id = models.BigAutoField(primary_key=True)
+    todo = models.OneToOneField(Todo, on_delete=models.CASCADE, related_name='search_document')
+    title = models.CharField(max_length=200)
+    description = models.TextField(blank=True)
+    tags = models.TextField(blank=True)
+    comments = models.TextField(blank=True)
+    
+    def __str__(self):
+        return f"Search document for {self.title}"
+
+class DailyStats(models.Model):
+    """
+    Per-user, per-day, per-category rollup of todo counts, kept up to date
+    incrementally (see todos/rollups.py) so dashboards read a window of
+    rows instead of scanning every todo. Days are in settings.TIME_ZONE.
+    One row per (user, date, category), uncategorized included.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_stats')
+    date = models.DateField()
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True)
+    created = models.IntegerField(default=0)
+    completed = models.IntegerField(default=0)
+    completion_seconds = models.BigIntegerField(default=0)
+    due_open = models.IntegerField(default=0)  # Still open todos due that day
+    archived_open = models.IntegerField(default=0)  # Open archived todos created that day
+    
+    class Meta:
+        verbose_name_plural = 'Daily stats'
+        indexes = [
+            models.Index(fields=['user', 'date']),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'date', 'category'], name='daily_stats_unique'),
+            # NULLs are distinct in a unique index, so uncategorized rows need their own
+            models.UniqueConstraint(
+                fields=['user', 'date'], condition=Q(category__isnull=True),
+                name='daily_stats_unique_uncategorized'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"Stats for {self.user.username} on {self.date}"
+
+class SyncChange(models.Model):
+    """
+    Change log behind delta sync (see todos/sync.py): the latest change of
+    each object per user who can see it, re-inserted on every change so ids
+    only grow, or a tombstone once the object is gone for that user
+    """
+    MODEL_CHOICES = [
+        ('todo', 'Todo'),
+        ('category', 'Category'),
+        ('comment', 'Comment'),
+    ]
+    
+    id = models.BigAutoField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sync_changes')
+    model = models.CharField(max_length=10, choices=MODEL_CHOICES)
+    object_id = models.UUIDField()
+    deleted = models.BooleanField(default=False)
+    changed_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'id']),
+            models.Index(fields=['user', 'model', 'object_id']),
+            models.Index(fields=['user', 'changed_at']),
+            models.Index(fields=['deleted', 'changed_at']),
+        ]
+    
+    def __str__(self):
+        change = 'deleted' if self.deleted else 'changed'
+        return f"{self.model} {self.object_id} {change} for {self.user_id}"
+
 class ActivityLog(models.Model):
     """Track user activities"""
     ACTION_CHOICES = [
@@ -152,16 +430,43 @@ class ActivityLog(models.Model):
     action = models.CharField(max_length=20, choices=ACTION_CHOICES)
     todo = models.ForeignKey(Todo, on_delete=models.SET_NULL, null=True, blank=True)
     todo_title = models.CharField(max_length=200)  # Store title in case todo is deleted
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Set when the activity is logged, not when the buffered entry is written
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
     details = models.JSONField(default=dict, blank=True)
     
     class Meta:
         ordering = ['-timestamp']
         verbose_name_plural = 'Activity logs'
+        indexes = [
+            models.Index(fields=['user', '-timestamp']),
+        ]
     
     def __str__(self):
         return f"{self.user.username} {self.action} {self.todo_title}"
 
+class ActivityArchive(models.Model):
+    """
+    Gzipped JSONL segment of ActivityLog entries moved out of the hot table
+    (see todos/retention.py), one or more per user and month
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='activity_archives')
+    month = models.DateField()  # First day of the month the entries are from
+    count = models.PositiveIntegerField()
+    first_timestamp = models.DateTimeField()
+    last_timestamp = models.DateTimeField()
+    data = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-last_timestamp']
+        indexes = [
+            models.Index(fields=['user', '-last_timestamp']),
+            models.Index(fields=['user', 'month']),
+        ]
+    
+    def __str__(self):
+        return f"{self.count} activities of {self.user.username} in {self.month:%Y-%m}"
+
 class TodoTemplate(models.Model):
     """Reusable todo templates"""
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -201,4 +506,27 @@ class UserPreferences(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     
     def __str__(self):
-        return f"Preferences for {self.user.username}"
\ No newline at end of file
+        return f"Preferences for {self.user.username}"
+
+class DigestRun(models.Model):
+    """
+    Progress of one day's summary digest job (see todos/digests.py): users
+    are mailed in id order, so an interrupted run resumes after last_user_id
+    """
+    KIND_CHOICES = [
+        ('daily', 'Daily'),
+        ('weekly', 'Weekly'),
+    ]
+    
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    date = models.DateField()  # Day the digests are sent on, in settings.TIME_ZONE
+    last_user_id = models.BigIntegerField(default=0)
+    sent = models.IntegerField(default=0)
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        unique_together = ['kind', 'date']
+    
+    def __str__(self):
+        return f"{self.get_kind_display()} digests for {self.date}"
@@ -0,0 +1,119 @@
+# todos/ordering.py
+
+from django.db import connection, transaction
+from django.db.models import Case, F, IntegerField, Min, Value, When
+
+from . import sync
+from .models import Todo, User
+from .pagination import flip, keyset_filter
+
+# Todo.position is a gap-based rank key: lists are numbered GAP apart, so a
+# move takes the midpoint between its new neighbours and updates one row.
+# A move into a gap narrower than MIN_GAP renumbers the user's list first,
+# in the same transaction. Every write of positions holds lock_list(), so
+# concurrent moves and renumberings of one list run one after the other.
+GAP = 1024
+MIN_GAP = 8
+
+# Rows per UPDATE ... CASE statement, within SQLite's parameter limit
+CHUNK_SIZE = 300
+
+KEYS = [*Todo._meta.ordering, 'id']
+
+def user_todos(user_id):
+    return Todo.objects.filter(user_id=user_id)
+
+def lock_list(user_id):
+    """Hold the user's list for positional writes until the transaction ends"""
+    if connection.features.has_select_for_update:
+        list(User.objects.select_for_update().filter(pk=user_id).values_list('pk'))
+    else:
+        # SQLite ignores FOR UPDATE; a write takes its database write lock
+        # now rather than after the reads the caller is about to make
+        User.objects.filter(pk=user_id).update(username=F('username'))
+
+def set_positions(user_id, positions):
+    """Write {todo pk: position} in one UPDATE per CHUNK_SIZE todos, atomically"""
+    with transaction.atomic():
+        lock_list(user_id)
+        return write_positions(user_id, positions)
+
+def write_positions(user_id, positions):
+    """set_positions() for a caller that holds lock_list() in a transaction"""
+    items = list(positions.items())
+    updated = 0
+    with sync.batched():
+        for start in range(0, len(items), CHUNK_SIZE):
+            chunk = dict(items[start:start + CHUNK_SIZE])
+            updated += user_todos(user_id).filter(pk__in=chunk).update(position=Case(
+                *[When(pk=pk, then=Value(position)) for pk, position in chunk.items()],
+                output_field=IntegerField()
+            ))
+        sync.record_todos(positions, user_id=user_id)
+    return updated
+
+def rebalance(user_id):
+    """Renumber a user's todos GAP apart, keeping their current order"""
+    with transaction.atomic():
+        lock_list(user_id)
+        ids = list(user_todos(user_id).order_by(*KEYS).values_list('pk', flat=True))
+        return write_positions(user_id, {pk: (index + 1) * GAP for index, pk in enumerate(ids)})
+
+def top_position(user_id):
+    """Position that sorts before all of a user's todos, for new ones"""
+    lowest = user_todos(user_id).aggregate(lowest=Min('position'))['lowest']
+    return GAP if lowest is None else lowest - GAP
+
+def neighbour(todo, anchor, after):
+    """The todo next to anchor on the given side, skipping the one being moved"""
+    keys = KEYS if after else [flip(key) for key in KEYS]
+    values = [getattr(anchor, key.lstrip('-')) for key in keys]
+    return user_todos(todo.user_id).exclude(pk=todo.pk).filter(
+        keyset_filter(keys, values)
+    ).order_by(*keys).only('position').first()
+
+def move(todo, after=None, before=None):
+    """
+    Place todo right after the todo after (or right before the todo before)
+    in its owner's list. Normally a single-row UPDATE; renumbers the list
+    first when the two neighbours are less than MIN_GAP apart.
+    """
+    with transaction.atomic():
+        lock_list(todo.user_id)
+        anchor = after or before
+        # Read under the lock, as another move may have shifted it
+        anchor.refresh_from_db(fields=['position'])
+        low, high = gap(todo, anchor, after is not None)
+        if high - low < MIN_GAP:
+            rebalance(todo.user_id)
+            anchor.refresh_from_db(fields=['position'])
+            low, high = gap(todo, anchor, after is not None)
+        
+        todo.position = (low + high) // 2
+        user_todos(todo.user_id).filter(pk=todo.pk).update(position=todo.position)
+        sync.record_todos([todo.pk], user_id=todo.user_id)
+    return todo.position
+
+def gap(todo, anchor, after):
+    """Positions of anchor and its neighbour on the side todo goes, low first"""
+    other = neighbour(todo, anchor, after)
+    if after:
+        return anchor.position, other.position if other else anchor.position + 2 * GAP
+    return other.position if other else anchor.position - 2 * GAP, anchor.position
+
+def apply_order(user_id, ids):
+    """
+    Reorder the given todos among the positions they hold now, leaving every
+    other todo in place, in one UPDATE per chunk. Renumbers the list first
+    if those positions are not distinct.
+    """
+    with transaction.atomic():
+        lock_list(user_id)
+        current = dict(user_todos(user_id).filter(pk__in=ids).values_list('pk', 'position'))
+        ids = [pk for pk in dict.fromkeys(ids) if pk in current]
+        slots = sorted(current.values())
+        if len(set(slots)) < len(slots):
+            rebalance(user_id)
+            current = dict(user_todos(user_id).filter(pk__in=ids).values_list('pk', 'position'))
+            slots = sorted(current.values())
+        return write_positions(user_id, dict(zip(ids, slots)))
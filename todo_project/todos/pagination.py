@@ -0,0 +1,171 @@
+# todos/pagination.py
+
+import base64
+import json
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+def uses_keyset(request):
+    """True if the client asked for cursor pagination"""
+    params = request.query_params
+    return 'cursor' in params or params.get('pagination') == 'cursor'
+
+def keyset_filter(keys, values):
+    """Rows strictly after values in the ordering given by keys"""
+    condition = Q()
+    for index, key in enumerate(keys):
+        lookup = 'lt' if key.startswith('-') else 'gt'
+        step = Q(**{f'{key.lstrip("-")}__{lookup}': values[index]})
+        for previous, value in zip(keys[:index], values):
+            step &= Q(**{previous.lstrip('-'): value})
+        condition |= step
+    return condition
+
+def flip(key):
+    """An ordering key in the other direction"""
+    return key[1:] if key.startswith('-') else f'-{key}'
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (cursor) pagination over a multi-column ordering.
+    
+    Each page is fetched with a WHERE clause on the ordering values of the
+    last row seen instead of an OFFSET, so a page costs the same no matter
+    how deep it is. The ordering defaults to the model's Meta.ordering with
+    the primary key appended as a tie breaker; every ordering field must be
+    a non-null concrete field. The total count is skipped unless the client
+    passes ?total=true.
+    """
+    cursor_query_param = 'cursor'
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    total_query_param = 'total'
+    ordering = None
+    invalid_cursor_message = 'Invalid cursor'
+    
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.set_keys(queryset)
+        
+        cursor = self.decode_cursor(request)
+        reverse = cursor is not None and cursor['reverse']
+        
+        self.total = None
+        if request.query_params.get(self.total_query_param, '').lower() == 'true':
+            self.total = queryset.count()
+        
+        keys = [flip(key) for key in self.keys] if reverse else self.keys
+        queryset = queryset.order_by(*keys)
+        if cursor is not None:
+            queryset = queryset.filter(keyset_filter(keys, cursor['values']))
+        
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        
+        if reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+        
+        self.page = rows
+        return rows
+    
+    def get_paginated_response(self, data):
+        response = {
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        }
+        if self.total is not None:
+            response['count'] = self.total
+        return Response(response)
+    
+    def set_keys(self, queryset):
+        self.keys = self.get_ordering(queryset)
+        self.fields = [
+            queryset.model._meta.get_field(key.lstrip('-')) for key in self.keys
+        ]
+    
+    def link_after(self, url, queryset, row):
+        """Link to the page of queryset after row, at url, for a first page fetched some other way"""
+        self.base_url = url
+        self.set_keys(queryset)
+        return self.encode_link(row, reverse=False)
+    
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+    
+    def get_ordering(self, queryset):
+        """Ordering keys, always ending in the primary key"""
+        pk_name = queryset.model._meta.pk.name
+        keys = list(self.ordering or queryset.model._meta.ordering)
+        if pk_name not in [key.lstrip('-') for key in keys]:
+            keys.append(pk_name)
+        return keys
+    
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_link(self.page[-1], reverse=False)
+    
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_link(self.page[0], reverse=True)
+    
+    def encode_link(self, row, reverse):
+        payload = {
+            'v': [field.value_to_string(row) for field in self.fields],
+            'r': int(reverse),
+        }
+        cursor = base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+        url = remove_query_param(self.base_url, 'pagination')
+        url = remove_query_param(url, self.total_query_param)
+        return replace_query_param(url, self.cursor_query_param, cursor)
+    
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+            if len(payload['v']) != len(self.fields):
+                raise ValueError(encoded)
+            values = [
+                field.to_python(value) for field, value in zip(self.fields, payload['v'])
+            ]
+            return {'values': values, 'reverse': bool(payload.get('r'))}
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+class TodoPagination(PageNumberPagination):
+    """Page-number pagination that switches to keyset mode on ?pagination=cursor"""
+    keyset_class = KeysetPagination
+    
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if uses_keyset(request):
+            self.keyset = self.keyset_class()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+    
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -0,0 +1,298 @@
+# todos/recurrence.py
+
+import calendar
+from collections import defaultdict, namedtuple
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from . import caching, events, rollups, search, sync
+from .models import PATH_SEP, Todo
+from .tags import sync_tags_bulk
+
+# Recurring todos. A series is stored as a single row, its current
+# occurrence: the todo with is_recurring set, due when that occurrence is.
+# Later occurrences are never stored ahead of time; occurrences() computes
+# the ones in a range arithmetically from the stored due date, without
+# stepping through the series, for calendars and other reads. Completing
+# the current occurrence hands the series on: the completed row stops
+# recurring and the next occurrence is created (advance()). roll_forward(),
+# run periodically, does the same for series left open while occurrences
+# went by, creating a row for each missed one with bulk_create.
+#
+# Occurrences keep the wall-clock time of the series in TIME_ZONE, whatever
+# timezone is active. Monthly
+# and yearly ones fall on the same day of the month, or the month's last
+# day when it is shorter.
+
+# Pattern -> (days, months) between occurrences
+STEPS = {
+    'daily': (1, 0),
+    'weekly': (7, 0),
+    'monthly': (0, 1),
+    'yearly': (0, 12),
+}
+
+# Most occurrences computed per series for one read
+MAX_OCCURRENCES = 1000
+
+# Longest range a read expands, in days
+MAX_RANGE_DAYS = 366
+
+# Missed occurrences created per series by roll_forward(), the latest ones
+# (TODO_RECURRENCE_CATCH_UP)
+DEFAULT_CATCH_UP = 30
+
+# Series per transaction in roll_forward()
+BATCH_SIZE = 500
+
+# Fields an occurrence takes from the series
+COPIED_FIELDS = (
+    'user_id', 'title', 'description', 'category_id', 'priority', 'is_pinned',
+    'position', 'parent_todo_id', 'is_shared', 'recurrence_pattern',
+    'recurrence_end_date', 'estimated_minutes',
+)
+
+Occurrence = namedtuple('Occurrence', 'todo due_date reminder_date')
+
+def series():
+    """Todos that carry a series, as the partial index todo_recurring_due covers them"""
+    return Todo.objects.filter(is_recurring=True, due_date__isnull=False, recurrence_pattern__in=STEPS)
+
+def is_series(todo):
+    return todo.is_recurring and todo.due_date is not None and todo.recurrence_pattern in STEPS
+
+# Occurrence arithmetic
+
+def local_time(value):
+    return timezone.localtime(value, timezone.get_default_timezone())
+
+def add_months(value, months, day):
+    month = value.month - 1 + months
+    year, month = value.year + month // 12, month % 12 + 1
+    return value.replace(year=year, month=month, day=min(day, calendar.monthrange(year, month)[1]))
+
+def occurrence(todo, index):
+    """Due date of the index-th occurrence after the stored one"""
+    days, months = STEPS[todo.recurrence_pattern]
+    local = local_time(todo.due_date).replace(tzinfo=None)
+    if days:
+        local += timedelta(days=days * index)
+    else:
+        local = add_months(local, months * index, local.day)
+    return timezone.make_aware(local, timezone.get_default_timezone())
+
+def first_index(todo, start):
+    """Index of the first occurrence after the stored one that is due at or after start"""
+    if start <= todo.due_date:
+        return 1
+    days, months = STEPS[todo.recurrence_pattern]
+    if days:
+        index = int((start - todo.due_date) / timedelta(days=days))
+    else:
+        start_local, due_local = local_time(start), local_time(todo.due_date)
+        index = ((start_local.year - due_local.year) * 12 + start_local.month - due_local.month) // months
+    # The estimate can be one off across DST changes and short months
+    index = max(1, index)
+    while index > 1 and occurrence(todo, index - 1) >= start:
+        index -= 1
+    while occurrence(todo, index) < start:
+        index += 1
+    return index
+
+def ended(todo, due_date):
+    return todo.recurrence_end_date is not None and local_time(due_date).date() > todo.recurrence_end_date
+
+def shifted_reminder(todo, due_date):
+    """The series' reminder, as far ahead of due_date as it is of the stored due date"""
+    if todo.reminder_date is None:
+        return None
+    return todo.reminder_date + (due_date - todo.due_date)
+
+def occurrences(todo, start, end, limit=MAX_OCCURRENCES):
+    """Occurrences of a series after the stored one that are due in [start, end)"""
+    if not is_series(todo):
+        return []
+    result = []
+    index = first_index(todo, start)
+    while len(result) < limit:
+        due_date = occurrence(todo, index)
+        if due_date >= end or ended(todo, due_date):
+            break
+        result.append(Occurrence(todo, due_date, shifted_reminder(todo, due_date)))
+        index += 1
+    return result
+
+def next_occurrence(todo, after):
+    """Due date of the first occurrence after the stored one that is due at or after a time; None once the series ended"""
+    due_date = occurrence(todo, first_index(todo, after))
+    return None if ended(todo, due_date) else due_date
+
+def series_between(todos, start, end):
+    """The series among todos that may have occurrences due in [start, end)"""
+    return todos.filter(
+        Q(recurrence_end_date__isnull=True) | Q(recurrence_end_date__gte=local_time(start).date()),
+        is_recurring=True, recurrence_pattern__in=STEPS, due_date__lt=end,
+    )
+
+def expand(todos, start, end, limit=MAX_OCCURRENCES):
+    """Occurrences due in [start, end) of the series among todos, by due date"""
+    result = []
+    for todo in series_between(todos, start, end):
+        result += occurrences(todo, start, end, limit)
+    result.sort(key=lambda item: item.due_date)
+    return result
+
+def parse_time(name, value, tz=None):
+    """Aware datetime of an ISO 8601 date or date-time, naive ones taken in tz; raises ValueError"""
+    try:
+        parsed = parse_datetime(value)
+        if parsed is None and (day := parse_date(value)) is not None:
+            parsed = datetime.combine(day, time.min)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise ValueError(f'{name} must be an ISO 8601 date or date-time')
+    return parsed if timezone.is_aware(parsed) else timezone.make_aware(parsed, tz)
+
+def parse_range(start=None, end=None, now=None, max_days=MAX_RANGE_DAYS, tz=None):
+    """Validated [start, end) from query values, now and max_days on by default; raises ValueError"""
+    start = parse_time('start', start, tz) if start else now or timezone.now()
+    end = parse_time('end', end, tz) if end else start + timedelta(days=max_days)
+    if end <= start:
+        raise ValueError('end must be after start')
+    if end - start > timedelta(days=max_days):
+        raise ValueError(f'The range cannot be longer than {max_days} days')
+    return start, end
+
+# Materializing
+
+def build(todo, due_date, recurring):
+    """Unsaved occurrence of a series, beside it in the tree"""
+    new = Todo(
+        **{field: getattr(todo, field) for field in COPIED_FIELDS},
+        tags=list(todo.tags) if isinstance(todo.tags, list) else [],
+        due_date=due_date,
+        reminder_date=shifted_reminder(todo, due_date),
+        is_recurring=recurring,
+    )
+    new.path = todo.path[:-len(todo.pk.hex + PATH_SEP)] + new.pk.hex + PATH_SEP
+    new.depth = todo.depth
+    return new
+
+def claim(todo, **unchanged):
+    """Take the series off todo if it still carries it (and matches unchanged); False if another process did"""
+    return bool(
+        Todo.objects.filter(pk=todo.pk, is_recurring=True, **unchanged)
+        .update(is_recurring=False, updated_at=timezone.now())
+    )
+
+def create(todos, heads):
+    """
+    Save new occurrences with bulk_create, along with the derived data the
+    save signals keep for single todos, and log heads, the todos that no
+    longer carry their series
+    """
+    shares = defaultdict(list)
+    for todo_id, user_id in Todo.shared_with.through.objects.filter(
+        todo_id__in=[head.pk for head in heads if head.is_shared]
+    ).values_list('todo_id', 'user_id'):
+        shares[todo_id].append(user_id)
+    audience = defaultdict(set)
+    for head in heads:
+        audience[head.user_id].update(shares[head.pk])
+    
+    with transaction.atomic(), rollups.batched(), sync.batched():
+        new = [todo for _, todo in todos]
+        Todo.objects.bulk_create(new)
+        through = Todo.shared_with.through
+        through.objects.bulk_create([
+            through(todo_id=todo.pk, user_id=user_id) for head, todo in todos for user_id in shares[head.pk]
+        ])
+        search.index_todos(new)
+        sync_tags_bulk([todo for todo in new if todo.tags])
+        rollups.apply_changes((None, todo.get_stats_snapshot()) for todo in new)
+        sync.record_todos([*(todo.pk for todo in new), *(head.pk for head in heads)])
+        # Subtree counts of the ancestors change
+        sync.record_todos({pk for todo in new for pk in sync.ancestor_ids(todo)})
+        for todo in new:
+            if todo.category_id:
+                sync.record([todo.user_id], 'category', [todo.category_id])
+    
+    caching.bump_version(*audience, *(user_id for users in audience.values() for user_id in users))
+    for user_id, users in audience.items():
+        events.publish(
+            [user_id, *users], 'todos.bulk', action='recur',
+            ids=[todo.pk for todo in [*heads, *new] if todo.user_id == user_id]
+        )
+    return new
+
+def advance(todo_ids, now=None):
+    """
+    Hand each completed series among todo_ids on to its next occurrence,
+    the first one due after now (or after the completed one, if that was
+    not due yet). Returns the created todos.
+    """
+    now = now or timezone.now()
+    heads, todos = [], []
+    with transaction.atomic():
+        for head in series().filter(pk__in=list(todo_ids), completed=True):
+            if not claim(head):
+                continue
+            heads.append(head)
+            due_date = next_occurrence(head, now)
+            if due_date is not None:
+                todos.append((head, build(head, due_date, recurring=True)))
+        return create(todos, heads) if heads else []
+
+def roll_forward(now=None, catch_up=None, batch_size=BATCH_SIZE):
+    """
+    Create the occurrences that went by while series stayed open: each open
+    series gets a row for every occurrence due before now (the latest
+    catch_up of them), the last of which carries the series on. Completed
+    series not handed on yet are advance()d. Returns how many todos were
+    created.
+    """
+    now = now or timezone.now()
+    catch_up = catch_up or getattr(settings, 'TODO_RECURRENCE_CATCH_UP', DEFAULT_CATCH_UP)
+    # Completed series that were never handed on, e.g. imported ones
+    completed = list(series().filter(completed=True).values_list('pk', flat=True))
+    created = sum(
+        len(advance(completed[start:start + batch_size], now)) for start in range(0, len(completed), batch_size)
+    )
+    
+    # Only series whose next occurrence may be due, by the shortest step of their pattern
+    overdue = Q()
+    for pattern, (days, months) in STEPS.items():
+        overdue |= Q(recurrence_pattern=pattern, due_date__lte=now - timedelta(days=days or 28 * months))
+    candidates = series().filter(overdue, completed=False, is_archived=False).exclude(
+        recurrence_end_date__lte=TruncDate('due_date')
+    ).order_by('pk')
+    last = None
+    while True:
+        chunk = list((candidates.filter(pk__gt=last) if last else candidates)[:batch_size])
+        if not chunk:
+            return created
+        last = chunk[-1].pk
+        heads, todos = [], []
+        with transaction.atomic():
+            for head in chunk:
+                end = first_index(head, now)
+                due_dates = [
+                    due_date for due_date in (occurrence(head, index) for index in range(max(1, end - catch_up), end))
+                    if not ended(head, due_date)
+                ]
+                if not due_dates or not claim(head, completed=False, due_date=head.due_date):
+                    continue
+                heads.append(head)
+                todos += [
+                    (head, build(head, due_date, recurring=due_date == due_dates[-1]))
+                    for due_date in due_dates
+                ]
+            if heads:
+                created += len(create(todos, heads))
@@ -0,0 +1,232 @@
+# todos/reminders.py
+
+import heapq
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import caching, sync
+from .models import Todo
+
+logger = logging.getLogger(__name__)
+
+# Reminder dispatch. A long-running Scheduler loads the reminders due within
+# the next window from the partial index on unsent reminder dates into an
+# in-memory heap ordered by time, and as they come due claims them in
+# batches, marking them sent in one transaction that only wins rows still
+# unsent and still due, so concurrent schedulers never send one twice and a
+# reminder moved or cleared after loading is left alone. Claimed reminders
+# are mailed one by one over one reused connection. Those not mailed when a
+# send fails are released for the next attempt, so a reminder is sent at
+# most once and retried until it is.
+
+# Seconds between reloads of the queue (TODO_REMINDER_POLL_INTERVAL)
+DEFAULT_POLL_INTERVAL = 30
+
+# Reminders claimed and mailed together (TODO_REMINDER_BATCH_SIZE)
+DEFAULT_BATCH_SIZE = 500
+
+# Reminders held in memory at most (TODO_REMINDER_QUEUE_SIZE)
+DEFAULT_QUEUE_SIZE = 20000
+
+# Seconds to wait after a failed batch before retrying (TODO_REMINDER_RETRY_DELAY)
+DEFAULT_RETRY_DELAY = 30
+
+def setting(name, default):
+    return getattr(settings, name, default)
+
+def pending():
+    """Unsent reminders, as the partial index todo_reminder_due covers them"""
+    return Todo.objects.filter(reminder_sent=False, reminder_date__isnull=False)
+
+def claim(todo_ids, now):
+    """
+    Mark as sent those of todo_ids whose reminder is unsent and due by now
+    and return their ids; rows another scheduler holds or took are skipped
+    """
+    due = pending().filter(pk__in=todo_ids, reminder_date__lte=now)
+    with transaction.atomic():
+        if connection.features.has_select_for_update_skip_locked:
+            claimed = list(due.select_for_update(skip_locked=True).values_list('pk', flat=True))
+            Todo.objects.filter(pk__in=claimed).update(reminder_sent=True)
+        else:
+            # Without row locks each conditional UPDATE tells whether this
+            # transaction won the row; on SQLite the first one takes the
+            # database write lock, serializing schedulers
+            claimed = [
+                pk for pk in due.values_list('pk', flat=True)
+                if Todo.objects.filter(pk=pk, reminder_sent=False).update(reminder_sent=True)
+            ]
+        if claimed:
+            record(claimed)
+    return claimed
+
+def release(todo_ids):
+    """Mark reminders unsent again after a failed send"""
+    with transaction.atomic():
+        Todo.objects.filter(pk__in=todo_ids).update(reminder_sent=False)
+        record(todo_ids)
+
+def record(todo_ids):
+    # reminder_sent is part of the todo payload
+    sync.record_todos(todo_ids)
+    caching.bump_version(*Todo.objects.filter(pk__in=todo_ids).values_list('user_id', flat=True).distinct())
+
+def wants_reminders(todo):
+    user = todo.user
+    if not user.email or not user.notification_enabled or todo.completed:
+        return False
+    preferences = getattr(user, 'preferences', None)
+    return preferences is None or preferences.email_reminders
+
+def build_message(todo):
+    when = timezone.localtime(todo.due_date).strftime('%Y-%m-%d %H:%M') if todo.due_date else None
+    lines = [f'Hi {todo.user.get_full_name() or todo.user.username},', '', f'This is your reminder for "{todo.title}".']
+    if when:
+        lines.append(f'It is due {when}.')
+    if todo.description:
+        lines += ['', todo.description]
+    return EmailMessage(
+        subject=f'Reminder: {todo.title}',
+        body='\n'.join(lines),
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[todo.user.email],
+    )
+
+class Scheduler:
+    """Dispatches due reminders until stop() is called"""
+    
+    def __init__(self, batch_size=None, poll_interval=None, queue_size=None):
+        self.batch_size = batch_size or setting('TODO_REMINDER_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+        self.poll_interval = poll_interval or setting('TODO_REMINDER_POLL_INTERVAL', DEFAULT_POLL_INTERVAL)
+        self.queue_size = queue_size or setting('TODO_REMINDER_QUEUE_SIZE', DEFAULT_QUEUE_SIZE)
+        self.heap = []  # (reminder_date, todo id)
+        # Every unsent reminder up to here is queued
+        self.horizon = None
+        self.next_reload = 0
+        self.connection = None
+        self.stopped = False
+        self.sent = 0
+    
+    def stop(self):
+        self.stopped = True
+    
+    # Queue
+    
+    def reload(self, now):
+        """Queue the unsent reminders due before the next reload, oldest first"""
+        window_end = now + timedelta(seconds=2 * self.poll_interval)
+        # Rebuilt from the index each time, so reminders added, moved or sent
+        # elsewhere since the last load are picked up
+        self.heap = list(
+            pending().filter(reminder_date__lte=window_end)
+            .order_by('reminder_date').values_list('reminder_date', 'pk')[:self.queue_size]
+        )
+        heapq.heapify(self.heap)
+        # A full queue may have left later reminders behind
+        self.horizon = max(self.heap)[0] if len(self.heap) == self.queue_size else window_end
+        self.next_reload = time.monotonic() + self.poll_interval
+    
+    def needs_reload(self, now):
+        return (
+            self.horizon is None or time.monotonic() >= self.next_reload
+            or (not self.heap and self.horizon <= now)
+        )
+    
+    def due(self, now):
+        """Pop up to a batch of queued reminders due by now"""
+        batch = []
+        while self.heap and self.heap[0][0] <= now and len(batch) < self.batch_size:
+            batch.append(heapq.heappop(self.heap)[1])
+        return batch
+    
+    # Sending
+    
+    def mail_connection(self):
+        if self.connection is None:
+            self.connection = get_connection()
+            self.connection.open()
+        return self.connection
+    
+    def close(self):
+        if self.connection is not None:
+            try:
+                self.connection.close()
+            finally:
+                self.connection = None
+    
+    def dispatch(self, todo_ids, now):
+        """Claim and mail a batch; returns how many were mailed"""
+        claimed = claim(todo_ids, now)
+        if not claimed:
+            return 0
+        todos = Todo.objects.filter(pk__in=claimed).select_related('user', 'user__preferences').order_by('reminder_date')
+        messages = [(todo.pk, build_message(todo)) for todo in todos if wants_reminders(todo)]
+        # One message per call, so a failure partway knows which went out
+        sent, unsent = 0, []
+        for index, (todo_id, message) in enumerate(messages):
+            try:
+                delivered = self.mail_connection().send_messages([message])
+            except Exception:
+                logger.exception('Sending %d reminders failed, will retry', len(messages) - index)
+                self.close()
+                release(unsent + [pk for pk, _ in messages[index:]])
+                raise
+            if delivered:
+                sent += 1
+            else:
+                unsent.append(todo_id)
+        if unsent:
+            release(unsent)
+        self.sent += sent
+        return sent
+    
+    def run_once(self, now=None):
+        """Send every reminder due by now; returns how many were mailed"""
+        now = now or timezone.now()
+        sent = 0
+        while True:
+            self.reload(now)
+            if not self.heap:
+                return sent
+            while batch := self.due(now):
+                sent += self.dispatch(batch, now)
+            if self.horizon >= now:
+                return sent
+    
+    def run(self):
+        """Dispatch reminders as they come due until stopped"""
+        try:
+            while not self.stopped:
+                now = timezone.now()
+                if self.needs_reload(now):
+                    self.reload(now)
+                batch = self.due(now)
+                if batch:
+                    try:
+                        self.dispatch(batch, now)
+                    except Exception:
+                        self.horizon = None
+                        self.sleep(setting('TODO_REMINDER_RETRY_DELAY', DEFAULT_RETRY_DELAY))
+                    continue
+                self.sleep(self.idle_time(now))
+        finally:
+            self.close()
+    
+    def idle_time(self, now):
+        """Seconds until the next reminder or reload, whichever is first"""
+        wait = max(0, self.next_reload - time.monotonic())
+        if self.heap:
+            wait = min(wait, (self.heap[0][0] - now).total_seconds())
+        return max(0.05, wait)
+    
+    def sleep(self, seconds):
+        # In short steps so stop() takes effect promptly
+        deadline = time.monotonic() + seconds
+        while not self.stopped and (remaining := deadline - time.monotonic()) > 0:
+            time.sleep(min(remaining, 1))
@@ -0,0 +1,178 @@
+# todos/retention.py
+
+import base64
+import gzip
+import json
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import caching
+from .models import ActivityArchive, ActivityLog
+
+# Days an entry stays in the hot ActivityLog table (TODO_ACTIVITY_RETENTION_DAYS)
+DEFAULT_RETENTION_DAYS = 90
+
+FIELDS = ('id', 'user_id', 'action', 'todo_id', 'todo_title', 'timestamp', 'details')
+
+def retention_cutoff(now=None):
+    days = getattr(settings, 'TODO_ACTIVITY_RETENTION_DAYS', DEFAULT_RETENTION_DAYS)
+    return (now or timezone.now()) - timedelta(days=days)
+
+def month_of(timestamp):
+    return timezone.localtime(timestamp, timezone.get_default_timezone()).date().replace(day=1)
+
+# Segments
+
+def encode_segment(rows):
+    """Gzipped JSONL of ActivityLog value rows"""
+    lines = []
+    for row in rows:
+        lines.append(json.dumps({
+            **row,
+            'id': str(row['id']),
+            'todo_id': str(row['todo_id']) if row['todo_id'] else None,
+            # isoformat() keeps the microseconds the ordering depends on
+            'timestamp': row['timestamp'].isoformat(),
+        }))
+    return gzip.compress('\n'.join(lines).encode())
+
+def decode_segment(data):
+    rows = []
+    for line in gzip.decompress(bytes(data)).decode().splitlines():
+        row = json.loads(line)
+        row['id'] = uuid.UUID(row['id'])
+        row['todo_id'] = uuid.UUID(row['todo_id']) if row['todo_id'] else None
+        row['timestamp'] = parse_datetime(row['timestamp'])
+        rows.append(row)
+    return rows
+
+def raw_delete(queryset):
+    # Nothing references these rows, so skip the collector and its
+    # per-row delete signals
+    return queryset._raw_delete(queryset.db)
+
+def make_segments(rows):
+    """One ActivityArchive per (user, month) among rows"""
+    groups = defaultdict(list)
+    for row in rows:
+        groups[(row['user_id'], month_of(row['timestamp']))].append(row)
+    segments = []
+    for (user_id, month), group in groups.items():
+        group.sort(key=lambda row: (row['timestamp'], row['id']))
+        segments.append(ActivityArchive(
+            user_id=user_id, month=month, count=len(group),
+            first_timestamp=group[0]['timestamp'], last_timestamp=group[-1]['timestamp'],
+            data=encode_segment(group)
+        ))
+    return segments
+
+# Archiving
+
+def archive_activity(before=None, chunk_size=1000):
+    """
+    Move ActivityLog entries older than before (default: the retention
+    horizon) into ActivityArchive segments, oldest first, chunk_size rows
+    per transaction so each chunk is either archived or left in place.
+    The owners' cached feeds are invalidated once per chunk. Returns the
+    number of entries moved.
+    """
+    before = before or retention_cutoff()
+    moved = 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                ActivityLog.objects.filter(timestamp__lt=before).order_by('timestamp', 'id').values(*FIELDS)[:chunk_size]
+            )
+            if not rows:
+                return moved
+            ActivityArchive.objects.bulk_create(make_segments(rows))
+            raw_delete(ActivityLog.objects.filter(pk__in=[row['id'] for row in rows]))
+            caching.bump_version(*{row['user_id'] for row in rows})
+        moved += len(rows)
+
+def compact_archives(user_ids=None):
+    """
+    Merge the segments each archive run adds for the same user and month
+    into one. Returns the number of (user, month) groups merged.
+    """
+    groups = ActivityArchive.objects.values('user_id', 'month').annotate(segments=Count('id')).filter(segments__gt=1)
+    if user_ids is not None:
+        groups = groups.filter(user_id__in=user_ids)
+    
+    merged = 0
+    for group in groups.order_by():
+        with transaction.atomic():
+            segments = list(ActivityArchive.objects.select_for_update().filter(
+                user_id=group['user_id'], month=group['month']
+            ))
+            rows = [row for segment in segments for row in decode_segment(segment.data)]
+            ActivityArchive.objects.bulk_create(make_segments(rows))
+            raw_delete(ActivityArchive.objects.filter(pk__in=[segment.pk for segment in segments]))
+        merged += 1
+    return merged
+
+# Reading
+
+def history_key(entry):
+    return (entry.timestamp, entry.id)
+
+def archived_entry(user, row):
+    """An unsaved ActivityLog for an archived row, marked archived=True"""
+    entry = ActivityLog(
+        id=row['id'], user=user, action=row['action'], todo_id=row['todo_id'],
+        todo_title=row['todo_title'], timestamp=row['timestamp'], details=row['details']
+    )
+    entry.archived = True
+    return entry
+
+def activity_history(user, before=None, limit=50):
+    """
+    The user's activity newest first across the hot table and the archive,
+    as ActivityLog instances, up to limit entries strictly older than the
+    (timestamp, id) key before. Segments are read newest first and only
+    until none can hold an entry newer than the oldest one kept.
+    """
+    hot = ActivityLog.objects.filter(user=user)
+    segments = ActivityArchive.objects.filter(user=user)
+    if before is not None:
+        timestamp, pk = before
+        hot = hot.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=pk))
+        segments = segments.filter(first_timestamp__lte=timestamp)
+    
+    entries = list(hot.order_by('-timestamp', '-id')[:limit])
+    for entry in entries:
+        entry.user = user
+    for segment in segments.order_by('-last_timestamp').iterator(chunk_size=10):
+        if len(entries) >= limit and segment.last_timestamp < entries[-1].timestamp:
+            break
+        for row in decode_segment(segment.data):
+            entry = archived_entry(user, row)
+            if before is None or history_key(entry) < before:
+                entries.append(entry)
+        entries.sort(key=history_key, reverse=True)
+        del entries[limit:]
+    return entries
+
+# History cursors
+
+def encode_cursor(entry):
+    key = f'{entry.timestamp.isoformat()}|{entry.id}'
+    return base64.urlsafe_b64encode(key.encode()).decode()
+
+def decode_cursor(cursor):
+    """(timestamp, id) key of a history cursor; raises ValueError"""
+    try:
+        timestamp, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        timestamp = parse_datetime(timestamp)
+        if timestamp is None:
+            raise ValueError(cursor)
+        return timestamp, uuid.UUID(pk)
+    except (TypeError, ValueError) as e:
+        raise ValueError(cursor) from e
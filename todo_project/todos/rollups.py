@@ -0,0 +1,164 @@
+# todos/rollups.py
+
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import DailyStats, Todo, User
+
+COUNTERS = ('created', 'completed', 'completion_seconds', 'due_open', 'archived_open')
+
+def local_date(value):
+    """Date of an aware datetime in the rollup timezone (settings.TIME_ZONE)"""
+    return timezone.localtime(value, timezone.get_default_timezone()).date()
+
+def contributions(snapshot):
+    """{(user_id, date, category_id): {counter: n}} that one todo state adds"""
+    result = defaultdict(lambda: defaultdict(int))
+    if snapshot is None:
+        return result
+    
+    user_id, category_id = snapshot['user_id'], snapshot['category_id']
+    created_at, completed_at = snapshot['created_at'], snapshot['completed_at']
+    if created_at:
+        key = (user_id, local_date(created_at), category_id)
+        result[key]['created'] += 1
+        if snapshot['is_archived'] and not snapshot['completed']:
+            result[key]['archived_open'] += 1
+    if snapshot['completed'] and completed_at:
+        key = (user_id, local_date(completed_at), category_id)
+        result[key]['completed'] += 1
+        if created_at:
+            result[key]['completion_seconds'] += max(0, int((completed_at - created_at).total_seconds()))
+    elif not snapshot['completed'] and snapshot['due_date']:
+        result[(user_id, local_date(snapshot['due_date']), category_id)]['due_open'] += 1
+    return result
+
+# Changes collected by an open batched() block on this thread
+_batch = threading.local()
+
+@contextmanager
+def batched():
+    """
+    Collect the apply_changes() calls made inside the block, e.g. by the
+    delete signals of a bulk delete, and apply them together on exit
+    """
+    if getattr(_batch, 'changes', None) is not None:
+        yield
+        return
+    _batch.changes = []
+    try:
+        yield
+        changes = _batch.changes
+    finally:
+        _batch.changes = None
+    apply_changes(changes)
+
+def apply_changes(changes):
+    """
+    Apply the rollup deltas of (old snapshot, new snapshot) pairs, where
+    None stands for a todo that does not exist (yet or any more). Deltas are
+    merged per row first, so a batch costs one UPDATE (or INSERT) per
+    touched (user, day, category), not per todo.
+    """
+    pending = getattr(_batch, 'changes', None)
+    if pending is not None:
+        pending.extend(changes)
+        return
+    
+    deltas = defaultdict(lambda: defaultdict(int))
+    for old, new in changes:
+        for snapshot, sign in ((old, -1), (new, 1)):
+            for key, counters in contributions(snapshot).items():
+                for counter, value in counters.items():
+                    deltas[key][counter] += sign * value
+    
+    with transaction.atomic():
+        for (user_id, date, category_id), counters in deltas.items():
+            counters = {counter: value for counter, value in counters.items() if value}
+            if counters:
+                add(user_id, date, category_id, counters)
+
+def add(user_id, date, category_id, counters):
+    """Add counters to the (user, date, category) row, creating it if needed"""
+    row = DailyStats.objects.filter(user_id=user_id, date=date, category_id=category_id)
+    increments = {counter: F(counter) + value for counter, value in counters.items()}
+    if row.update(**increments):
+        return
+    try:
+        with transaction.atomic():
+            DailyStats.objects.create(user_id=user_id, date=date, category_id=category_id, **counters)
+    except IntegrityError:
+        # Another transaction created the row since the UPDATE
+        row.update(**increments)
+
+def fold_category(category_id):
+    """Move the rows of a category being deleted onto the uncategorized rows its todos fall back to"""
+    rows = DailyStats.objects.filter(category_id=category_id)
+    with transaction.atomic():
+        for row in rows.values('user_id', 'date', *COUNTERS):
+            counters = {counter: row[counter] for counter in COUNTERS if row[counter]}
+            if counters:
+                add(row['user_id'], row['date'], None, counters)
+        rows.delete()
+
+def snapshots(todos):
+    """Stored rollup state of every todo in a queryset, in one query"""
+    return list(todos.order_by().values(*Todo.STATS_FIELDS))
+
+def rebuild(user_ids=None, chunk_size=500):
+    """
+    Recompute the rollup from the todo table, for user_ids or everyone, in
+    chunks of users with four grouped queries per chunk
+    """
+    users = User.objects.order_by('pk').values_list('pk', flat=True)
+    if user_ids is not None:
+        users = users.filter(pk__in=user_ids)
+    users = list(users)
+    tz = timezone.get_default_timezone()
+    
+    for start in range(0, len(users), chunk_size):
+        chunk = users[start:start + chunk_size]
+        todos = Todo.objects.filter(user_id__in=chunk).order_by()
+        rows = defaultdict(lambda: defaultdict(int))
+        
+        created = todos.annotate(day=TruncDate('created_at', tzinfo=tz)).values(
+            'user_id', 'day', 'category_id'
+        ).annotate(total=Count('id'))
+        for row in created:
+            rows[(row['user_id'], row['day'], row['category_id'])]['created'] = row['total']
+        
+        completed = todos.filter(completed=True, completed_at__isnull=False).annotate(
+            day=TruncDate('completed_at', tzinfo=tz)
+        ).values('user_id', 'day', 'category_id').annotate(
+            total=Count('id'), duration=Sum(F('completed_at') - F('created_at'))
+        )
+        for row in completed:
+            counters = rows[(row['user_id'], row['day'], row['category_id'])]
+            counters['completed'] = row['total']
+            counters['completion_seconds'] = max(0, int(row['duration'].total_seconds())) if row['duration'] else 0
+        
+        due = todos.filter(completed=False, due_date__isnull=False).annotate(
+            day=TruncDate('due_date', tzinfo=tz)
+        ).values('user_id', 'day', 'category_id').annotate(total=Count('id'))
+        for row in due:
+            rows[(row['user_id'], row['day'], row['category_id'])]['due_open'] = row['total']
+        
+        archived = todos.filter(completed=False, is_archived=True).annotate(
+            day=TruncDate('created_at', tzinfo=tz)
+        ).values('user_id', 'day', 'category_id').annotate(total=Count('id'))
+        for row in archived:
+            rows[(row['user_id'], row['day'], row['category_id'])]['archived_open'] = row['total']
+        
+        with transaction.atomic():
+            DailyStats.objects.filter(user_id__in=chunk).delete()
+            DailyStats.objects.bulk_create([
+                DailyStats(user_id=user_id, date=date, category_id=category_id, **counters)
+                for (user_id, date, category_id), counters in rows.items()
+            ], batch_size=1000)
+    return len(users)
@@ -0,0 +1,183 @@
+# todos/search.py
+
+import re
+
+from django.db import connection
+from django.db.models import Case, CharField, FloatField, Q, Value, When
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+
+from .models import Todo, TodoComment, TodoSearchDocument
+
+FTS_TABLE = 'todos_todo_fts'
+DOCUMENT_TABLE = TodoSearchDocument._meta.db_table
+
+# Relevance weight of each indexed column, in FTS column order
+WEIGHTS = {'title': 10.0, 'description': 5.0, 'tags': 2.0, 'comments': 1.0}
+
+SNIPPET_START = '<mark>'
+SNIPPET_END = '</mark>'
+SNIPPET_WORDS = 12
+
+# What FTS5 wraps matches in: control characters escape() leaves alone,
+# swapped for the markup once the rest of the snippet is escaped
+MATCH_START = '\x02'
+MATCH_END = '\x03'
+
+# Database name -> whether it has the FTS5 index, checked once per process
+_fts_tables = {}
+
+def fts_enabled():
+    """True if the FTS5 index exists on the default database"""
+    if connection.vendor != 'sqlite':
+        return False
+    name = connection.settings_dict['NAME']
+    if name not in _fts_tables:
+        _fts_tables[name] = FTS_TABLE in connection.introspection.table_names()
+    return _fts_tables[name]
+
+# Indexing
+
+def document_fields(todo):
+    """Search text for a todo's own fields"""
+    tags = todo.tags if isinstance(todo.tags, list) else []
+    return {
+        'title': todo.title,
+        'description': todo.description,
+        'tags': ' '.join(str(tag) for tag in tags),
+    }
+
+def index_todo(todo):
+    """Create or refresh the search document for todo"""
+    TodoSearchDocument.objects.update_or_create(todo=todo, defaults=document_fields(todo))
+
+def index_comments(todo_id):
+    """Refresh the comment text of a todo's search document"""
+    comments = ' '.join(
+        TodoComment.objects.filter(todo_id=todo_id).order_by('created_at').values_list('comment', flat=True)
+    )
+    if not TodoSearchDocument.objects.filter(todo_id=todo_id).update(comments=comments):
+        todo = Todo.objects.filter(pk=todo_id).first()
+        if todo is not None:
+            TodoSearchDocument.objects.create(todo=todo, comments=comments, **document_fields(todo))
+
+def index_tags(todos):
+    """Refresh the tag text of many todos' search documents at once"""
+    tags = {todo.pk: document_fields(todo)['tags'] for todo in todos}
+    documents = list(TodoSearchDocument.objects.filter(todo_id__in=tags))
+    for document in documents:
+        document.tags = tags[document.todo_id]
+    TodoSearchDocument.objects.bulk_update(documents, ['tags'])
+
+def index_todos(todos, batch_size=500):
+    """Create search documents for new todos, e.g. after bulk_create"""
+    TodoSearchDocument.objects.bulk_create(
+        [TodoSearchDocument(todo=todo, **document_fields(todo)) for todo in todos],
+        batch_size=batch_size
+    )
+
+def rebuild_index(chunk_size=1000):
+    """Recreate every search document from scratch"""
+    TodoSearchDocument.objects.all().delete()
+    todos = Todo.objects.order_by().prefetch_related('comments').iterator(chunk_size=chunk_size)
+    batch = []
+    for todo in todos:
+        comments = ' '.join(comment.comment for comment in todo.comments.all())
+        batch.append(TodoSearchDocument(todo=todo, comments=comments, **document_fields(todo)))
+        if len(batch) >= chunk_size:
+            TodoSearchDocument.objects.bulk_create(batch)
+            batch = []
+    TodoSearchDocument.objects.bulk_create(batch)
+    if fts_enabled():
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+
+# Querying
+
+def parse_terms(query):
+    """Words of a free-text query, lowercased, without FTS syntax"""
+    return [term.lower() for term in re.findall(r'\w+', query)]
+
+def search_todos(queryset, query):
+    """
+    Filter queryset to todos matching every term of query (each as a
+    prefix), annotated with search_rank (higher is better) and
+    search_snippet (raw text, rendered with highlight()) and ordered by
+    relevance. Uses the FTS5 index when available and plain ORM lookups
+    otherwise, where search_snippet is None and make_snippet() builds one
+    in Python.
+    """
+    terms = parse_terms(query)
+    if not terms:
+        return queryset
+    
+    if fts_enabled():
+        return _search_fts(queryset, terms)
+    return _search_orm(queryset, terms)
+
+def _search_fts(queryset, terms):
+    match = ' '.join(f'"{term}"*' for term in terms)
+    document = f"SELECT id FROM {DOCUMENT_TABLE} WHERE todo_id = {Todo._meta.db_table}.id"
+    weights = ', '.join(str(weight) for weight in WEIGHTS.values())
+    
+    matching = RawSQL(
+        f"SELECT d.todo_id FROM {FTS_TABLE} f JOIN {DOCUMENT_TABLE} d ON d.id = f.rowid "
+        f"WHERE {FTS_TABLE} MATCH %s",
+        [match]
+    )
+    rank = RawSQL(
+        f"SELECT -bm25({FTS_TABLE}, {weights}) FROM {FTS_TABLE} "
+        f"WHERE {FTS_TABLE} MATCH %s AND rowid = ({document})",
+        [match],
+        output_field=FloatField()
+    )
+    snippet = RawSQL(
+        f"SELECT snippet({FTS_TABLE}, -1, %s, %s, '…', %s) FROM {FTS_TABLE} "
+        f"WHERE {FTS_TABLE} MATCH %s AND rowid = ({document})",
+        [MATCH_START, MATCH_END, SNIPPET_WORDS, match],
+        output_field=CharField()
+    )
+    return queryset.filter(pk__in=matching).annotate(
+        search_rank=rank, search_snippet=snippet
+    ).order_by('-search_rank', *Todo._meta.ordering)
+
+def _search_orm(queryset, terms):
+    condition = Q()
+    rank = Value(0.0)
+    for term in terms:
+        term_condition = Q()
+        for field, weight in WEIGHTS.items():
+            lookup = Q(**{f'search_document__{field}__icontains': term})
+            term_condition |= lookup
+            rank = rank + Case(When(lookup, then=Value(weight)), default=Value(0.0))
+        condition &= term_condition
+    return queryset.filter(condition).annotate(
+        search_rank=rank, search_snippet=Value(None, output_field=CharField())
+    ).order_by('-search_rank', *Todo._meta.ordering)
+
+def highlight(snippet):
+    """HTML of an FTS5 snippet: the text escaped, matches in <mark>"""
+    if snippet is None:
+        return None
+    return escape(snippet).replace(MATCH_START, SNIPPET_START).replace(MATCH_END, SNIPPET_END)
+
+def make_snippet(todo, query):
+    """Highlighted, escaped excerpt of the todo's description or title around the first match"""
+    terms = parse_terms(query)
+    if not terms:
+        return None
+    pattern = re.compile('|'.join(re.escape(term) for term in terms), re.IGNORECASE)
+    
+    for text in (todo.description, todo.title):
+        words = text.split()
+        for index, word in enumerate(words):
+            if pattern.search(word):
+                start = max(0, index - SNIPPET_WORDS // 2)
+                window = words[start:start + SNIPPET_WORDS]
+                excerpt = ' '.join(
+                    f'{SNIPPET_START}{escape(w)}{SNIPPET_END}' if pattern.search(w) else escape(w) for w in window
+                )
+                prefix = '…' if start > 0 else ''
+                suffix = '…' if start + SNIPPET_WORDS < len(words) else ''
+                return f'{prefix}{excerpt}{suffix}'
+    return None
@@ -2,30 +2,60 @@
 
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
+from django.db.models import Max
+from django.urls import reverse
 from .models import (
     Todo, Category, TodoComment, TodoAttachment, 
     ActivityLog, TodoTemplate, UserPreferences
 )
+from .search import highlight, make_snippet
+from .thumbnails import AVATAR_SIZES, PREVIEW_SIZES, is_image
 
 User = get_user_model()
 
-class UserSerializer(serializers.ModelSerializer):
-    """Serializer for User model"""
+def absolute_url(context, url):
+    request = context.get('request')
+    return request.build_absolute_uri(url) if request else url
+
+class UserSummarySerializer(serializers.ModelSerializer):
+    """
+    A user as embedded in todos, comments and activity. Other users' cached
+    payloads embed it, so it holds only fields whose changes invalidate
+    them (see signals.SUMMARY_FIELDS): no counts or private settings.
+    """
     full_name = serializers.SerializerMethodField()
+    avatar_urls = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = User
+        fields = ['id', 'username', 'full_name', 'avatar_urls']
+        read_only_fields = fields
+    
+    def get_full_name(self, obj):
+        return obj.get_full_name() or obj.username
+    
+    def get_avatar_urls(self, obj):
+        """Thumbnail URLs by size; the digest in them changes with the avatar"""
+        if not obj.avatar or not obj.avatar_digest:
+            return None
+        return {
+            size: absolute_url(self.context, f"{reverse('user_avatar', args=[obj.pk, size])}?v={obj.avatar_digest[:12]}")
+            for size in AVATAR_SIZES
+        }
+    
+class UserSerializer(UserSummarySerializer):
+    """Serializer for User model"""
     todo_count = serializers.SerializerMethodField()
     
     class Meta:
         model = User
         fields = [
             'id', 'username', 'email', 'first_name', 'last_name',
-            'full_name', 'avatar', 'bio', 'theme_preference',
+            'full_name', 'avatar', 'avatar_urls', 'bio', 'theme_preference',
             'notification_enabled', 'date_joined', 'todo_count'
         ]
         read_only_fields = ['id', 'date_joined', 'todo_count']
     
-    def get_full_name(self, obj):
-        return obj.get_full_name() or obj.username
-    
     def get_todo_count(self, obj):
         return obj.todos.filter(is_archived=False).count()
 
@@ -63,6 +93,14 @@ class UserUpdateSerializer(serializers.ModelSerializer):
         fields = ['first_name', 'last_name', 'email', 'bio', 
                  'avatar', 'theme_preference', 'notification_enabled']
 
+class CategorySummarySerializer(serializers.ModelSerializer):
+    """A category as embedded in todos, which the users it is shared with see too"""
+    
+    class Meta:
+        model = Category
+        fields = ['id', 'name', 'color', 'icon']
+        read_only_fields = fields
+
 class CategorySerializer(serializers.ModelSerializer):
     """Serializer for Category model"""
     todo_count = serializers.SerializerMethodField()
@@ -73,11 +111,13 @@ class CategorySerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at', 'todo_count']
     
     def get_todo_count(self, obj):
+        if hasattr(obj, 'num_todos'):
+            return obj.num_todos
         return obj.todo_set.filter(is_archived=False).count()
 
 class TodoCommentSerializer(serializers.ModelSerializer):
     """Serializer for TodoComment model"""
-    user = UserSerializer(read_only=True)
+    user = UserSummarySerializer(read_only=True)
     
     class Meta:
         model = TodoComment
@@ -86,33 +126,64 @@ class TodoCommentSerializer(serializers.ModelSerializer):
 
 class TodoAttachmentSerializer(serializers.ModelSerializer):
     """Serializer for TodoAttachment model"""
-    uploaded_by = UserSerializer(read_only=True)
+    uploaded_by = UserSummarySerializer(read_only=True)
     file_url = serializers.SerializerMethodField()
+    preview_urls = serializers.SerializerMethodField()
     
     class Meta:
         model = TodoAttachment
-        fields = ['id', 'file', 'file_url', 'filename', 'file_size', 
+        fields = ['id', 'file', 'file_url', 'preview_urls', 'filename', 'file_size', 
                  'uploaded_at', 'uploaded_by']
         read_only_fields = ['id', 'uploaded_at', 'uploaded_by']
     
     def get_file_url(self, obj):
-        request = self.context.get('request')
-        if request and obj.file:
-            return request.build_absolute_uri(obj.file.url)
-        return None
+        # Files are served through the access-checked download view, not MEDIA_URL
+        return absolute_url(self.context, reverse('attachment_download', args=[obj.pk]))
+    
+    def get_preview_urls(self, obj):
+        """Preview URLs by size for images"""
+        if not obj.blob_id or not is_image(obj.filename):
+            return None
+        return {size: absolute_url(self.context, reverse('attachment_preview', args=[obj.pk, size])) for size in PREVIEW_SIZES}
+
+class TodoListSerializer(serializers.ListSerializer):
+    """
+    List serializer that loads the subtask trees of the whole page up front
+    in one query (plus its prefetches) instead of one query per todo.
+    Pass subtask_depth in the context to limit how many levels are loaded.
+    """
+    
+    def to_representation(self, data):
+        todos = list(data.all() if hasattr(data, 'all') else data)
+        context = self.context
+        if 'subtask_map' not in context:
+            context['subtask_map'] = load_subtask_map(todos, context.get('subtask_depth'))
+        return super().to_representation(todos)
+
+def load_subtask_map(todos, max_depth=None):
+    """Map todo id -> list of subtasks for todos and their loaded descendants"""
+    subtask_map = {todo.pk: [] for todo in todos}
+    if max_depth == 0:
+        return subtask_map
+    descendants = Todo.objects.descendants_of(todos, max_depth).with_list_data()
+    for child in descendants.order_by('depth', *Todo._meta.ordering):
+        subtask_map.setdefault(child.parent_todo_id, []).append(child)
+        subtask_map.setdefault(child.pk, [])
+    return subtask_map
 
 class TodoSerializer(serializers.ModelSerializer):
     """Serializer for Todo model"""
-    user = UserSerializer(read_only=True)
-    category = CategorySerializer(read_only=True)
+    user = UserSummarySerializer(read_only=True)
+    category = CategorySummarySerializer(read_only=True)
     category_id = serializers.UUIDField(write_only=True, required=False, allow_null=True)
-    shared_with = UserSerializer(many=True, read_only=True)
+    shared_with = UserSummarySerializer(many=True, read_only=True)
     shared_with_ids = serializers.ListField(
         child=serializers.IntegerField(),
         write_only=True,
         required=False
     )
     subtasks = serializers.SerializerMethodField()
+    subtree_count = serializers.SerializerMethodField()
     comment_count = serializers.SerializerMethodField()
     attachment_count = serializers.SerializerMethodField()
     is_overdue = serializers.SerializerMethodField()
@@ -127,21 +198,36 @@ class TodoSerializer(serializers.ModelSerializer):
             'shared_with_ids', 'is_recurring', 'recurrence_pattern',
             'recurrence_end_date', 'tags', 'estimated_minutes',
             'actual_minutes', 'reminder_date', 'reminder_sent',
-            'subtasks', 'comment_count', 'attachment_count', 'is_overdue'
+            'subtasks', 'subtree_count', 'comment_count', 'attachment_count',
+            'is_overdue'
         ]
         read_only_fields = [
             'id', 'user', 'created_at', 'updated_at', 'completed_at',
-            'subtasks', 'comment_count', 'attachment_count', 'is_overdue'
+            'subtasks', 'subtree_count', 'comment_count', 'attachment_count',
+            'is_overdue'
         ]
+        list_serializer_class = TodoListSerializer
     
     def get_subtasks(self, obj):
-        subtasks = obj.subtasks.all()
-        return TodoSerializer(subtasks, many=True, read_only=True).data
+        subtask_map = self.context.get('subtask_map')
+        if subtask_map is None or obj.pk not in subtask_map:
+            subtask_map = load_subtask_map([obj], self.context.get('subtask_depth'))
+            self.context['subtask_map'] = subtask_map
+        return TodoSerializer(subtask_map[obj.pk], many=True, read_only=True, context=self.context).data
+    
+    def get_subtree_count(self, obj):
+        if hasattr(obj, 'num_descendants'):
+            return obj.num_descendants
+        return Todo.objects.subtree_of(obj).exclude(pk=obj.pk).count()
     
     def get_comment_count(self, obj):
+        if hasattr(obj, 'num_comments'):
+            return obj.num_comments
         return obj.comments.count()
     
     def get_attachment_count(self, obj):
+        if hasattr(obj, 'num_attachments'):
+            return obj.num_attachments
         return obj.attachments.count()
     
     def get_is_overdue(self, obj):
@@ -150,6 +236,32 @@ class TodoSerializer(serializers.ModelSerializer):
             return obj.due_date < timezone.now()
         return False
     
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if hasattr(instance, 'search_rank'):
+            snippet = highlight(instance.search_snippet)
+            request = self.context.get('request')
+            if snippet is None and request is not None:
+                snippet = make_snippet(instance, request.query_params.get('search', ''))
+            data['search_rank'] = instance.search_rank
+            data['search_snippet'] = snippet
+        return data
+    
+    def validate_parent_todo(self, value):
+        if value is None:
+            return value
+        
+        height = 0
+        if self.instance is not None:
+            if value.path.startswith(self.instance.path):
+                raise serializers.ValidationError("A todo cannot be moved under itself or its subtasks")
+            deepest = Todo.objects.subtree_of(self.instance).aggregate(Max('depth'))['depth__max']
+            height = deepest - self.instance.depth
+        
+        if value.depth + 1 + height > Todo.MAX_DEPTH:
+            raise serializers.ValidationError(f"Subtasks cannot be nested more than {Todo.MAX_DEPTH} levels deep")
+        return value
+    
     def create(self, validated_data):
         category_id = validated_data.pop('category_id', None)
         shared_with_ids = validated_data.pop('shared_with_ids', [])
@@ -177,6 +289,10 @@ class TodoSerializer(serializers.ModelSerializer):
         category_id = validated_data.pop('category_id', None)
         shared_with_ids = validated_data.pop('shared_with_ids', None)
         
+        # A rescheduled reminder is due to be sent again
+        if 'reminder_date' in validated_data and validated_data['reminder_date'] != instance.reminder_date:
+            validated_data.setdefault('reminder_sent', False)
+        
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
         
@@ -197,7 +313,7 @@ class TodoSerializer(serializers.ModelSerializer):
 
 class ActivityLogSerializer(serializers.ModelSerializer):
     """Serializer for ActivityLog model"""
-    user = UserSerializer(read_only=True)
+    user = UserSummarySerializer(read_only=True)
     
     class Meta:
         model = ActivityLog
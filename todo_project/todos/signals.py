@@ -0,0 +1,315 @@
+# todos/signals.py
+
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import attachments, caching, events, recurrence, rollups, search, storage, sync, thumbnails
+from .tags import sync_todo_tags
+from .models import ActivityLog, AttachmentUpload, Category, Todo, TodoAttachment, TodoComment, User
+
+def deleting_todos(origin):
+    """True if a delete was started from a todo, so its rows are going away too"""
+    return isinstance(origin, Todo) or getattr(origin, 'model', None) is Todo
+
+@receiver(post_save, sender=Todo)
+def index_todo(sender, instance, raw=False, **kwargs):
+    """Keep the search document in step with the todo"""
+    if not raw:
+        search.index_todo(instance)
+
+@receiver(post_save, sender=Todo)
+def index_todo_tags(sender, instance, raw=False, **kwargs):
+    """Keep the normalized tag index in step with Todo.tags"""
+    if not raw:
+        sync_todo_tags(instance)
+
+@receiver(pre_save, sender=Todo)
+def load_stats_snapshot(sender, instance, raw=False, **kwargs):
+    """Fetch the stored state of todos that were not loaded with all stats fields"""
+    if raw or instance._state.adding or getattr(instance, 'stats_snapshot', None):
+        return
+    instance.stats_snapshot = Todo.objects.filter(pk=instance.pk).values(*Todo.STATS_FIELDS).first()
+
+@receiver(post_save, sender=Todo)
+def update_daily_stats(sender, instance, created, raw=False, **kwargs):
+    """Move the todo's contribution to the daily stats rollup"""
+    if raw:
+        return
+    old = None if created else getattr(instance, 'stats_snapshot', None)
+    new = instance.get_stats_snapshot()
+    rollups.apply_changes([(old, new)])
+    instance.stats_snapshot = new
+
+@receiver(post_delete, sender=Todo)
+def remove_daily_stats(sender, instance, **kwargs):
+    """Take a deleted todo out of the daily stats rollup"""
+    old = getattr(instance, 'stats_snapshot', None) or instance.get_stats_snapshot()
+    rollups.apply_changes([(old, None)])
+
+@receiver(pre_delete, sender=Category)
+def fold_category_stats(sender, instance, **kwargs):
+    """Count the todos of a deleted category as uncategorized, as they become"""
+    rollups.fold_category(instance.pk)
+
+@receiver(post_save, sender=TodoComment)
+@receiver(post_delete, sender=TodoComment)
+def index_todo_comments(sender, instance, raw=False, origin=None, **kwargs):
+    """Refresh the comment text searched for the comment's todo"""
+    if raw or deleting_todos(origin):
+        return
+    search.index_comments(instance.todo_id)
+
+def todo_audience(todo_id):
+    """Ids of the users who see a todo: its owner and everyone it is shared with"""
+    owner = Todo.objects.filter(pk=todo_id).values_list('user_id', flat=True)
+    shared = Todo.shared_with.through.objects.filter(todo_id=todo_id).values_list('user_id', flat=True)
+    return [*owner, *shared]
+
+def todos_audience(todos):
+    """Ids of the users who see any of todos, a queryset of todo pks"""
+    owners = Todo.objects.filter(pk__in=todos).order_by().values_list('user_id', flat=True).distinct()
+    shared = Todo.shared_with.through.objects.filter(todo_id__in=todos).values_list('user_id', flat=True).distinct()
+    return {*owners, *shared}
+
+@receiver(pre_delete, sender=Todo)
+def load_todo_audience(sender, instance, **kwargs):
+    """Remember who sees the todo before its sharing rows are deleted with it"""
+    if instance.is_shared:
+        instance.audience = todo_audience(instance.pk)
+
+@receiver(post_save, sender=Todo)
+@receiver(post_delete, sender=Todo)
+def bump_todo_cache_version(sender, instance, raw=False, **kwargs):
+    """Invalidate cached data and validators of everyone who sees the todo"""
+    if raw:
+        return
+    users = [instance.user_id]
+    if instance.is_shared:
+        users += getattr(instance, 'audience', None) or todo_audience(instance.pk)
+    caching.bump_version(*users)
+
+@receiver(m2m_changed, sender=Todo.shared_with.through)
+def bump_sharing_cache_version(sender, instance, action, pk_set=None, **kwargs):
+    """Sharing or unsharing changes the todo lists of the users involved"""
+    if action == 'pre_clear' and isinstance(instance, Todo):
+        caching.bump_version(instance.user_id, *instance.shared_with.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove') and isinstance(instance, Todo):
+        caching.bump_version(instance.user_id, *(pk_set or ()))
+
+@receiver(post_save, sender=TodoComment)
+@receiver(post_delete, sender=TodoComment)
+@receiver(post_save, sender=TodoAttachment)
+@receiver(post_delete, sender=TodoAttachment)
+def bump_todo_detail_cache_version(sender, instance, raw=False, origin=None, **kwargs):
+    """Comment and attachment counts are part of the todo payload"""
+    if raw or deleting_todos(origin):
+        return
+    caching.bump_version(*todo_audience(instance.todo_id))
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=ActivityLog)
+@receiver(post_delete, sender=ActivityLog)
+def bump_cache_version(sender, instance, raw=False, **kwargs):
+    """Invalidate the owner's cached statistics and activity feed"""
+    if not raw:
+        caching.bump_version(instance.user_id)
+
+@receiver(post_save, sender=Category)
+@receiver(pre_delete, sender=Category)
+def bump_category_audience_cache_version(sender, instance, raw=False, created=False, **kwargs):
+    """Shared todos embed their category, so its users see the change too"""
+    if raw or created:
+        return
+    shared = Todo.shared_with.through.objects.filter(todo__category=instance)
+    caching.bump_version(*shared.values_list('user_id', flat=True).distinct())
+
+# User fields shown by UserSummarySerializer, which other users' payloads embed
+SUMMARY_FIELDS = {'username', 'first_name', 'last_name', 'avatar', 'avatar_digest'}
+
+@receiver(post_save, sender=User)
+def bump_user_cache_version(sender, instance, raw=False, created=False, update_fields=None, **kwargs):
+    """
+    Profile changes invalidate the user's own payloads and, when they touch
+    SUMMARY_FIELDS, those of everyone who sees a todo the user owns, is
+    shared, commented on or attached a file to
+    """
+    if raw:
+        return
+    users = {instance.pk}
+    if not created and (update_fields is None or SUMMARY_FIELDS & set(update_fields)):
+        involved = Todo.objects.filter(
+            Q(user=instance, is_shared=True)
+            | Q(pk__in=Todo.shared_with.through.objects.filter(user=instance).values('todo_id'))
+            | Q(pk__in=TodoComment.objects.filter(user=instance).values('todo_id'))
+            | Q(pk__in=TodoAttachment.objects.filter(uploaded_by=instance).values('todo_id'))
+        ).order_by().values('pk')
+        users |= todos_audience(involved)
+    caching.bump_version(*users)
+
+# Delta sync change log
+
+@receiver(pre_save, sender=Todo)
+def load_sync_category(sender, instance, raw=False, **kwargs):
+    """Remember the stored category, whose todo count changes if the todo leaves it"""
+    if not raw:
+        instance.previous_category_id = (getattr(instance, 'stats_snapshot', None) or {}).get('category_id')
+
+@receiver(post_save, sender=Todo)
+@receiver(post_delete, sender=Todo)
+def record_todo_change(sender, instance, raw=False, created=False, signal=None, **kwargs):
+    """Log the todo for everyone who sees it, with the category and ancestors counting it"""
+    if raw:
+        return
+    deleted = signal is post_delete
+    users = [instance.user_id]
+    if instance.is_shared:
+        users += getattr(instance, 'audience', None) or todo_audience(instance.pk)
+    sync.record(users, 'todo', [instance.pk], deleted=deleted)
+    if created or deleted:
+        sync.record_todos(sync.ancestor_ids(instance))
+    categories = {instance.category_id, getattr(instance, 'previous_category_id', None)}
+    sync.record([instance.user_id], 'category', [pk for pk in categories if pk])
+
+@receiver(m2m_changed, sender=Todo.shared_with.through)
+def record_sharing_change(sender, instance, action, pk_set=None, **kwargs):
+    """Newly shared users get the todo, unshared ones a tombstone"""
+    if not isinstance(instance, Todo):
+        return
+    if action == 'post_add':
+        sync.record(pk_set or (), 'todo', [instance.pk])
+    elif action == 'post_remove':
+        sync.record(pk_set or (), 'todo', [instance.pk], deleted=True)
+    elif action == 'pre_clear':
+        sync.record(instance.shared_with.values_list('pk', flat=True), 'todo', [instance.pk], deleted=True)
+    if action in ('post_add', 'post_remove', 'pre_clear'):
+        sync.record([instance.user_id], 'todo', [instance.pk])
+
+@receiver(post_save, sender=TodoComment)
+@receiver(post_delete, sender=TodoComment)
+def record_comment_change(sender, instance, raw=False, origin=None, signal=None, **kwargs):
+    """Log the comment and its todo, whose comment count changed"""
+    if raw or deleting_todos(origin):
+        return
+    sync.record(todo_audience(instance.todo_id), 'comment', [instance.pk], deleted=signal is post_delete)
+    sync.record_todos([instance.todo_id])
+
+@receiver(post_save, sender=TodoAttachment)
+@receiver(post_delete, sender=TodoAttachment)
+def record_attachment_change(sender, instance, raw=False, origin=None, **kwargs):
+    """Attachment counts are part of the todo payload"""
+    if not raw and not deleting_todos(origin):
+        sync.record_todos([instance.todo_id])
+
+@receiver(pre_delete, sender=Category)
+def load_category_todos(sender, instance, **kwargs):
+    """Remember the todos that lose the category when it is deleted"""
+    instance.todo_ids = list(instance.todo_set.values_list('pk', flat=True))
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def record_category_change(sender, instance, raw=False, signal=None, **kwargs):
+    """Log the category and the todos that embed it"""
+    if raw:
+        return
+    sync.record([instance.user_id], 'category', [instance.pk], deleted=signal is post_delete)
+    todo_ids = getattr(instance, 'todo_ids', None)
+    if todo_ids is None:
+        todo_ids = instance.todo_set.values_list('pk', flat=True)
+    sync.record_todos(todo_ids)
+
+# Push events
+
+def todo_event(instance):
+    return {'id': instance.pk, 'user_id': instance.user_id, 'title': instance.title}
+
+@receiver(post_save, sender=Todo)
+@receiver(post_delete, sender=Todo)
+def publish_todo_event(sender, instance, raw=False, created=False, signal=None, **kwargs):
+    """Tell everyone who sees the todo that it was created, updated or deleted"""
+    if raw:
+        return
+    users = [instance.user_id]
+    if instance.is_shared:
+        users += getattr(instance, 'audience', None) or todo_audience(instance.pk)
+    action = 'deleted' if signal is post_delete else 'created' if created else 'updated'
+    events.publish(users, f'todo.{action}', **todo_event(instance))
+
+@receiver(m2m_changed, sender=Todo.shared_with.through)
+def publish_sharing_event(sender, instance, action, pk_set=None, **kwargs):
+    """Tell the owner and the users involved about sharing changes"""
+    if not isinstance(instance, Todo):
+        return
+    if action == 'post_add':
+        users, event = pk_set or (), 'todo.shared'
+    elif action == 'post_remove':
+        users, event = pk_set or (), 'todo.unshared'
+    elif action == 'pre_clear':
+        users, event = list(instance.shared_with.values_list('pk', flat=True)), 'todo.unshared'
+    else:
+        return
+    if users:
+        events.publish(
+            [instance.user_id, *todo_audience(instance.pk), *users], event,
+            shared_with=sorted(users), **todo_event(instance)
+        )
+
+@receiver(post_save, sender=TodoComment)
+@receiver(post_delete, sender=TodoComment)
+def publish_comment_event(sender, instance, raw=False, created=False, origin=None, signal=None, **kwargs):
+    """Tell everyone who sees the todo about its comments"""
+    if raw or deleting_todos(origin):
+        return
+    action = 'deleted' if signal is post_delete else 'created' if created else 'updated'
+    events.publish(
+        todo_audience(instance.todo_id), f'comment.{action}',
+        id=instance.pk, todo_id=instance.todo_id, user_id=instance.user_id
+    )
+
+# Attachment files
+
+@receiver(post_delete, sender=TodoAttachment)
+def release_attachment_file(sender, instance, **kwargs):
+    """Drop the attachment's reference to its blob; files from before blobs are deleted once it is gone"""
+    if instance.blob_id:
+        storage.release(instance.blob_id)
+    elif instance.file:
+        name = instance.file.name
+        transaction.on_commit(lambda: storage.blob_storage.delete(name))
+
+@receiver(post_delete, sender=AttachmentUpload)
+def delete_upload_part(sender, instance, **kwargs):
+    """Remove what an abandoned or finished upload left behind"""
+    path = attachments.part_path(instance)
+    transaction.on_commit(lambda: attachments.remove_part(path))
+
+# Thumbnails
+
+@receiver(pre_save, sender=User)
+def hash_new_avatar(sender, instance, raw=False, **kwargs):
+    """Name the thumbnails of a newly uploaded avatar by its content"""
+    if raw:
+        return
+    if not instance.avatar:
+        instance.avatar_digest = ''
+    elif not instance.avatar._committed:
+        instance.avatar_digest = thumbnails.hash_file(instance.avatar)
+        instance.render_avatar = True
+
+@receiver(post_save, sender=User)
+def render_avatar_thumbnails(sender, instance, raw=False, **kwargs):
+    """Render the thumbnails of a new avatar in the background"""
+    if not raw and getattr(instance, 'render_avatar', False):
+        instance.render_avatar = False
+        transaction.on_commit(lambda: thumbnails.schedule_avatar(instance))
+
+# Recurrence
+
+@receiver(post_save, sender=Todo)
+def advance_recurring_todo(sender, instance, raw=False, **kwargs):
+    """Completing a recurring todo hands its series on to the next occurrence"""
+    if not raw and instance.completed and recurrence.is_series(instance):
+        recurrence.advance([instance.pk])
+        instance.is_recurring = False
@@ -0,0 +1,184 @@
+# todos/stats.py
+
+from datetime import datetime, time, timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import DailyStats, Todo
+
+# Dashboard windows, in days
+WINDOWS = (7, 30, 90, 365)
+
+def parse_timezone(tz=None):
+    """tzinfo for a ?tz= name, the current timezone without one; raises ValueError"""
+    if not tz:
+        return timezone.get_current_timezone()
+    try:
+        return ZoneInfo(tz)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"Unknown timezone: {tz}")
+
+def parse_window(days=None, tz=None):
+    """Validated (days, tzinfo) for the statistics window; raises ValueError"""
+    days = days or str(WINDOWS[0])
+    if not days.isdigit() or int(days) not in WINDOWS:
+        raise ValueError(f"days must be one of {', '.join(map(str, WINDOWS))}")
+    return int(days), parse_timezone(tz)
+
+def window_bounds(days, tz, now):
+    """First local day of the window and the aware [start, end) datetimes covering it"""
+    today = now.astimezone(tz).date()
+    first_day = today - timedelta(days=days - 1)
+    start = datetime.combine(first_day, time.min, tzinfo=tz)
+    end = datetime.combine(today + timedelta(days=1), time.min, tzinfo=tz)
+    return first_day, start, end
+
+def overview(user, now):
+    """
+    Totals and average completion time from the DailyStats rollup, plus the
+    open todos due earlier today, which a daily row cannot tell apart
+    """
+    today = timezone.localtime(now, timezone.get_default_timezone()).date()
+    today_start = datetime.combine(today, time.min, tzinfo=timezone.get_default_timezone())
+    # Aliases must not shadow the counter fields being summed
+    totals = DailyStats.objects.filter(user=user).aggregate(
+        num_created=Sum('created'),
+        num_completed=Sum('completed'),
+        num_archived_open=Sum('archived_open'),
+        num_due_before_today=Sum('due_open', filter=Q(date__lt=today)),
+        completion_seconds=Sum('completion_seconds'),
+    )
+    due_today = Todo.objects.filter(
+        user=user, completed=False, due_date__gte=today_start, due_date__lt=now
+    ).count()
+    total = totals['num_created'] or 0
+    completed = totals['num_completed'] or 0
+    return {
+        'total': total,
+        'completed': completed,
+        'active': total - completed - (totals['num_archived_open'] or 0),
+        'overdue': (totals['num_due_before_today'] or 0) + due_today,
+        'completion_rate': round(completed / total * 100, 1) if total else 0,
+        'avg_completion_time': (
+            timedelta(seconds=totals['completion_seconds'] / completed) if completed else None
+        ),
+    }
+
+def window_days(first_day, days):
+    return [first_day + timedelta(days=offset) for offset in range(days)]
+
+def activity_rows(days, created, completed, overdue):
+    return [{
+        'date': day.strftime('%Y-%m-%d'),
+        'day': day.strftime('%a'),
+        'created': created.get(day, 0),
+        'completed': completed.get(day, 0),
+        'overdue': overdue.get(day, 0)
+    } for day in days]
+
+def daily_counts(queryset, field, start, end, tz):
+    """{local date: count} of rows whose field falls in [start, end)"""
+    return dict(
+        queryset.filter(**{f'{field}__gte': start, f'{field}__lt': end}).order_by().annotate(
+            day=TruncDate(field, tzinfo=tz)
+        ).values('day').annotate(count=Count('id')).values_list('day', 'count')
+    )
+
+def live_activity(user, days, tz, now):
+    """
+    Histogram and category breakdown straight from the todo table: one
+    grouped range query per series plus one for categories
+    """
+    first_day, start, end = window_bounds(days, tz, now)
+    today_start = end - timedelta(days=1)
+    todos = Todo.objects.filter(user=user)
+    
+    created = daily_counts(todos, 'created_at', start, end, tz)
+    completed = daily_counts(todos.filter(completed=True), 'completed_at', start, end, tz)
+    overdue = daily_counts(todos.filter(completed=False), 'due_date', start, today_start, tz)
+    
+    in_window = Q(created_at__gte=start, created_at__lt=end)
+    completed_in_window = Q(completed=True, completed_at__gte=start, completed_at__lt=end)
+    categories = todos.filter(in_window | completed_in_window).order_by().values(
+        'category__name', 'category__color'
+    ).annotate(
+        total=Count('id', filter=in_window),
+        completed=Count('id', filter=completed_in_window)
+    )
+    return activity_rows(window_days(first_day, days), created, completed, overdue), list(categories)
+
+def rollup_activity(user, days, now):
+    """The same histogram and breakdown from the DailyStats rollup in two queries"""
+    first_day, _, _ = window_bounds(days, timezone.get_default_timezone(), now)
+    dates = window_days(first_day, days)
+    today = dates[-1]
+    rows = DailyStats.objects.filter(user=user, date__gte=first_day, date__lte=today).order_by()
+    
+    # Aliases must not shadow the counter fields being summed
+    per_day = rows.values('date').annotate(
+        num_created=Sum('created'), num_completed=Sum('completed'), num_due=Sum('due_open')
+    )
+    created, completed, overdue = {}, {}, {}
+    for row in per_day:
+        created[row['date']] = row['num_created']
+        completed[row['date']] = row['num_completed']
+        if row['date'] < today:
+            overdue[row['date']] = row['num_due']
+    
+    categories = [{
+        'category__name': row['category__name'],
+        'category__color': row['category__color'],
+        'total': row['num_created'],
+        'completed': row['num_completed']
+    } for row in rows.values('category__name', 'category__color').annotate(
+        num_created=Sum('created'), num_completed=Sum('completed')
+    ) if row['num_created'] or row['num_completed']]
+    return activity_rows(dates, created, completed, overdue), categories
+
+def uses_rollup(tz):
+    """The rollup is bucketed by day in settings.TIME_ZONE, so only serves that zone"""
+    return str(tz) == str(timezone.get_default_timezone())
+
+def compute_statistics(user, days, tz, now=None):
+    """
+    Dashboard statistics for user over the last days (local to tz). The
+    overview sums the user's DailyStats rows, plus one range query for what
+    fell overdue earlier today; the daily histogram and the category
+    breakdown for the window come from the DailyStats rollup (two queries
+    over at most days rows per category) when tz is the rollup's zone, and
+    from four grouped range queries on the todo table otherwise.
+    """
+    now = now or timezone.now()
+    totals = overview(user, now)
+    if uses_rollup(tz):
+        activity, categories = rollup_activity(user, days, now)
+    else:
+        activity, categories = live_activity(user, days, tz, now)
+    avg_completion_time = totals['avg_completion_time']
+    
+    return {
+        'overview': {
+            'total': totals['total'],
+            'completed': totals['completed'],
+            'active': totals['active'],
+            'overdue': totals['overdue'],
+            'completion_rate': totals['completion_rate']
+        },
+        'categories': categories,
+        'daily_activity': activity,
+        'productivity': {
+            'avg_completion_time': avg_completion_time.days if avg_completion_time else None,
+            'most_productive_day': max(activity, key=lambda x: x['completed'])['day'] if activity else None,
+            'avg_created_per_day': round(sum(d['created'] for d in activity) / days, 2),
+            'avg_completed_per_day': round(sum(d['completed'] for d in activity) / days, 2)
+        },
+        'window': {
+            'days': days,
+            'timezone': str(tz),
+            'start': activity[0]['date'],
+            'end': activity[-1]['date']
+        }
+    }
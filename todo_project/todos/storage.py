@@ -0,0 +1,208 @@
+# todos/storage.py
+
+import hashlib
+import os
+import tempfile
+import time
+
+from django.apps import apps
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, OuterRef, ProtectedError, Subquery, Value
+from django.db.models.functions import Coalesce
+
+# Content-addressed attachment storage. Every saved file is hashed (SHA-256)
+# while it is copied, or as it was received for uploads spooled to disk, and
+# stored once under blobs/<digest>; saving content that is already there
+# only adds a reference to its Blob row. References are dropped when
+# attachments are deleted and the last one removes the file. Placing a file
+# and referencing it happen in one transaction, as do dereferencing and
+# removing it, so a concurrent upload of the same content either keeps the
+# blob alive or recreates it. collect_garbage() repairs the counts and
+# removes files nothing refers to.
+
+BLOB_DIR = 'blobs'
+TMP_DIR = f'{BLOB_DIR}/tmp'
+
+# Bytes hashed at a time
+BLOCK_SIZE = 64 * 1024
+
+# Seconds a file without a Blob row is left alone, as it may belong to an
+# upload that has not committed yet
+ORPHAN_GRACE = 3600
+
+def blob_model():
+    return apps.get_model('todos', 'Blob')
+
+def blob_name(digest):
+    return f'{BLOB_DIR}/{digest[:2]}/{digest[2:4]}/{digest}'
+
+def is_blob(name):
+    return name.startswith(BLOB_DIR + '/') and not name.startswith(TMP_DIR + '/')
+
+def digest_of(name):
+    return os.path.basename(name)
+
+def hash_file(path):
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as file:
+        while block := file.read(BLOCK_SIZE):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+class HashingUploadHandler(TemporaryFileUploadHandler):
+    """Spools big uploads to disk like Django's handler, hashing them on the way"""
+    
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.hasher = hashlib.sha256()
+    
+    def receive_data_chunk(self, raw_data, start):
+        self.hasher.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+    
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        file.sha256 = self.hasher.hexdigest()
+        return file
+
+# References
+
+def reference(digest, size):
+    """Count one more reference to a blob, creating its row for new content; True if created"""
+    Blob = blob_model()
+    if Blob.objects.filter(pk=digest).update(ref_count=F('ref_count') + 1):
+        return False
+    try:
+        with transaction.atomic():
+            Blob.objects.create(digest=digest, size=size, ref_count=1)
+    except IntegrityError:
+        # Another upload of the same content created it meanwhile
+        Blob.objects.filter(pk=digest).update(ref_count=F('ref_count') + 1)
+        return False
+    return True
+
+def release(digest, count=1):
+    """Drop count references to a blob; the file goes once the last one is committed gone"""
+    blob_model().objects.filter(pk=digest).update(ref_count=F('ref_count') - count)
+    transaction.on_commit(lambda: collect([digest]))
+
+def collect(digests, storage=None):
+    """Delete the unreferenced of digests with their files; returns how many"""
+    storage = storage or blob_storage
+    deleted = 0
+    for digest in digests:
+        try:
+            with transaction.atomic():
+                if blob_model().objects.filter(pk=digest, ref_count__lte=0).delete()[0]:
+                    storage.remove(blob_name(digest))
+                    deleted += 1
+        except ProtectedError:
+            # Its count drifted below the rows referring to it; recount() repairs it
+            pass
+    return deleted
+
+class BlobStorage(FileSystemStorage):
+    """
+    Filesystem storage that names files by their content: save() returns
+    blobs/<digest> and counts a reference, never a second copy. Names
+    outside blobs/ (files saved before) are read and deleted as usual.
+    """
+    
+    def get_available_name(self, name, max_length=None):
+        # Stored names come from the content, so there is nothing to avoid
+        return name
+    
+    def spool(self, content):
+        """Copy content into a temporary file next to the blobs, hashing it; returns (path, digest)"""
+        directory = self.path(TMP_DIR)
+        os.makedirs(directory, exist_ok=True)
+        hasher = hashlib.sha256()
+        with tempfile.NamedTemporaryFile(dir=directory, delete=False) as spooled:
+            try:
+                for chunk in content.chunks():
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode()
+                    hasher.update(chunk)
+                    spooled.write(chunk)
+            except BaseException:
+                os.remove(spooled.name)
+                raise
+        return spooled.name, hasher.hexdigest()
+    
+    def _save(self, name, content):
+        if hasattr(content, 'temporary_file_path'):
+            # Already on disk: hash it unless the upload handler did, then move it
+            source, spooled = content.temporary_file_path(), False
+            digest = getattr(content, 'sha256', None) or hash_file(source)
+        else:
+            (source, digest), spooled = self.spool(content), True
+        
+        name = blob_name(digest)
+        target = self.path(name)
+        with transaction.atomic():
+            reference(digest, os.path.getsize(source))
+            if os.path.exists(target):
+                if spooled:
+                    os.remove(source)
+            else:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                file_move_safe(source, target, allow_overwrite=True)
+                if self.file_permissions_mode is not None:
+                    os.chmod(target, self.file_permissions_mode)
+        return name
+    
+    def delete(self, name):
+        """Drop a reference for blobs, delete other files"""
+        if is_blob(name):
+            release(digest_of(name))
+        else:
+            super().delete(name)
+    
+    def remove(self, name):
+        """Delete the file itself"""
+        super().delete(name)
+
+blob_storage = BlobStorage()
+
+# Garbage collection
+
+def recount(references):
+    """Set each blob's count to its rows among references, [(model, blob field)]; returns how many changed"""
+    Blob = blob_model()
+    total = Value(0)
+    for model, field in references:
+        counts = model.objects.filter(**{field: OuterRef('pk')}).order_by().values(field).annotate(n=Count('pk')).values('n')
+        total = total + Coalesce(Subquery(counts), 0)
+    return Blob.objects.exclude(ref_count=total).update(ref_count=total)
+
+def orphans(storage, grace=ORPHAN_GRACE):
+    """Names of blob files without a Blob row, and temporary files, older than grace seconds"""
+    root = storage.path(BLOB_DIR)
+    cutoff = time.time() - grace
+    candidates = []
+    for directory, _, files in os.walk(root):
+        for filename in files:
+            path = os.path.join(directory, filename)
+            if os.path.getmtime(path) < cutoff:
+                candidates.append(os.path.relpath(path, storage.location).replace(os.sep, '/'))
+    
+    Blob = blob_model()
+    blobs = [name for name in candidates if is_blob(name)]
+    known = set()
+    for start in range(0, len(blobs), 500):
+        chunk = [digest_of(name) for name in blobs[start:start + 500]]
+        known.update(Blob.objects.filter(pk__in=chunk).values_list('pk', flat=True))
+    return [name for name in candidates if not is_blob(name) or digest_of(name) not in known]
+
+def collect_garbage(references, storage=None, grace=ORPHAN_GRACE):
+    """Repair reference counts, then delete unreferenced blobs and orphaned files; returns (blobs, files)"""
+    storage = storage or blob_storage
+    recount(references)
+    blobs = collect(list(blob_model().objects.filter(ref_count__lte=0).values_list('pk', flat=True)), storage)
+    files = orphans(storage, grace)
+    for name in files:
+        storage.remove(name)
+    return blobs, len(files)
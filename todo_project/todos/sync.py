@@ -0,0 +1,186 @@
+# todos/sync.py
+
+import threading
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .models import PATH_SEP, Category, SyncChange, Todo, TodoComment
+
+# Days tombstones are kept (TODO_SYNC_TOMBSTONE_DAYS); a token older than
+# that may have missed deletions, so its client has to reload everything
+DEFAULT_TOMBSTONE_DAYS = 30
+
+# Seconds of recent changes re-sent below a token (TODO_SYNC_SAFETY_WINDOW).
+# Log ids are allocated on insert but become visible on commit, which only
+# SQLite, with its single writer, does in id order: elsewhere a transaction
+# still open when a token was handed out can commit rows below it. None
+# means this default on other databases and 0 on SQLite.
+DEFAULT_SAFETY_WINDOW = 60
+
+# Changes returned per sync response
+PAGE_SIZE = 500
+
+# Object ids per DELETE when replacing log rows
+CHUNK_SIZE = 500
+
+class TokenExpired(ValueError):
+    pass
+
+def tombstone_days():
+    return getattr(settings, 'TODO_SYNC_TOMBSTONE_DAYS', DEFAULT_TOMBSTONE_DAYS)
+
+def safety_window():
+    window = getattr(settings, 'TODO_SYNC_SAFETY_WINDOW', None)
+    if window is None:
+        return 0 if connection.vendor == 'sqlite' else DEFAULT_SAFETY_WINDOW
+    return window
+
+# Recording
+
+# Changes collected by an open batched() block on this thread
+_batch = threading.local()
+
+@contextmanager
+def batched():
+    """Collect the record() calls made inside the block and write them together on exit"""
+    if getattr(_batch, 'changes', None) is not None:
+        yield
+        return
+    _batch.changes = {}
+    try:
+        yield
+        changes = _batch.changes
+    finally:
+        _batch.changes = None
+    write(changes)
+
+def record(user_ids, model, object_ids, deleted=False):
+    """Log that objects of model changed, or with deleted are gone, for each of user_ids"""
+    object_ids = [uuid.UUID(str(object_id)) for object_id in object_ids]
+    changes = {
+        (user_id, model, object_id): deleted
+        for user_id in set(user_ids) if user_id is not None
+        for object_id in object_ids
+    }
+    pending = getattr(_batch, 'changes', None)
+    if pending is not None:
+        pending.update(changes)
+    elif changes:
+        write(changes)
+
+def write(changes):
+    """Replace the log rows of {(user_id, model, object_id): deleted}"""
+    if not changes:
+        return
+    grouped = defaultdict(list)
+    for user_id, model, object_id in changes:
+        grouped[(user_id, model)].append(object_id)
+    with transaction.atomic(savepoint=False):
+        for (user_id, model), object_ids in grouped.items():
+            for start in range(0, len(object_ids), CHUNK_SIZE):
+                SyncChange.objects.filter(
+                    user_id=user_id, model=model, object_id__in=object_ids[start:start + CHUNK_SIZE]
+                ).delete()
+        SyncChange.objects.bulk_create([
+            SyncChange(user_id=user_id, model=model, object_id=object_id, deleted=deleted)
+            for (user_id, model, object_id), deleted in changes.items()
+        ], batch_size=CHUNK_SIZE)
+
+def record_todos(todo_ids, deleted=False, user_id=None):
+    """
+    record() todos for their owners and everyone they are shared with;
+    pass user_id when it owns all of them to skip looking the owners up
+    """
+    todo_ids = list(todo_ids)
+    audience = defaultdict(list)
+    if user_id is not None:
+        audience[user_id] = todo_ids
+    for start in range(0, len(todo_ids), CHUNK_SIZE):
+        chunk = todo_ids[start:start + CHUNK_SIZE]
+        rows = list(Todo.shared_with.through.objects.filter(todo_id__in=chunk).values_list('user_id', 'todo_id'))
+        if user_id is None:
+            rows += Todo.objects.filter(pk__in=chunk).order_by().values_list('user_id', 'pk')
+        for user_id, todo_id in rows:
+            audience[user_id].append(todo_id)
+    for user_id, ids in audience.items():
+        record([user_id], 'todo', ids, deleted)
+
+def ancestor_ids(todo):
+    """Ids of a todo's ancestors, whose subtree counts change with it"""
+    return [uuid.UUID(segment) for segment in todo.path.split(PATH_SEP)[:-2]]
+
+def prune_tombstones(days=None):
+    """Delete tombstones older than the retention; returns how many"""
+    cutoff = timezone.now() - timedelta(days=tombstone_days() if days is None else days)
+    deleted, _ = SyncChange.objects.filter(deleted=True, changed_at__lt=cutoff).delete()
+    return deleted
+
+# Reading
+
+def encode_token(seq, now=None):
+    return f'{seq}.{int((now or timezone.now()).timestamp())}'
+
+def decode_token(token):
+    """Change log position of a sync token (0 for none); raises ValueError or TokenExpired"""
+    if not token:
+        return 0
+    seq, _, issued = token.partition('.')
+    if not seq.isdigit() or not issued.isdigit():
+        raise ValueError(token)
+    if timezone.now().timestamp() - int(issued) > tombstone_days() * 86400:
+        raise TokenExpired(token)
+    return int(seq)
+
+def changes_since(user, since=0, limit=PAGE_SIZE):
+    """
+    Up to limit of the user's changes after position since: the changed
+    todos, categories and comments (querysets ready to serialize), the ids
+    of deleted ones per model, the token to continue from and whether more
+    changes are waiting. Objects that are no longer visible count as deleted.
+    The last page also repeats the changes logged below since within the
+    safety window, in case their transactions committed after it was issued.
+    """
+    log = SyncChange.objects.filter(user=user).order_by('id').values_list('id', 'model', 'object_id', 'deleted')
+    rows = list(log.filter(id__gt=since)[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    token = rows[-1][0] if rows else since
+    
+    window = safety_window()
+    if since and window and not has_more:
+        cutoff = timezone.now() - timedelta(seconds=window)
+        rows = list(log.filter(id__lte=since, changed_at__gte=cutoff)) + rows
+    
+    changed = defaultdict(set)
+    deleted = {model: set() for model, _ in SyncChange.MODEL_CHOICES}
+    for _, model, object_id, is_deleted in rows:
+        (deleted[model] if is_deleted else changed[model]).add(object_id)
+    
+    visible = Todo.objects.visible_to(user)
+    todos = visible.with_list_data().filter(pk__in=changed['todo'])
+    categories = Category.objects.filter(user=user, pk__in=changed['category']).annotate(
+        num_todos=Count('todo', filter=Q(todo__is_archived=False))
+    )
+    comments = TodoComment.objects.filter(
+        pk__in=changed['comment'], todo__in=visible.order_by().values('pk')
+    ).prefetch_related('user')
+    
+    todos, categories, comments = list(todos), list(categories), list(comments)
+    for model, objects in (('todo', todos), ('category', categories), ('comment', comments)):
+        deleted[model] |= changed[model] - {obj.pk for obj in objects}
+    
+    return {
+        'token': encode_token(token),
+        'has_more': has_more,
+        'todos': todos,
+        'categories': categories,
+        'comments': comments,
+        'deleted': {model: sorted(ids, key=str) for model, ids in deleted.items()},
+    }
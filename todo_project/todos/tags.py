@@ -0,0 +1,52 @@
+# todos/tags.py
+
+from django.db.models import Count, F
+
+from .models import Tag, Todo
+
+def sync_todo_tags(todo):
+    """Point todo's tag index at the names in its tags field"""
+    names = Tag.normalize(todo.tags)
+    current = set(todo.tag_index.values_list('name', flat=True))
+    if current == names:
+        return
+    
+    missing = names - current
+    if missing:
+        Tag.objects.bulk_create(
+            [Tag(user_id=todo.user_id, name=name) for name in missing],
+            ignore_conflicts=True
+        )
+    todo.tag_index.set(Tag.objects.filter(user_id=todo.user_id, name__in=names))
+
+def sync_tags_bulk(todos):
+    """sync_todo_tags for many todos in a fixed number of queries"""
+    if not todos:
+        return
+    names = {todo.pk: Tag.normalize(todo.tags) for todo in todos}
+    wanted = {(todo.user_id, name) for todo in todos for name in names[todo.pk]}
+    Tag.objects.bulk_create([Tag(user_id=user_id, name=name) for user_id, name in wanted], ignore_conflicts=True)
+    
+    tag_ids = {
+        (user_id, name): pk for pk, user_id, name in Tag.objects.filter(
+            user_id__in={todo.user_id for todo in todos}, name__in={name for _, name in wanted}
+        ).values_list('pk', 'user_id', 'name')
+    }
+    through = Todo.tag_index.through
+    through.objects.filter(todo_id__in=names).delete()
+    through.objects.bulk_create([
+        through(todo_id=todo.pk, tag_id=tag_ids[(todo.user_id, name)])
+        for todo in todos for name in names[todo.pk]
+    ])
+
+def tag_facets(todos):
+    """Per-tag todo counts over the todos queryset, in one grouped query"""
+    return list(
+        Todo.tag_index.through.objects.filter(
+            todo_id__in=todos.order_by().values('pk')
+        ).values(
+            name=F('tag__name')
+        ).annotate(
+            count=Count('todo_id')
+        ).order_by('-count', 'name')
+    )
@@ -1,3 +1,1589 @@
-from django.test import TestCase
+import asyncio
+import csv
+import gzip
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+from io import BytesIO, StringIO
+from unittest import mock
+
+from PIL import Image
+
+from django.core.cache import cache
+from django.core import mail
+from django.core.management import call_command
+from django.db import DatabaseError, transaction
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from . import activity, attachments, boards, bulk, caching, calendars, checks, conditional, digests, events, export, imports, ordering, recurrence, reminders, retention, rollups, sync, thumbnails
+from .models import User, ActivityArchive, ActivityLog, AttachmentUpload, Blob, Category, DailyStats, DigestRun, SyncChange, Todo, TodoAttachment, TodoComment, TodoSearchDocument, UserPreferences
+
+# Query budgets count a request's database work, so their tests keep the
+# cache in memory instead of in the database table settings configure
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TodoListQueryBudgetTests(TestCase):
+    """The todo list must cost a fixed number of queries per page"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='pass12345')
+        self.others = [
+            User.objects.create_user(username=f'friend{i}', password='pass12345')
+            for i in range(5)
+        ]
+        self.category = Category.objects.create(user=self.user, name='Work')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def make_todos(self, count, shared_with=()):
+        todos = []
+        for i in range(count):
+            todo = Todo.objects.create(user=self.user, title=f'Todo {i}', category=self.category)
+            todo.shared_with.set(shared_with)
+            TodoComment.objects.create(todo=todo, user=self.user, comment='hi')
+            todos.append(todo)
+        return todos
+
+    def list_todos(self, **params):
+        return self.client.get(reverse('todo-list'), params)
+
+    def test_list_query_count_is_constant(self):
+        self.make_todos(2)
+        with self.assertNumQueries(6):
+            self.list_todos()
+
+        self.make_todos(15, shared_with=self.others)
+        with self.assertNumQueries(6):
+            response = self.list_todos()
+
+        todo = response.data['results'][0]
+        self.assertEqual(todo['comment_count'], 1)
+        self.assertEqual(todo['attachment_count'], 0)
+        self.assertEqual(todo['user']['username'], 'owner')
+        self.assertEqual(todo['category']['name'], 'Work')
+        # Counts change with other todos, which shared users' caches miss
+        self.assertNotIn('todo_count', todo['user'])
+        self.assertNotIn('todo_count', todo['category'])
+
+    def test_categories_come_back_in_name_order(self):
+        for name in ('Zeta', 'Alpha', 'Mid'):
+            Category.objects.create(user=self.user, name=name)
+        self.make_todos(2)
+
+        response = self.client.get(reverse('category-list'))
+        self.assertEqual([category['name'] for category in response.data['results']], ['Alpha', 'Mid', 'Work', 'Zeta'])
+        self.assertEqual([category['todo_count'] for category in response.data['results']], [0, 0, 2, 0])
+
+    def test_subtask_trees_load_in_one_query(self):
+        parents = self.make_todos(3, shared_with=self.others[:2])
+        Todo.objects.filter(pk__in=[p.pk for p in parents]).update(priority='high')
+        for parent in parents:
+            child = Todo.objects.create(user=self.user, title='Child', parent_todo=parent)
+            Todo.objects.create(user=self.user, title='Grandchild', parent_todo=child)
+
+        # 5 for the page, then every descendant in one query plus its user
+        # and shared_with prefetches (category is empty so skipped)
+        with self.assertNumQueries(8):
+            response = self.list_todos(priority='high')
+
+        nested = [t for t in response.data['results'] if t['title'] == 'Todo 0'][0]
+        self.assertEqual(nested['subtree_count'], 2)
+        self.assertEqual(nested['subtasks'][0]['title'], 'Child')
+        self.assertEqual(nested['subtasks'][0]['subtasks'][0]['title'], 'Grandchild')
+
+        response = self.list_todos(priority='high', subtask_depth=1)
+        nested = [t for t in response.data['results'] if t['title'] == 'Todo 0'][0]
+        self.assertEqual(nested['subtasks'][0]['subtasks'], [])
+
+    def test_shared_todos_are_listed_once(self):
+        other = self.others[0]
+        todo = Todo.objects.create(user=other, title='Shared')
+        todo.shared_with.set([self.user, self.others[1]])
+
+        response = self.list_todos()
+
+        self.assertEqual([t['title'] for t in response.data['results']], ['Shared'])
+
+class KeysetPaginationTests(TestCase):
+    """Cursor pagination walks every todo exactly once in model order"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='pass12345')
+        for i in range(7):
+            Todo.objects.create(user=self.user, title=f'Todo {i}', position=i % 3)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+    
+    def test_walks_forward_and_back(self):
+        expected = [str(pk) for pk in Todo.objects.order_by('position', '-created_at', 'id').values_list('id', flat=True)]
+        
+        response = self.client.get(reverse('todo-list'), {'pagination': 'cursor', 'page_size': 3, 'total': 'true'})
+        self.assertEqual(response.data['count'], 7)
+        self.assertIsNone(response.data['previous'])
+        
+        seen, pages = [], []
+        while True:
+            pages.append([t['id'] for t in response.data['results']])
+            seen.extend(pages[-1])
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+            self.assertNotIn('count', response.data)
+        self.assertEqual(seen, expected)
+        
+        response = self.client.get(response.data['previous'])
+        self.assertEqual([t['id'] for t in response.data['results']], pages[-2])
+    
+    def test_invalid_cursor_is_404(self):
+        response = self.client.get(reverse('todo-list'), {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 404)
+    
+    def test_activity_feed_cursor(self):
+        response = self.client.get(reverse('activity_feed'), {'pagination': 'cursor', 'page_size': 5})
+        self.assertEqual(response.data['results'], [])
+        self.assertIsNone(response.data['next'])
+
+@override_settings(TODO_ACTIVITY_SYNC=True)
+class SubtaskTreeTests(TestCase):
+    """Materialized paths stay correct across moves and subtree deletes"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='pass12345')
+        self.root = Todo.objects.create(user=self.user, title='Root')
+        self.child = Todo.objects.create(user=self.user, title='Child', parent_todo=self.root)
+        self.leaf = Todo.objects.create(user=self.user, title='Leaf', parent_todo=self.child)
+        self.other = Todo.objects.create(user=self.user, title='Other')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+    
+    def test_move_reroots_descendants(self):
+        self.child.parent_todo = self.other
+        self.child.save()
+        
+        self.leaf.refresh_from_db()
+        self.assertEqual(self.leaf.path, self.other.path + self.child.pk.hex + '/' + self.leaf.pk.hex + '/')
+        self.assertEqual(self.leaf.depth, 2)
+        self.assertEqual(list(Todo.objects.descendants_of([self.root])), [])
+    
+    def test_cannot_move_under_own_subtask(self):
+        response = self.client.patch(
+            reverse('todo-detail', args=[self.root.pk]), {'parent_todo': str(self.leaf.pk)}
+        )
+        self.assertEqual(response.status_code, 400)
+    
+    def test_delete_removes_subtree(self):
+        response = self.client.delete(reverse('todo-detail', args=[self.root.pk]))
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(list(Todo.objects.all()), [self.other])
+
+class TodoSearchTests(TestCase):
+    """Search is ranked, prefix matched and covers comments, with an ORM fallback"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='pass12345')
+        self.report = Todo.objects.create(user=self.user, title='Quarterly report', tags=['work'])
+        self.homework = Todo.objects.create(
+            user=self.user, title='Homework', description='Finish the report draft for class'
+        )
+        self.groceries = Todo.objects.create(user=self.user, title='Groceries')
+        TodoComment.objects.create(todo=self.groceries, user=self.user, comment='Remember the milk')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+    
+    def search(self, query):
+        response = self.client.get(reverse('todo-list'), {'search': query})
+        return response.data['results']
+    
+    def check_search(self):
+        results = self.search('repo')
+        self.assertEqual([t['title'] for t in results], ['Quarterly report', 'Homework'])
+        self.assertIn('<mark>report</mark>', results[1]['search_snippet'])
+        
+        self.assertEqual([t['title'] for t in self.search('milk')], ['Groceries'])
+        self.assertEqual([t['title'] for t in self.search('report class')], ['Homework'])
+        self.assertEqual(self.search('nothing'), [])
+    
+    def test_fts_search(self):
+        self.check_search()
+    
+    def test_orm_fallback(self):
+        with mock.patch('todos.search.fts_enabled', return_value=False):
+            self.check_search()
+    
+    def test_index_follows_edits(self):
+        self.groceries.title = 'Shopping'
+        self.groceries.save()
+        TodoComment.objects.filter(todo=self.groceries).delete()
+        
+        self.assertEqual(self.search('milk'), [])
+        self.assertEqual([t['title'] for t in self.search('shop')], ['Shopping'])
+    
+    def test_cursor_pagination_rejected(self):
+        response = self.client.get(reverse('todo-list'), {'search': 'report', 'pagination': 'cursor'})
+        self.assertEqual(response.status_code, 400)
+    
+    def test_snippets_escape_user_text(self):
+        Todo.objects.create(
+            user=self.user, title='Markup', description='<script>alert(1)</script> payload <b>bold</b>'
+        )
+        for fts in (True, False):
+            with mock.patch('todos.search.fts_enabled', return_value=fts):
+                snippet = self.search('payload')[0]['search_snippet']
+            self.assertNotIn('<script>', snippet)
+            self.assertIn('&lt;script&gt;', snippet)
+            self.assertIn('<mark>payload</mark>', snippet)
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TagIndexTests(TestCase):
+    """Tag filters match whole tags and facets are one grouped query"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='pass12345')
+        self.work = Todo.objects.create(user=self.user, title='Report', tags=['Work', 'urgent'])
+        self.homework = Todo.objects.create(user=self.user, title='Essay', tags=['homework'])
+        self.both = Todo.objects.create(user=self.user, title='Slides', tags=['work', 'homework'])
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+    
+    def titles(self, **params):
+        response = self.client.get(reverse('todo-list'), params)
+        return sorted(t['title'] for t in response.data['results'])
+    
+    def test_exact_tag_filter(self):
+        self.assertEqual(self.titles(tags='work'), ['Report', 'Slides'])
+        self.assertEqual(self.titles(tags='work,homework'), ['Essay', 'Report', 'Slides'])
+        self.assertEqual(self.titles(tags='work,homework', tags_match='all'), ['Slides'])
+    
+    def test_index_follows_edits(self):
+        self.work.tags = ['personal']
+        self.work.save()
+        self.assertEqual(self.titles(tags='work'), ['Slides'])
+        self.assertEqual(self.titles(tags='personal'), ['Report'])
+    
+    def test_facets(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('tag_facets'))
+        self.assertEqual(response.data, [
+            {'name': 'homework', 'count': 2},
+            {'name': 'work', 'count': 2},
+            {'name': 'urgent', 'count': 1},
+        ])
+
+def clear_caches():
+    cache.clear()
+    caching.local_cache.clear()
+
+@override_settings(TODO_ACTIVITY_SYNC=True, CACHES=LOCMEM_CACHES)
+class StatisticsTests(TestCase):
+    """Statistics cost a constant number of queries for any window"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='pass12345')
+        now = timezone.now()
+        for days_ago in (0, 0, 3, 20):
+            todo = Todo.objects.create(user=self.user, title=f'{days_ago} days ago', completed=True)
+            Todo.objects.filter(pk=todo.pk).update(
+                created_at=now - timedelta(days=days_ago, hours=1),
+                completed_at=now - timedelta(days=days_ago)
+            )
+        Todo.objects.create(user=self.user, title='Open', due_date=now - timedelta(days=1))
+        # The backdating update() bypasses the signals that maintain the rollup
+        rollups.rebuild([self.user.pk])
+        clear_caches()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+    
+    def test_window_and_query_count(self):
+        # Europe/Tirane is not settings.TIME_ZONE, so this bypasses the rollup
+        # for the histogram; the overview is two queries either way
+        with self.assertNumQueries(6):
+            response = self.client.get(reverse('statistics'), {'days': 30, 'tz': 'Europe/Tirane'})
+        
+        data = response.data
+        self.assertEqual(data['overview']['total'], 5)
+        self.assertEqual(data['overview']['completed'], 4)
+        self.assertEqual(data['overview']['overdue'], 1)
+        self.assertEqual(len(data['daily_activity']), 30)
+        self.assertEqual(sum(day['completed'] for day in data['daily_activity']), 4)
+        self.assertEqual(data['daily_activity'][-1]['created'], 3)
+        
+        response = self.client.get(reverse('statistics'))
+        self.assertEqual(sum(day['completed'] for day in response.data['daily_activity']), 3)
+    
+    def stats(self, **params):
+        return self.client.get(reverse('statistics'), params).data
+    
+    def test_rollup_matches_live_queries(self):
+        with self.assertNumQueries(4):
+            rollup = self.stats(days=30)
+        clear_caches()
+        with mock.patch('todos.stats.uses_rollup', return_value=False):
+            live = self.stats(days=30)
+        self.assertEqual(rollup, live)
+        self.assertEqual(rollup['daily_activity'][-2]['overdue'], 1)
+    
+    def test_rollup_follows_bulk_actions_and_deletes(self):
+        open_todo = Todo.objects.get(title='Open')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('todo-bulk-action'), {'action': 'complete', 'todo_ids': [str(open_todo.pk)]}, format='json')
+        stats = self.stats()
+        self.assertEqual(stats['daily_activity'][-1]['completed'], 3)
+        self.assertEqual(stats['daily_activity'][-2]['overdue'], 0)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(reverse('todo-detail', args=[open_todo.pk]))
+        self.assertEqual(self.stats()['daily_activity'][-1]['completed'], 2)
+    
+    def test_overview_from_the_rollup(self):
+        Todo.objects.create(user=self.user, title='Shelved', is_archived=True)
+        Todo.objects.create(user=self.user, title='Late today', due_date=timezone.now() - timedelta(seconds=1))
+        overview = self.stats()['overview']
+        self.assertEqual((overview['total'], overview['completed'], overview['active']), (7, 4, 2))
+        # Yesterday's from the rollup, today's from the todo table
+        self.assertEqual(overview['overdue'], 2)
+    
+    def test_one_row_per_day_and_category(self):
+        category = Category.objects.create(user=self.user, name='Work')
+        for _ in range(2):
+            Todo.objects.create(user=self.user, title='Filed', category=category)
+        today = rollups.local_date(timezone.now())
+        uncategorized = DailyStats.objects.get(date=today, category=None).created
+        self.assertEqual(DailyStats.objects.get(date=today, category=category).created, 2)
+        
+        # The category's counts fold into the uncategorized row its todos move to
+        category.delete()
+        self.assertEqual(DailyStats.objects.get(date=today, category=None).created, uncategorized + 2)
+        self.assertEqual(self.stats()['overview']['total'], 7)
+    
+    def test_rebuild_command(self):
+        before = list(DailyStats.objects.values('date', 'category', 'created', 'completed', 'completion_seconds', 'due_open').order_by('date'))
+        DailyStats.objects.all().delete()
+        call_command('rebuild_daily_stats', stdout=StringIO())
+        after = list(DailyStats.objects.values('date', 'category', 'created', 'completed', 'completion_seconds', 'due_open').order_by('date'))
+        self.assertEqual(before, after)
+    
+    def test_invalid_window(self):
+        self.assertEqual(self.client.get(reverse('statistics'), {'days': 12}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('statistics'), {'tz': 'Mars/Base'}).status_code, 400)
+
+@override_settings(TODO_ACTIVITY_SYNC=True, CACHES=LOCMEM_CACHES)
+class DashboardCacheTests(TestCase):
+    """Statistics and the activity feed are cached until the user's data changes"""
+    
+    def setUp(self):
+        clear_caches()
+        self.user = User.objects.create_user(username='owner', password='pass12345')
+        self.todo = Todo.objects.create(user=self.user, title='First')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+    
+    def test_repeat_loads_are_cache_hits(self):
+        first = self.client.get(reverse('statistics')).data
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(reverse('statistics')).data, first)
+        
+        caching.local_cache.clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(reverse('statistics')).data, first)
+    
+    def test_queryset_updates_invalidate(self):
+        self.assertEqual(self.client.get(reverse('statistics')).data['overview']['completed'], 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('todo-bulk-action'), {'action': 'complete', 'todo_ids': [str(self.todo.pk)]}, format='json')
+        self.assertEqual(self.client.get(reverse('statistics')).data['overview']['completed'], 1)
+    
+    def test_activity_feed_invalidated_by_new_activity(self):
+        self.assertEqual(len(self.client.get(reverse('activity_feed')).data), 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('todo-list'), {'title': 'Second'}, format='json')
+        self.assertEqual(len(self.client.get(reverse('activity_feed')).data), 1)
+    
+    def test_other_users_are_not_invalidated(self):
+        other = User.objects.create_user(username='other', password='pass12345')
+        self.client.get(reverse('statistics'))
+        with self.captureOnCommitCallbacks(execute=True):
+            Todo.objects.create(user=other, title='Elsewhere')
+        with self.assertNumQueries(0):
+            self.client.get(reverse('statistics'))
+    
+    def test_bumps_increment_atomically(self):
+        version = caching.get_version(self.user.pk)
+        caching._bump(self.user.pk)
+        caching._bump(self.user.pk)
+        self.assertEqual(caching.get_version(self.user.pk), version + 2)
+        modified = caching.version_time(self.user.pk, version + 2)
+        self.assertLess(abs(timezone.now() - modified), timedelta(seconds=5))
+        
+        # A lost version key restarts above every version handed out before
+        caching.shared_cache().delete(caching.version_key(self.user.pk))
+        caching._bump(self.user.pk)
+        self.assertGreater(caching.get_version(self.user.pk), version + 2)
+    
+    def test_process_local_cache_is_flagged(self):
+        self.assertEqual([warning.id for warning in checks.check_shared_cache(None)], ['todos.W001'])
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'todo_cache'}}
+        with self.settings(CACHES=shared):
+            self.assertEqual(checks.check_shared_cache(None), [])
+    
+    def test_lru_is_bounded(self):
+        lru = caching.LRUCache(2)
+        lru.set('a', 1, 60)
+        lru.set('b', 2, 60)
+        lru.get('a')
+        lru.set('c', 3, 60)
+        self.assertEqual((lru.get('a'), lru.get('b'), lru.get('c')), (1, None, 3))
+
+class ActivitySinkTests(TestCase):
+    """Buffered activity entries are written in one batch on flush"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='pass12345')
+        self.sink = activity.ActivitySink(batch_size=3, interval=60, sync=False)
+        # Flush from the test thread instead of a background worker
+        patcher = mock.patch.object(self.sink, 'ensure_worker')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def test_flush_writes_queued_entries(self):
+        todo = Todo.objects.create(user=self.user, title='Kept')
+        gone = Todo.objects.create(user=self.user, title='Gone')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.sink.log(user=self.user, action='created', todo=todo, todo_title=todo.title)
+            self.sink.log(user=self.user, action='created', todo=gone, todo_title=gone.title)
+        gone.delete()
+        queued_until = timezone.now()
+        self.assertEqual(ActivityLog.objects.count(), 0)
+        
+        # Existing todos, existing users, then the batch insert
+        with self.assertNumQueries(3):
+            self.assertEqual(self.sink.flush(), 2)
+        logs = {log.todo_title: log for log in ActivityLog.objects.all()}
+        self.assertEqual(logs['Kept'].todo_id, todo.pk)
+        self.assertIsNone(logs['Gone'].todo_id)
+        self.assertLess(logs['Kept'].timestamp, queued_until)
+        self.assertEqual(self.sink.flush(), 0)
+    
+    def test_full_batch_wakes_the_writer(self):
+        for index in range(3):
+            self.assertFalse(self.sink.wake.is_set())
+            with self.captureOnCommitCallbacks(execute=True):
+                self.sink.log(user=self.user, action='created', todo_title=f'Todo {index}')
+        self.assertTrue(self.sink.wake.is_set())
+    
+    def test_rolled_back_entries_are_not_queued(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(DatabaseError), transaction.atomic():
+                self.sink.log(user=self.user, action='created', todo_title='Undone')
+                raise DatabaseError
+        self.assertEqual(self.sink.pending, [])
+        self.assertEqual(self.sink.flush(), 0)
+
+class ActivityRetentionTests(TestCase):
+    """Old activity moves to archive segments but stays readable in order"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='pass12345')
+        now = timezone.now()
+        for days_ago in (1, 100, 101, 101, 200):
+            ActivityLog.objects.create(
+                user=self.user, action='created', todo_title=f'{days_ago} days ago',
+                timestamp=now - timedelta(days=days_ago)
+            )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+    
+    def history_ids(self, limit):
+        ids, url, params = [], reverse('activity_history'), {'limit': limit}
+        while url:
+            data = self.client.get(url, params).data
+            ids += [entry['id'] for entry in data['results']]
+            url, params = data['next'], None
+        return ids
+    
+    def test_archive_and_compact(self):
+        before = self.history_ids(limit=2)
+        
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.assertEqual(retention.archive_activity(chunk_size=2), 4)
+        # One cache version bump per chunk, not one per deleted row
+        self.assertEqual(len(callbacks), 2)
+        self.assertEqual(ActivityLog.objects.count(), 1)
+        self.assertEqual(sum(ActivityArchive.objects.values_list('count', flat=True)), 4)
+        
+        retention.compact_archives()
+        months = list(ActivityArchive.objects.values_list('month', flat=True))
+        self.assertEqual(len(months), len(set(months)))
+        
+        self.assertEqual(self.history_ids(limit=2), before)
+        self.assertEqual(self.history_ids(limit=50), before)
+        results = self.client.get(reverse('activity_history')).data['results']
+        self.assertEqual([entry['archived'] for entry in results], [False, True, True, True, True])
+    
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('activity_history'), {'before': 'nope'})
+        self.assertEqual(response.status_code, 400)
+
+@override_settings(TODO_ACTIVITY_SYNC=True)
+class ReorderTests(TestCase):
+    """Moving a todo rewrites one row; whole reorders are batched"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='pass12345')
+        self.todos = [
+            Todo.objects.create(user=self.user, title=f'Todo {index}', position=(index + 1) * ordering.GAP)
+            for index in range(5)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+    
+    def titles(self):
+        return list(Todo.objects.filter(user=self.user).values_list('title', flat=True))
+    
+    def positions(self):
+        return dict(Todo.objects.filter(user=self.user).values_list('pk', 'position'))
+    
+    def test_move_updates_one_row(self):
+        before = self.positions()
+        first, _, _, fourth, _ = self.todos
+        response = self.client.post(reverse('todo-reorder'), {'todo_id': str(first.pk), 'after_id': str(fourth.pk)}, format='json')
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.titles(), ['Todo 1', 'Todo 2', 'Todo 3', 'Todo 0', 'Todo 4'])
+        changed = [pk for pk, position in self.positions().items() if before[pk] != position]
+        self.assertEqual(changed, [first.pk])
+        
+        self.client.post(reverse('todo-reorder'), {'todo_id': str(first.pk), 'before_id': str(self.todos[1].pk)}, format='json')
+        self.assertEqual(self.titles(), [f'Todo {index}' for index in range(5)])
+    
+    def test_move_into_full_gap_rebalances(self):
+        Todo.objects.filter(pk=self.todos[1].pk).update(position=ordering.GAP + 1)
+        ordering.move(self.todos[4], after=self.todos[0])
+        self.assertEqual(self.titles(), ['Todo 0', 'Todo 4', 'Todo 1', 'Todo 2', 'Todo 3'])
+        self.assertEqual(len(set(self.positions().values())), 5)
+    
+    def test_narrow_gap_rebalances_in_the_move(self):
+        Todo.objects.filter(pk=self.todos[1].pk).update(position=ordering.GAP + ordering.MIN_GAP)
+        with mock.patch('todos.ordering.rebalance') as rebalance:
+            ordering.move(self.todos[4], after=self.todos[0])
+        rebalance.assert_not_called()
+        
+        Todo.objects.filter(pk=self.todos[1].pk).update(position=ordering.GAP + ordering.MIN_GAP - 1)
+        ordering.move(self.todos[3], after=self.todos[0])
+        self.assertEqual(self.titles(), ['Todo 0', 'Todo 3', 'Todo 4', 'Todo 1', 'Todo 2'])
+        positions = sorted(self.positions().values())
+        self.assertTrue(all(high - low >= ordering.MIN_GAP for low, high in zip(positions, positions[1:])))
+    
+    def test_batched_order_keeps_other_slots(self):
+        Todo.objects.create(user=self.user, title='Other', position=0)
+        ids = [str(todo.pk) for todo in reversed(self.todos)]
+        # Savepoint, lock the list, read, update, three queries to log the
+        # moved todos for sync, release
+        with self.assertNumQueries(8):
+            response = self.client.post(reverse('todo-reorder'), {'order': ids}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.titles(), ['Other'] + [f'Todo {index}' for index in reversed(range(5))])
+    
+    def test_new_todos_go_to_the_top(self):
+        self.client.post(reverse('todo-list'), {'title': 'Newest'}, format='json')
+        self.assertEqual(self.titles()[0], 'Newest')
+    
+    def test_invalid_requests(self):
+        todo = str(self.todos[0].pk)
+        for data in ({'todo_id': todo}, {'todo_id': todo, 'after_id': todo}, {'order': ['nope']}, {'positions': {todo: 'x'}}):
+            self.assertEqual(self.client.post(reverse('todo-reorder'), data, format='json').status_code, 400)
+
+@override_settings(TODO_ACTIVITY_SYNC=True)
+class BulkActionTests(TestCase):
+    """Bulk actions run in chunks, keep derived data in step and are audited"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='pass12345')
+        self.category = Category.objects.create(user=self.user, name='Work')
+        self.todos = [
+            Todo.objects.create(user=self.user, title=f'Todo {index}', tags=['old'], due_date=timezone.now())
+            for index in range(5)
+        ]
+        self.ids = [todo.pk for todo in self.todos]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+    
+    def rollup(self):
+        return sorted(DailyStats.objects.values_list('date', 'category', 'created', 'completed', 'due_open'), key=str)
+    
+    def assert_rollup_consistent(self):
+        incremental = self.rollup()
+        rollups.rebuild([self.user.pk])
+        self.assertEqual([row for row in incremental if any(row[2:])], self.rollup())
+    
+    def test_complete_in_chunks(self):
+        done = self.todos[0]
+        done.completed = True
+        done.save()
+        completed_at = Todo.objects.get(pk=done.pk).completed_at
+        
+        missing = 'c5d7a8b0-0000-4000-8000-000000000000'
+        result = bulk.run(self.user, 'complete', [str(pk) for pk in self.ids] + [missing], chunk_size=2)
+        
+        self.assertEqual((result['requested'], result['matched'], result['affected']), (6, 5, 4))
+        self.assertEqual([str(pk) for pk in result['not_found']], [missing])
+        self.assertEqual(Todo.objects.get(pk=done.pk).completed_at, completed_at)
+        self.assertEqual(ActivityLog.objects.filter(action='completed', details__bulk='complete').count(), 4)
+        self.assert_rollup_consistent()
+    
+    def test_field_actions(self):
+        self.client.post(reverse('todo-bulk-action'), {
+            'action': 'set_category', 'todo_ids': [str(pk) for pk in self.ids[:2]], 'params': {'category': str(self.category.pk)}
+        }, format='json')
+        bulk.run(self.user, 'set_priority', self.ids, {'priority': 'high'})
+        bulk.run(self.user, 'shift_due', self.ids[:1], {'days': -3})
+        
+        self.assertEqual(Todo.objects.filter(category=self.category).count(), 2)
+        self.assertEqual(Todo.objects.filter(priority='high').count(), 5)
+        self.assertEqual(Todo.objects.filter(due_date__lt=timezone.now() - timedelta(days=2)).count(), 1)
+        self.assert_rollup_consistent()
+    
+    def test_tag_actions(self):
+        bulk.run(self.user, 'add_tags', self.ids[:2], {'tags': ['Urgent', 'old']})
+        bulk.run(self.user, 'remove_tags', self.ids[1:], {'tags': ['OLD']})
+        
+        self.assertEqual(Todo.objects.get(pk=self.ids[0]).tags, ['old', 'Urgent'])
+        self.assertEqual(Todo.objects.get(pk=self.ids[1]).tags, ['Urgent'])
+        response = self.client.get(reverse('tag_facets'))
+        self.assertEqual(response.data, [{'name': 'urgent', 'count': 2}, {'name': 'old', 'count': 1}])
+        titles = [t['title'] for t in self.client.get(reverse('todo-list'), {'search': 'urgent'}).data['results']]
+        self.assertEqual(sorted(titles), ['Todo 0', 'Todo 1'])
+    
+    def test_delete_cascades_and_reports(self):
+        Todo.objects.create(user=self.user, title='Subtask', parent_todo=self.todos[0])
+        TodoComment.objects.create(todo=self.todos[0], user=self.user, comment='Note')
+        result = bulk.run(self.user, 'delete', self.ids[:2], chunk_size=1)
+        
+        self.assertEqual(result['affected'], 2)
+        self.assertEqual(result['deleted']['todos.Todo'], 3)
+        self.assertEqual(result['deleted']['todos.TodoComment'], 1)
+        self.assertEqual(Todo.objects.count(), 3)
+        self.assertEqual(ActivityLog.objects.filter(action='deleted').count(), 2)
+        self.assert_rollup_consistent()
+    
+    def test_invalid_requests(self):
+        ids = [str(pk) for pk in self.ids]
+        for data in ({'action': 'explode', 'todo_ids': ids},
+                     {'action': 'set_priority', 'todo_ids': ids, 'params': {'priority': 'urgent'}},
+                     {'action': 'shift_due', 'todo_ids': ids, 'params': {'days': '2'}},
+                     {'action': 'complete', 'todo_ids': ['nope']}):
+            self.assertEqual(self.client.post(reverse('todo-bulk-action'), data, format='json').status_code, 400)
+
+@override_settings(TODO_ACTIVITY_SYNC=True, CACHES=LOCMEM_CACHES)
+class ConditionalGetTests(TestCase):
+    """Unchanged data is revalidated with a 304 that runs no queries"""
+    
+    def setUp(self):
+        clear_caches()
+        self.user = User.objects.create_user(username='owner', password='pass12345')
+        self.friend = User.objects.create_user(username='friend', password='pass12345')
+        self.todo = Todo.objects.create(user=self.user, title='Shared')
+        self.todo.shared_with.add(self.friend)
+        Todo.objects.filter(pk=self.todo.pk).update(is_shared=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+    
+    def revalidate(self, url, response, client=None):
+        return (client or self.client).get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+    
+    def test_not_modified_without_queries(self):
+        for url in (reverse('todo-list'), reverse('todo-detail', args=[self.todo.pk]),
+                    reverse('category-list'), reverse('statistics'), reverse('activity_feed')):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            with self.assertNumQueries(0):
+                self.assertEqual(self.revalidate(url, response).status_code, 304)
+        
+        response = self.client.get(reverse('todo-list'))
+        since = self.client.get(reverse('todo-list'), HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(since.status_code, 304)
+    
+    def test_changes_invalidate_owner_and_shared_users(self):
+        friend_client = APIClient()
+        friend_client.force_authenticate(self.friend)
+        url = reverse('todo-list')
+        mine, theirs = self.client.get(url), friend_client.get(url)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(reverse('todo-detail', args=[self.todo.pk]), {'title': 'Renamed'}, format='json')
+        
+        for client, response in ((self.client, mine), (friend_client, theirs)):
+            fresh = self.revalidate(url, response, client)
+            self.assertEqual(fresh.status_code, 200)
+            self.assertNotEqual(fresh['ETag'], response['ETag'])
+    
+    def test_owner_profile_changes_invalidate_shared_users(self):
+        friend_client = APIClient()
+        friend_client.force_authenticate(self.friend)
+        url = reverse('todo-list')
+        theirs = friend_client.get(url)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save(update_fields=['last_login'])
+        self.assertEqual(self.revalidate(url, theirs, friend_client).status_code, 304)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put(reverse('update_profile'), {'first_name': 'Ada'}, format='json')
+        fresh = self.revalidate(url, theirs, friend_client)
+        self.assertEqual(fresh.status_code, 200)
+        self.assertEqual(fresh.data['results'][0]['user']['full_name'], 'Ada')
+    
+    def test_etag_expires_when_a_todo_falls_due(self):
+        due = timezone.now() + timedelta(hours=1)
+        Todo.objects.create(user=self.user, title='Soon', due_date=due)
+        clear_caches()
+        response = self.client.get(reverse('todo-list'))
+        _, deadline = cache.get(conditional.etag_key(response['ETag']))
+        self.assertAlmostEqual(deadline, due.timestamp(), places=3)
+
+@override_settings(TODO_ACTIVITY_SYNC=True)
+class DeltaSyncTests(TestCase):
+    """Sync returns only what changed since a token, deletions as tombstones"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='pass12345')
+        self.friend = User.objects.create_user(username='friend', password='pass12345')
+        self.category = Category.objects.create(user=self.user, name='Work')
+        self.todos = [
+            Todo.objects.create(user=self.user, title=f'Todo {index}', category=self.category)
+            for index in range(4)
+        ]
+        self.comment = TodoComment.objects.create(todo=self.todos[0], user=self.user, comment='Note')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+    
+    def sync(self, since=None, client=None):
+        response = (client or self.client).get(reverse('sync'), {'since': since} if since else {})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+    
+    def test_full_then_delta(self):
+        full = self.sync()
+        self.assertEqual({todo['id'] for todo in full['todos']}, {str(todo.pk) for todo in self.todos})
+        self.assertEqual([category['todo_count'] for category in full['categories']], [4])
+        self.assertEqual([comment['todo'] for comment in full['comments']], [self.todos[0].pk])
+        
+        self.client.patch(reverse('todo-detail', args=[self.todos[0].pk]), {'title': 'Renamed'}, format='json')
+        self.client.delete(reverse('todo-detail', args=[self.todos[1].pk]))
+        self.client.post(reverse('todo-bulk-action'), {
+            'action': 'delete', 'todo_ids': [str(self.todos[2].pk)]
+        }, format='json')
+        
+        delta = self.sync(full['token'])
+        self.assertEqual([todo['title'] for todo in delta['todos']], ['Renamed'])
+        self.assertEqual(set(delta['deleted']['todo']), {self.todos[1].pk, self.todos[2].pk})
+        self.assertEqual([category['todo_count'] for category in delta['categories']], [2])
+        self.assertEqual(delta['comments'], [])
+        
+        self.assertEqual(self.sync(delta['token'])['todos'], [])
+    
+    def test_bulk_update_and_reorder_are_logged(self):
+        ordering.rebalance(self.user.pk)
+        token = self.sync()['token']
+        bulk.run(self.user, 'set_priority', [self.todos[3].pk], {'priority': 'high'})
+        ordering.move(self.todos[2], before=self.todos[0])
+        delta = self.sync(token)
+        self.assertEqual({todo['id'] for todo in delta['todos']}, {str(self.todos[3].pk), str(self.todos[2].pk)})
+        self.assertEqual(delta['deleted']['todo'], [])
+    
+    def test_sharing_and_unsharing(self):
+        friend_client = APIClient()
+        friend_client.force_authenticate(self.friend)
+        token = self.sync(client=friend_client)['token']
+        
+        self.todos[0].shared_with.add(self.friend)
+        delta = self.sync(token, friend_client)
+        self.assertEqual([todo['id'] for todo in delta['todos']], [str(self.todos[0].pk)])
+        self.assertEqual([comment['comment'] for comment in delta['comments']], [])
+        
+        self.todos[0].shared_with.remove(self.friend)
+        delta = self.sync(delta['token'], friend_client)
+        self.assertEqual(delta['deleted']['todo'], [self.todos[0].pk])
+    
+    def test_todo_write_and_change_log_commit_together(self):
+        url = reverse('todo-detail', args=[self.todos[0].pk])
+        with mock.patch.object(sync, 'write', side_effect=DatabaseError), self.assertRaises(DatabaseError):
+            self.client.patch(url, {'title': 'Renamed'}, format='json')
+        self.todos[0].refresh_from_db()
+        self.assertEqual(self.todos[0].title, 'Todo 0')
+    
+    def test_safety_window_repeats_late_commits(self):
+        # A transaction that logged todos[1] below the token but commits after it
+        late = SyncChange.objects.get(user=self.user, object_id=self.todos[1].pk)
+        SyncChange.objects.filter(pk=late.pk).delete()
+        token = self.sync()['token']
+        SyncChange.objects.bulk_create([late])
+        
+        self.assertEqual(self.sync(token)['todos'], [])
+        with self.settings(TODO_SYNC_SAFETY_WINDOW=60):
+            delta = self.sync(token)
+        self.assertIn(str(self.todos[1].pk), [todo['id'] for todo in delta['todos']])
+        self.assertEqual(sync.decode_token(delta['token']), sync.decode_token(token))
+    
+    def test_pages_and_tokens(self):
+        with mock.patch.object(sync, 'PAGE_SIZE', 2):
+            first = sync.changes_since(self.user, limit=2)
+            rest = sync.changes_since(self.user, sync.decode_token(first['token']))
+        self.assertTrue(first['has_more'])
+        self.assertEqual(len(first['todos'] + first['categories']) + len(rest['todos'] + rest['categories']) + 1, 6)
+        
+        self.assertEqual(self.client.get(reverse('sync'), {'since': 'nonsense'}).status_code, 400)
+        old = sync.encode_token(1, timezone.now() - timedelta(days=sync.DEFAULT_TOMBSTONE_DAYS + 1))
+        self.assertEqual(self.client.get(reverse('sync'), {'since': old}).status_code, 410)
+        
+        self.todos[3].delete()
+        SyncChange.objects.filter(deleted=True).update(changed_at=timezone.now() - timedelta(days=60))
+        self.assertEqual(sync.prune_tombstones(), 1)
+
+@override_settings(TODO_ACTIVITY_SYNC=True)
+class PushEventTests(TestCase):
+    """Changes are pushed to everyone who sees them, with bounded queues"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='pass12345')
+        self.friend = User.objects.create_user(username='friend', password='pass12345')
+        self.stranger = User.objects.create_user(username='stranger', password='pass12345')
+        self.todo = Todo.objects.create(user=self.user, title='Plan')
+        self.broker = events.LocalBroker()
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+        patcher = mock.patch.object(events, '_broker', self.broker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def subscribe(self, user, maxsize=10):
+        async def subscribe():
+            return self.broker.subscribe(user.pk, maxsize)
+        return self.loop.run_until_complete(subscribe())
+    
+    def received(self, subscription):
+        self.loop.run_until_complete(asyncio.sleep(0))
+        queued = []
+        while not subscription.queue.empty():
+            queued.append(subscription.queue.get_nowait())
+        return [(event['type'], event['payload'].get('id')) for event in queued]
+    
+    def test_fan_out_to_owner_and_shared_users(self):
+        owner, friend, stranger = (self.subscribe(user) for user in (self.user, self.friend, self.stranger))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.todo.shared_with.add(self.friend)
+            Todo.objects.filter(pk=self.todo.pk).update(is_shared=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            comment = TodoComment.objects.create(todo=self.todo, user=self.friend, comment='Sure')
+        
+        self.assertEqual(self.received(owner), [('todo.shared', self.todo.pk), ('comment.created', comment.pk)])
+        self.assertEqual(self.received(friend), [('todo.shared', self.todo.pk), ('comment.created', comment.pk)])
+        self.assertEqual(self.received(stranger), [])
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk.run(self.user, 'complete', [self.todo.pk])
+        self.assertEqual(self.received(friend), [('todos.bulk', None)])
+    
+    def test_nothing_is_sent_for_rolled_back_changes(self):
+        owner = self.subscribe(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    Todo.objects.create(user=self.user, title='Gone')
+                    raise DatabaseError
+            except DatabaseError:
+                pass
+        self.assertEqual(self.received(owner), [])
+    
+    def test_slow_consumer_is_told_to_resync(self):
+        owner = self.subscribe(self.user, maxsize=3)
+        for index in range(5):
+            self.broker.publish([self.user.pk], {'type': 'todo.updated', 'payload': {'id': index}})
+        self.assertEqual(self.received(owner), [('resync', None), ('todo.updated', 4)])
+        
+        owner.close()
+        self.assertEqual(self.broker.subscribers, {})
+    
+    def test_stream_requires_asgi_and_login(self):
+        client = APIClient()
+        self.assertEqual(client.get(reverse('event_stream')).status_code, 403)
+        client.force_login(self.user)
+        self.assertEqual(client.get(reverse('event_stream')).status_code, 501)
+
+class EventStreamTests(TestCase):
+    """The event stream serves queued events and keepalives until its lifetime ends"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='pass12345')
+        self.async_client.force_login(self.user)
+    
+    @override_settings(TODO_EVENTS_HEARTBEAT=0.05, TODO_EVENTS_STREAM_LIFETIME=0.3)
+    async def test_stream(self):
+        response = await self.async_client.get(reverse('event_stream'))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        chunks = aiter(response.streaming_content)
+        self.assertEqual(await anext(chunks), b'retry: 3000\n\n')
+        
+        events.broker().publish([self.user.pk], {'type': 'todo.updated', 'payload': {'id': 1}})
+        self.assertEqual(await anext(chunks), b'data: {"type": "todo.updated", "payload": {"id": 1}}\n\n')
+        rest = [chunk async for chunk in chunks]
+        self.assertIn(b': keepalive\n\n', rest)
+        self.assertEqual(events.broker().subscribers.get(self.user.pk), None)
+
+class ExportTests(TestCase):
+    """Exports stream in chunks with a query count independent of their size"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='pass12345')
+        self.category = Category.objects.create(user=self.user, name='Work')
+        self.parent = Todo.objects.create(user=self.user, title='Parent, with comma', category=self.category, tags=['a'])
+        self.child = Todo.objects.create(user=self.user, title='Child', parent_todo=self.parent)
+        self.others = [Todo.objects.create(user=self.user, title=f'Todo {index}') for index in range(4)]
+        TodoComment.objects.create(todo=self.parent, user=self.user, comment='First')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+    
+    def export(self, **params):
+        response = self.client.get(reverse('todo-export'), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content)
+    
+    def test_json(self):
+        data = json.loads(self.export(format='json', include='categories,comments,subtasks'))
+        self.assertEqual([category['name'] for category in data['categories']], ['Work'])
+        todos = {todo['title']: todo for todo in data['todos']}
+        self.assertEqual(len(todos), 6)
+        self.assertEqual(todos['Child']['parent_todo'], str(self.parent.pk))
+        self.assertEqual(todos['Parent, with comma']['category_name'], 'Work')
+        self.assertEqual([comment['comment'] for comment in todos['Parent, with comma']['comments']], ['First'])
+        # Parents come before their subtasks
+        titles = [todo['title'] for todo in data['todos']]
+        self.assertLess(titles.index('Parent, with comma'), titles.index('Child'))
+    
+    def test_ndjson_csv_and_gzip(self):
+        lines = self.export(format='ndjson').decode().splitlines()
+        self.assertEqual({json.loads(line)['type'] for line in lines}, {'todo'})
+        self.assertEqual(len(lines), 5)
+        
+        rows = list(csv.DictReader(self.export(format='csv', include='comments').decode().splitlines()))
+        parent = next(row for row in rows if row['title'] == 'Parent, with comma')
+        self.assertEqual((parent['category_name'], json.loads(parent['tags'])), ('Work', ['a']))
+        self.assertEqual(json.loads(parent['comments'])[0]['comment'], 'First')
+        
+        data = gzip.decompress(self.export(format='ndjson', compress='gzip'))
+        self.assertEqual(len(data.decode().splitlines()), 5)
+    
+    def test_queries_per_chunk(self):
+        pieces = export.encode_json(self.user, {'comments', 'subtasks'}, chunk_size=2)
+        # categories, todos, then comments once per chunk of two todos
+        with self.assertNumQueries(5):
+            json.loads(''.join(pieces))
+    
+    def test_invalid_options(self):
+        for params in ({'include': 'everything'}, {'compress': 'zip'}):
+            self.assertEqual(self.client.get(reverse('todo-export'), params).status_code, 400)
+
+@override_settings(TODO_ACTIVITY_SYNC=True)
+class ImportTests(TestCase):
+    """Imports parse incrementally, write in batches and report bad rows"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='pass12345')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+    
+    def upload(self, name, content, **data):
+        upload = SimpleUploadedFile(name, content.encode() if isinstance(content, str) else content)
+        return self.client.post(reverse('todo-import'), {'file': upload, **data}, format='multipart')
+    
+    def test_round_trip_of_an_export(self):
+        category = Category.objects.create(user=self.user, name='Work', color='#ff0000')
+        parent = Todo.objects.create(user=self.user, title='Parent', category=category, tags=['x'], completed=True)
+        Todo.objects.create(user=self.user, title='Child', parent_todo=parent)
+        exported = b''.join(self.client.get(
+            reverse('todo-export'), {'format': 'json', 'include': 'categories,subtasks'}
+        ).streaming_content)
+        other = User.objects.create_user(username='other', password='pass12345')
+        self.client.force_authenticate(other)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.upload('todos.json', exported)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['created'], response.data['failed']), (2, 0))
+        self.assertEqual(response.data['categories_created'], ['Work'])
+        
+        child = Todo.objects.get(user=other, title='Child')
+        self.assertEqual(child.parent_todo.title, 'Parent')
+        self.assertEqual(child.path, child.parent_todo.path + child.pk.hex + '/')
+        self.assertEqual(Category.objects.get(user=other).color, '#ff0000')
+        imported = Todo.objects.get(user=other, title='Parent')
+        self.assertEqual(list(imported.tag_index.values_list('name', flat=True)), ['x'])
+        self.assertIsNotNone(imported.completed_at)
+        self.assertEqual(TodoSearchDocument.objects.filter(todo__user=other).count(), 2)
+        self.assertEqual(SyncChange.objects.filter(user=other, model='todo').count(), 2)
+        
+        incremental = sorted(DailyStats.objects.filter(user=other).values_list('date', 'created', 'completed'))
+        rollups.rebuild([other.pk])
+        self.assertEqual(incremental, sorted(DailyStats.objects.filter(user=other).values_list('date', 'created', 'completed')))
+    
+    def test_csv_and_ndjson_with_row_errors(self):
+        csv_file = 'title,priority,category,tags,due_date\nOne,high,Home,"a, b",2030-01-01 10:00\n,low,,,\nThree,urgent,,,\n'
+        response = self.upload('todos.csv', csv_file)
+        self.assertEqual((response.data['rows'], response.data['created'], response.data['failed']), (3, 1, 2))
+        self.assertEqual([error['row'] for error in response.data['errors']], [3, 4])
+        self.assertIn('priority', response.data['errors'][1]['error'])
+        todo = Todo.objects.get(title='One')
+        self.assertEqual((todo.category.name, todo.tags), ('Home', ['a', 'b']))
+        self.assertFalse(timezone.is_naive(todo.due_date))
+        
+        ndjson = '{"title": "Four"}\nnot json\n{"title": "Five", "parent_todo": "missing"}\n'
+        response = self.upload('todos.jsonl', gzip.compress(ndjson.encode()), format='ndjson')
+        self.assertEqual((response.data['created'], response.data['failed']), (1, 2))
+    
+    def test_dry_run_and_batches(self):
+        lines = ''.join(json.dumps({'title': f'Todo {index}', 'category_name': 'New'}) + '\n' for index in range(25))
+        response = self.upload('todos.ndjson', lines, dry_run='true')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['valid'], response.data['created']), (25, 0))
+        self.assertEqual(response.data['categories_created'], ['New'])
+        self.assertFalse(Todo.objects.exists() or Category.objects.exists())
+        
+        report = imports.import_todos(self.user, SimpleUploadedFile('todos.ndjson', lines.encode()), batch_size=10)
+        self.assertEqual(report['created'], 25)
+        positions = list(Todo.objects.order_by('position').values_list('title', flat=True))
+        self.assertEqual(positions, [f'Todo {index}' for index in range(25)])
+    
+    def test_json_stream_reads_across_blocks(self):
+        document = json.dumps({'exported_at': None, 'meta': {'a': [1, 2]}, 'todos': [{'title': 'é' * 5, 'estimated_minutes': 12345}] * 3})
+        stream = imports.JSONStream(StringIO(document), block_size=7)
+        self.assertEqual([item['estimated_minutes'] for _, item in stream.items()], [12345] * 3)
+        
+        response = self.upload('todos.json', '[{"title": "Ok"}, {"title": ')
+        # The row before the broken one was imported
+        self.assertEqual((response.status_code, response.data['created']), (201, 1))
+        self.assertIn('Invalid JSON', response.data['error'])
+        response = self.upload('todos.json', '[{"title": ')
+        self.assertEqual((response.status_code, response.data['created']), (400, 0))
+        self.assertEqual(self.upload('todos.txt', 'x').status_code, 400)
+
+@override_settings(TODO_ACTIVITY_SYNC=True)
+class AttachmentTests(TestCase):
+    """Attachments upload in one request or resumable chunks and download with Range support"""
+    
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        
+        self.user = User.objects.create_user(username='owner', password='pass12345')
+        self.todo = Todo.objects.create(user=self.user, title='With files')
+        self.client = APIClient()
+        self.client.force_login(self.user)
+        self.content = bytes(range(256)) * 40
+    
+    def attach(self):
+        upload = SimpleUploadedFile('notes.txt', self.content)
+        response = self.client.post(reverse('todo_attachments', args=[self.todo.pk]), {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        return TodoAttachment.objects.get(pk=response.data['id'])
+    
+    def download(self, attachment, **headers):
+        return self.client.get(reverse('attachment_download', args=[attachment.pk]), headers=headers)
+    
+    def test_ranges_and_conditional_requests(self):
+        attachment = self.attach()
+        response = self.download(attachment)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('attachment; filename="notes.txt"', response['Content-Disposition'])
+        
+        response = self.download(attachment, Range='bytes=10-19')
+        self.assertEqual((response.status_code, response['Content-Range']), (206, f'bytes 10-19/{len(self.content)}'))
+        self.assertEqual(b''.join(response.streaming_content), self.content[10:20])
+        self.assertEqual(b''.join(self.download(attachment, Range='bytes=-5').streaming_content), self.content[-5:])
+        self.assertEqual(self.download(attachment, Range=f'bytes={len(self.content)}-').status_code, 416)
+        self.assertEqual(self.download(attachment, Range='bytes=0-1', If_Range='"stale"').status_code, 200)
+        
+        etag = response['ETag']
+        self.assertEqual(self.download(attachment, If_None_Match=etag).status_code, 304)
+        self.assertEqual(self.download(attachment, If_Modified_Since=response['Last-Modified']).status_code, 304)
+        
+        other = User.objects.create_user(username='other', password='pass12345')
+        self.client.force_login(other)
+        self.assertEqual(self.download(attachment).status_code, 403)
+    
+    @override_settings(TODO_ATTACHMENT_SENDFILE='x-accel-redirect', TODO_ATTACHMENT_ACCEL_PREFIX='/protected/')
+    def test_front_server_sends_the_file(self):
+        attachment = self.attach()
+        response = self.download(attachment)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected/' + attachment.file.name)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['Content-Type'], 'text/plain')
+    
+    @override_settings(TODO_UPLOAD_CHUNK_SIZE=4096)
+    def test_resumable_upload(self):
+        size = len(self.content)
+        response = self.client.post(reverse('todo_uploads', args=[self.todo.pk]), {'filename': 'big.bin', 'size': size}, format='json')
+        self.assertEqual((response.status_code, response.data['offset']), (201, 0))
+        url = reverse('upload_detail', args=[response.data['id']])
+        
+        def send(start, end, total=size):
+            return self.client.generic(
+                'PATCH', url, self.content[start:end + 1], content_type='application/octet-stream',
+                headers={'Content-Range': f'bytes {start}-{end}/{total}'}
+            )
+        
+        self.assertEqual(send(0, 4095).data['offset'], 4096)
+        self.assertEqual(send(0, 4095).status_code, 409)
+        self.assertEqual(send(4096, size - 1).status_code, 413)
+        self.assertEqual(send(4096, 5000, total=size + 1).status_code, 400)
+        self.assertEqual(self.client.get(url).data['offset'], 4096)
+        self.assertEqual(send(4096, 8191).status_code, 200)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            response = send(8192, size - 1)
+        self.assertEqual(response.status_code, 201)
+        attachment = TodoAttachment.objects.get(pk=response.data['attachment']['id'])
+        with attachment.file.open('rb') as file:
+            self.assertEqual(file.read(), self.content)
+        self.assertFalse(AttachmentUpload.objects.exists())
+        self.assertEqual(os.listdir(os.path.join(self.media_root, attachments.UPLOAD_DIR)), [])
+        self.assertTrue(ActivityLog.objects.filter(action='attached', todo=self.todo).exists())
+        
+        path = attachment.file.path
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.delete(reverse('attachment_detail', args=[attachment.pk])).status_code, 204)
+        self.assertFalse(os.path.exists(path))
+    
+    def test_prune_abandoned_uploads(self):
+        upload = attachments.start_upload(self.todo, self.user, '../../etc/passwd', 10)
+        self.assertEqual(upload.filename, 'passwd')
+        AttachmentUpload.objects.update(updated_at=timezone.now() - timedelta(days=2))
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('prune_uploads', stdout=StringIO())
+        self.assertFalse(AttachmentUpload.objects.exists())
+        self.assertFalse(os.path.exists(attachments.part_path(upload)))
+    
+    def test_identical_content_is_stored_once(self):
+        first = self.attach()
+        other_todo = Todo.objects.create(user=self.user, title='Same file')
+        second = attachments.attach(other_todo, self.user, SimpleUploadedFile('copy.txt', self.content))
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertEqual(Blob.objects.get().ref_count, 2)
+        self.assertEqual(self.download(second)['ETag'], f'"{second.blob_id}"')
+        path = first.file.path
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.todo.delete()
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(Blob.objects.get().ref_count, 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            other_todo.delete()
+        self.assertFalse(os.path.exists(path) or Blob.objects.exists())
+    
+    def test_garbage_collection(self):
+        attachment = self.attach()
+        Blob.objects.update(ref_count=5)
+        orphan = os.path.join(self.media_root, 'blobs', 'ff', 'ff', 'f' * 64)
+        os.makedirs(os.path.dirname(orphan))
+        open(orphan, 'wb').close()
+        legacy = TodoAttachment.objects.create(
+            todo=self.todo, uploaded_by=self.user, filename='old.txt', file_size=3,
+            file=SimpleUploadedFile('old.txt', b'old')
+        )
+        TodoAttachment.objects.filter(pk=legacy.pk).update(file='attachments/old.txt', blob=None)
+        os.makedirs(os.path.join(self.media_root, 'attachments'))
+        with open(os.path.join(self.media_root, 'attachments', 'old.txt'), 'wb') as file:
+            file.write(self.content)
+        
+        call_command('collect_blobs', '--grace=0', '--adopt-legacy', stdout=StringIO())
+        legacy.refresh_from_db()
+        self.assertEqual(legacy.blob_id, attachment.blob_id)
+        self.assertEqual(Blob.objects.get(pk=attachment.blob_id).ref_count, 2)
+        self.assertFalse(os.path.exists(orphan))
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, 'attachments', 'old.txt')))
+        self.assertEqual(Blob.objects.count(), 1)
+
+@override_settings(TODO_ACTIVITY_SYNC=True, TODO_THUMBNAIL_SYNC=True)
+class ThumbnailTests(TestCase):
+    """Avatars and image attachments get WebP thumbnails rendered outside the request"""
+    
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        
+        self.user = User.objects.create_user(username='owner', password='pass12345')
+        self.client = APIClient()
+        self.client.force_login(self.user)
+    
+    def image(self, name, size=(1200, 800), format='PNG'):
+        output = BytesIO()
+        Image.new('RGB', size, 'teal').save(output, format)
+        return SimpleUploadedFile(name, output.getvalue())
+    
+    def test_attachment_previews(self):
+        todo = Todo.objects.create(user=self.user, title='Photos')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('todo_attachments', args=[todo.pk]), {'file': self.image('photo.png')}, format='multipart')
+        preview_url = response.data['preview_urls'][320]
+        digest = TodoAttachment.objects.get(pk=response.data['id']).blob_id
+        # Rendered when the attachment was saved
+        self.assertTrue(os.path.exists(os.path.join(self.media_root, thumbnails.derivative_name(digest, 1024, False))))
+        
+        preview = self.client.get(preview_url)
+        self.assertEqual((preview.status_code, preview['Content-Type']), (200, 'image/webp'))
+        with Image.open(BytesIO(b''.join(preview.streaming_content))) as image:
+            self.assertEqual(image.size, (320, 213))
+        self.assertEqual(self.client.get(preview_url, headers={'If-None-Match': preview['ETag']}).status_code, 304)
+        
+        response = self.client.post(reverse('todo_attachments', args=[todo.pk]), {'file': SimpleUploadedFile('a.txt', b'text')}, format='multipart')
+        self.assertIsNone(response.data['preview_urls'])
+        self.assertEqual(self.client.get(reverse('attachment_preview', args=[response.data['id'], 320])).status_code, 404)
+    
+    def test_avatar_thumbnails(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.put(reverse('update_profile'), {'avatar': self.image('me.jpg', format='JPEG')}, format='multipart')
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        self.assertEqual(len(self.user.avatar_digest), 64)
+        urls = response.data['user']['avatar_urls']
+        self.assertEqual(sorted(urls), list(thumbnails.AVATAR_SIZES))
+        self.assertIn(f'?v={self.user.avatar_digest[:12]}', urls[64])
+        
+        avatar = self.client.get(urls[64])
+        self.assertIn('immutable', avatar['Cache-Control'])
+        with Image.open(BytesIO(b''.join(avatar.streaming_content))) as image:
+            self.assertEqual(image.size, (64, 64))
+    
+    @override_settings(TODO_THUMBNAIL_SYNC=False)
+    def test_rendered_by_the_process_pool(self):
+        source = os.path.join(self.media_root, 'source.png')
+        with open(source, 'wb') as file:
+            file.write(self.image('source.png', size=(50, 100)).read())
+        # Scheduled, not waited for
+        self.assertIsNone(thumbnails.derivative(source, 'a' * 64, 32, crop=True))
+        future = thumbnails.renderer.submit(source, 'a' * 64, 32, crop=True)
+        if future is not None:
+            future.result(60)
+        with Image.open(thumbnails.derivative(source, 'a' * 64, 32, crop=True)) as image:
+            self.assertEqual((image.format, image.size), ('WEBP', (32, 32)))
+
+@override_settings(TODO_ACTIVITY_SYNC=True)
+class ReminderTests(TestCase):
+    """The scheduler mails due reminders once, in batches over one connection"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='pass12345', email='owner@example.com')
+        self.now = timezone.now()
+    
+    def remind(self, minutes, user=None, **fields):
+        return Todo.objects.create(
+            user=user or self.user, title=f'In {minutes}', reminder_date=self.now + timedelta(minutes=minutes), **fields
+        )
+    
+    def test_sends_due_reminders_once(self):
+        due = [self.remind(-minutes) for minutes in range(1, 6)]
+        later = self.remind(30)
+        self.remind(-1, completed=True)
+        quiet = User.objects.create_user(username='quiet', password='pass12345', email='quiet@example.com')
+        UserPreferences.objects.create(user=quiet, email_reminders=False)
+        self.remind(-1, user=quiet)
+        
+        scheduler = reminders.Scheduler(batch_size=2)
+        with mock.patch('todos.reminders.get_connection', wraps=reminders.get_connection) as connect:
+            self.assertEqual(scheduler.run_once(self.now), 5)
+        # Three batches over one connection
+        self.assertEqual(connect.call_count, 1)
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(mail.outbox[0].subject, 'Reminder: In -5')
+        self.assertTrue(all(Todo.objects.get(pk=todo.pk).reminder_sent for todo in due))
+        self.assertFalse(reminders.pending().exclude(pk=later.pk).exists())
+        
+        self.assertEqual(reminders.Scheduler().run_once(self.now), 0)
+        self.assertEqual(reminders.Scheduler().run_once(self.now + timedelta(hours=1)), 1)
+    
+    def test_claims_are_exclusive(self):
+        todos = [self.remind(-1), self.remind(-2)]
+        # Another scheduler took the first meanwhile
+        Todo.objects.filter(pk=todos[0].pk).update(reminder_sent=True)
+        self.assertEqual(reminders.claim([todo.pk for todo in todos], self.now), [todos[1].pk])
+        self.assertEqual(reminders.claim([todo.pk for todo in todos], self.now), [])
+    
+    def test_failed_batch_is_released(self):
+        todo = self.remind(-1)
+        scheduler = reminders.Scheduler()
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=OSError):
+            with self.assertRaises(OSError):
+                scheduler.run_once(self.now)
+        todo.refresh_from_db()
+        self.assertFalse(todo.reminder_sent)
+        self.assertEqual(scheduler.run_once(self.now), 1)
+    
+    def test_failure_partway_releases_only_the_unsent(self):
+        todos = [self.remind(-minutes) for minutes in (3, 2, 1)]
+        real_send = mail.get_connection().__class__.send_messages
+        calls = []
+        
+        def flaky(backend, messages):
+            calls.append(messages)
+            if len(calls) == 2:
+                raise OSError
+            return real_send(backend, messages)
+        
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', flaky):
+            with self.assertRaises(OSError):
+                reminders.Scheduler().run_once(self.now)
+        self.assertEqual([m.subject for m in mail.outbox], ['Reminder: In -3'])
+        self.assertEqual(
+            [Todo.objects.get(pk=todo.pk).reminder_sent for todo in todos], [True, False, False]
+        )
+        
+        self.assertEqual(reminders.Scheduler().run_once(self.now), 2)
+        self.assertEqual([m.subject for m in mail.outbox], ['Reminder: In -3', 'Reminder: In -2', 'Reminder: In -1'])
+    
+    def test_rescheduling_resets_the_reminder(self):
+        todo = self.remind(-1, reminder_sent=True)
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.patch(reverse('todo-detail', args=[todo.pk]), {'reminder_date': (self.now + timedelta(days=1)).isoformat()}, format='json')
+        self.assertFalse(response.data['reminder_sent'])
+
+@override_settings(TODO_ACTIVITY_SYNC=True)
+class RecurrenceTests(TestCase):
+    """Occurrences are computed for reads and materialized one at a time"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='pass12345')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.start = timezone.make_aware(datetime(2024, 1, 31, 9, 0))
+    
+    def series(self, pattern, **fields):
+        return Todo.objects.create(
+            user=self.user, title=pattern, due_date=self.start, is_recurring=True, recurrence_pattern=pattern, **fields
+        )
+    
+    def test_occurrences_are_computed_without_rows(self):
+        monthly = self.series('monthly', recurrence_end_date=datetime(2024, 6, 30).date())
+        due_dates = [item.due_date for item in recurrence.occurrences(monthly, self.start, self.start + timedelta(days=365))]
+        self.assertEqual(
+            [(due.month, due.day, due.hour) for due in due_dates],
+            [(2, 29, 9), (3, 31, 9), (4, 30, 9), (5, 31, 9), (6, 30, 9)]
+        )
+        # A range far into the series starts there rather than stepping to it
+        daily = self.series('daily', reminder_date=self.start - timedelta(hours=1))
+        later = self.start + timedelta(days=1000)
+        with mock.patch('todos.recurrence.occurrence', wraps=recurrence.occurrence) as step:
+            window = recurrence.occurrences(daily, later, later + timedelta(days=3))
+        self.assertLess(step.call_count, 10)
+        self.assertEqual([item.due_date for item in window], [later + timedelta(days=days) for days in range(3)])
+        self.assertEqual(window[0].reminder_date, later - timedelta(hours=1))
+        
+        expanded = recurrence.expand(Todo.objects.all(), self.start, self.start + timedelta(days=3))
+        self.assertEqual([item.todo for item in expanded], [daily, daily])
+        self.assertEqual(Todo.objects.count(), 2)
+        
+        response = self.client.get(reverse('todo-occurrences', args=[daily.pk]), {'start': '2024-03-01', 'limit': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['occurrences']), 2)
+        response = self.client.get(reverse('todo-occurrences', args=[daily.pk]), {'start': '2024-03-01', 'end': '2026-01-01'})
+        self.assertEqual(response.status_code, 400)
+    
+    def test_completing_creates_the_next_occurrence(self):
+        weekly = self.series('weekly', tags=['gym'])
+        weekly.shared_with.add(User.objects.create_user(username='friend', password='pass12345'))
+        weekly.is_shared = True
+        weekly.save()
+        
+        response = self.client.post(reverse('todo-toggle', args=[weekly.pk]))
+        self.assertFalse(response.data['is_recurring'])
+        upcoming = Todo.objects.get(is_recurring=True)
+        self.assertEqual(upcoming.due_date, recurrence.next_occurrence(weekly, timezone.now()))
+        self.assertGreater(upcoming.due_date, timezone.now())
+        self.assertFalse(upcoming.completed)
+        self.assertEqual(list(upcoming.tag_index.values_list('name', flat=True)), ['gym'])
+        self.assertEqual(upcoming.shared_with.count(), 1)
+        self.assertTrue(TodoSearchDocument.objects.filter(todo=upcoming).exists())
+        
+        # Completing the old occurrence again, or in bulk, hands nothing on
+        self.client.post(reverse('todo-toggle', args=[weekly.pk]))
+        self.client.post(reverse('todo-toggle', args=[weekly.pk]))
+        self.assertEqual(Todo.objects.count(), 2)
+        bulk.run(self.user, 'complete', [upcoming.pk])
+        self.assertEqual(Todo.objects.filter(is_recurring=True).count(), 1)
+        self.assertEqual(Todo.objects.count(), 3)
+    
+    def test_roll_forward_creates_missed_occurrences(self):
+        daily = self.series('daily', reminder_date=self.start)
+        ended = self.series('daily', recurrence_end_date=self.start.date())
+        now = self.start + timedelta(days=40, hours=1)
+        
+        created = recurrence.roll_forward(now=now, catch_up=5)
+        self.assertEqual(created, 5)
+        rows = list(Todo.objects.exclude(pk__in=[daily.pk, ended.pk]).order_by('due_date'))
+        self.assertEqual([todo.due_date for todo in rows], [self.start + timedelta(days=days) for days in range(36, 41)])
+        self.assertEqual([todo.is_recurring for todo in rows], [False] * 4 + [True])
+        self.assertEqual(rows[-1].reminder_date, rows[-1].due_date)
+        daily.refresh_from_db()
+        self.assertFalse(daily.is_recurring)
+        
+        self.assertEqual(recurrence.roll_forward(now=now), 0)
+        self.assertEqual(recurrence.roll_forward(now=now + timedelta(days=2)), 2)
+
+class DigestTests(TestCase):
+    """Digests are computed per chunk of users and resume where they stopped"""
+    
+    def setUp(self):
+        self.now = timezone.now()
+        self.today = timezone.localdate(self.now)
+        self.users = []
+        for index in range(4):
+            user = User.objects.create_user(username=f'user{index}', password='pass12345', email=f'user{index}@example.com')
+            UserPreferences.objects.create(user=user, email_daily_summary=True)
+            Todo.objects.create(user=user, title=f'Overdue {index}', due_date=self.now - timedelta(hours=2))
+            Todo.objects.create(user=user, title=f'Later {index}', due_date=self.now + timedelta(days=30))
+            self.users.append(user)
+        # Opted out, without an address, and with nothing to tell
+        UserPreferences.objects.create(user=User.objects.create_user(username='out', password='pass12345', email='out@example.com'))
+        UserPreferences.objects.create(user=User.objects.create_user(username='nomail', password='pass12345'), email_daily_summary=True)
+        UserPreferences.objects.create(user=User.objects.create_user(username='idle', password='pass12345', email='idle@example.com'), email_daily_summary=True)
+    
+    def test_summaries_take_a_fixed_number_of_queries(self):
+        ids = [user.pk for user in self.users]
+        with self.assertNumQueries(3):
+            summaries = digests.summarize(ids, 'daily', self.today, self.now)
+        summary = summaries[ids[0]]
+        self.assertEqual((summary['open'], summary['overdue'], summary['due']), (2, 1, 1))
+        self.assertEqual([item['title'] for item in summary['upcoming']], ['Overdue 0'])
+    
+    def test_sends_each_digest_once_and_resumes(self):
+        real_send = mail.get_connection().__class__.send_messages
+        calls = []
+        def flaky(backend, messages):
+            calls.append(len(messages))
+            if len(calls) == 2:
+                raise OSError('connection lost')
+            return real_send(backend, messages)
+        
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', flaky):
+            with self.assertRaises(OSError):
+                digests.send_digests('daily', self.today, chunk_size=2, now=self.now)
+        self.assertEqual(len(mail.outbox), 2)
+        
+        run = digests.send_digests('daily', self.today, chunk_size=2, now=self.now)
+        self.assertEqual(run.sent, 4)
+        self.assertIsNotNone(run.finished_at)
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), [f'user{index}@example.com' for index in range(4)])
+        self.assertIn('Overdue 0', mail.outbox[0].body)
+        self.assertNotIn('Later 0', mail.outbox[0].body)
+        
+        # A finished run sends nothing again
+        digests.send_digests('daily', self.today, now=self.now)
+        self.assertEqual(len(mail.outbox), 4)
+        self.assertEqual(DigestRun.objects.count(), 1)
+
+class CalendarTests(TestCase):
+    """The calendar returns compact cells grouped by local day"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='pass12345')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.category = Category.objects.create(user=self.user, name='Work')
+        self.start = timezone.make_aware(datetime(2024, 5, 1))
+    
+    def todo(self, title, due_date, **fields):
+        return Todo.objects.create(user=self.user, title=title, due_date=due_date, **fields)
+    
+    def test_month_is_grouped_by_local_day(self):
+        self.todo('Morning', self.start + timedelta(days=2, hours=9), category=self.category)
+        late = self.todo('Late', self.start + timedelta(days=2, hours=23, minutes=30), completed=True)
+        self.todo('Next month', self.start + timedelta(days=40))
+        self.todo('Archived', self.start + timedelta(days=3), is_archived=True)
+        self.todo('Weekly', self.start + timedelta(days=20, hours=8), is_recurring=True, recurrence_pattern='weekly')
+        
+        response = self.client.get(reverse('calendar'), {'start': '2024-05-01', 'end': '2024-06-01'})
+        self.assertEqual(response.status_code, 200)
+        days = response.data['days']
+        self.assertEqual(list(days), ['2024-05-03', '2024-05-21', '2024-05-28'])
+        self.assertEqual([entry['title'] for entry in days['2024-05-03']], ['Morning', 'Late'])
+        self.assertEqual(days['2024-05-03'][0]['time'], '09:00')
+        self.assertEqual(days['2024-05-03'][0]['category'], str(self.category.pk))
+        self.assertEqual(set(days['2024-05-03'][0]), {'id', 'title', 'time', 'priority', 'completed', 'category', 'recurring', 'occurrence'})
+        self.assertTrue(days['2024-05-28'][0]['occurrence'])
+        self.assertEqual(response.data['categories'][str(self.category.pk)]['name'], 'Work')
+        
+        # The same range in Tokyo moves the late todo to the next day
+        response = self.client.get(reverse('calendar'), {'start': '2024-05-01', 'end': '2024-06-01', 'tz': 'Asia/Tokyo'})
+        self.assertEqual([entry['id'] for entry in response.data['days']['2024-05-04']], [str(late.pk)])
+        
+        # Todos, series and categories
+        with self.assertNumQueries(3):
+            calendars.calendar_days(self.user, self.start, self.start + timedelta(days=31), timezone.get_current_timezone())
+    
+    def test_range_is_validated(self):
+        self.assertEqual(self.client.get(reverse('calendar'), {'start': '2024-05-01'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('calendar'), {'start': '2024-05-01', 'end': '2024-12-01'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('calendar'), {'start': '2024-05-01', 'end': 'soon'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('calendar'), {'start': '2024-05-01', 'end': '2024-06-01', 'tz': 'Mars/Base'}).status_code, 400)
+
+class BoardTests(TestCase):
+    """Boards fetch the first cards and totals of every column in one query"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='pass12345')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.work = Category.objects.create(user=self.user, name='Work')
+        Category.objects.create(user=self.user, name='Empty')
+        for index in range(5):
+            Todo.objects.create(user=self.user, title=f'High {index}', priority='high', position=index, category=self.work)
+        Todo.objects.create(user=self.user, title='Low', priority='low', completed=True)
+        Todo.objects.create(user=self.user, title='Archived', priority='low', is_archived=True)
+    
+    def test_columns_are_capped_with_totals(self):
+        response = self.client.get(reverse('board'), {'group_by': 'priority', 'limit': 2})
+        self.assertEqual(response.status_code, 200)
+        columns = {column['key']: column for column in response.data['columns']}
+        self.assertEqual(list(columns), ['high', 'medium', 'low'])
+        self.assertEqual(columns['high']['count'], 5)
+        self.assertEqual([card['title'] for card in columns['high']['cards']], ['High 0', 'High 1'])
+        self.assertEqual((columns['medium']['count'], columns['medium']['cards']), (0, []))
+        self.assertEqual(columns['low']['count'], 1)
+        self.assertIsNone(columns['low']['next'])
+        
+        # Load the rest of the column from its cursor
+        titles = []
+        url = columns['high']['next']
+        while url:
+            page = self.client.get(url).data
+            titles += [card['title'] for card in page['results']]
+            url = page['next']
+        self.assertEqual(titles, ['High 2', 'High 3', 'High 4'])
+        
+        response = self.client.get(reverse('board'), {'group_by': 'category'})
+        columns = {column['title']: column['count'] for column in response.data['columns']}
+        self.assertEqual(columns, {'Uncategorized': 1, 'Empty': 0, 'Work': 5})
+        response = self.client.get(reverse('board'))
+        self.assertEqual([column['count'] for column in response.data['columns']], [5, 1])
+    
+    def test_board_takes_one_query(self):
+        with self.assertNumQueries(1):
+            boards.board(self.user, 'status', 2, lambda key, todo: key)
+        self.assertEqual(self.client.get(reverse('board'), {'group_by': 'colour'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('board_column'), {'group_by': 'priority', 'column': 'urgent'}).status_code, 400)
 
-# Create your tests here.
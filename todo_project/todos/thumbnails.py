@@ -0,0 +1,162 @@
+# todos/thumbnails.py
+
+import hashlib
+import logging
+import mimetypes
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+
+logger = logging.getLogger(__name__)
+
+# Image derivatives. Avatars and image attachments get small WebP renditions
+# (square crops for avatars, fitted previews for attachments), rendered by a
+# pool of worker processes so Pillow never runs in a request thread. Each
+# rendition is stored once under derivatives/, named by the source's SHA-256
+# and the size, so it never goes stale and identical sources share it. They
+# are scheduled when the source is saved; a request for one that is not
+# ready yet schedules it and is told to come back, without waiting on it.
+#
+# This module must not import models: the workers are spawned processes
+# that import it to find render() without setting Django up.
+
+AVATAR_SIZES = (32, 64, 128)
+PREVIEW_SIZES = (320, 1024)
+
+DERIVATIVE_DIR = 'derivatives'
+
+# Source formats rendered (by their file name)
+IMAGE_TYPES = {'image/jpeg', 'image/png', 'image/gif', 'image/webp', 'image/bmp', 'image/tiff'}
+
+# Worker processes (TODO_THUMBNAIL_WORKERS)
+DEFAULT_WORKERS = 2
+
+# Render in the calling thread instead, e.g. in tests (TODO_THUMBNAIL_SYNC)
+DEFAULT_SYNC = False
+
+# WebP quality, 0-100 (TODO_THUMBNAIL_QUALITY)
+DEFAULT_QUALITY = 80
+
+# Worker
+
+def render(source, target, size, crop, quality):
+    """Write a WebP of source at most size pixels square (cropped to fill it with crop) to target"""
+    from PIL import Image, ImageOps
+    
+    with Image.open(source) as image:
+        # Lets JPEG decode at a fraction of the full size
+        image.draft('RGB', (size, size))
+        image = ImageOps.exif_transpose(image)
+        if crop:
+            image = ImageOps.fit(image, (size, size), Image.LANCZOS)
+        else:
+            image.thumbnail((size, size), Image.LANCZOS)
+        if image.mode not in ('RGB', 'RGBA'):
+            has_alpha = 'A' in image.getbands() or 'transparency' in image.info
+            image = image.convert('RGBA' if has_alpha else 'RGB')
+        
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        partial = f'{target}.{os.getpid()}.tmp'
+        image.save(partial, 'WEBP', quality=quality, method=4)
+        os.replace(partial, target)
+    return target
+
+# Scheduling
+
+def setting(name, default):
+    return getattr(settings, name, default)
+
+def derivative_name(digest, size, crop):
+    return f"{DERIVATIVE_DIR}/{digest[:2]}/{digest}-{'c' if crop else 'f'}{size}.webp"
+
+def is_image(filename):
+    return mimetypes.guess_type(filename)[0] in IMAGE_TYPES
+
+def hash_file(file):
+    """SHA-256 of a django File, read in chunks"""
+    hasher = hashlib.sha256()
+    for chunk in file.chunks():
+        hasher.update(chunk)
+    return hasher.hexdigest()
+
+class Renderer:
+    """Process pool rendering derivatives, each at most once at a time"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.executor = None
+        self.pid = None
+        self.pending = {}
+    
+    def pool(self):
+        # A pool does not survive fork(), so each worker process starts its own
+        if self.executor is None or self.pid != os.getpid():
+            self.pid = os.getpid()
+            self.pending = {}
+            self.executor = ProcessPoolExecutor(
+                max_workers=setting('TODO_THUMBNAIL_WORKERS', DEFAULT_WORKERS),
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return self.executor
+    
+    def submit(self, source, digest, size, crop):
+        """Future of the path of a derivative, rendering it unless it exists or is underway"""
+        target = default_storage.path(derivative_name(digest, size, crop))
+        with self.lock:
+            future = self.pending.get(target)
+            if future is not None:
+                return future
+            if os.path.exists(target):
+                return None
+            args = (source, target, size, crop, setting('TODO_THUMBNAIL_QUALITY', DEFAULT_QUALITY))
+            if setting('TODO_THUMBNAIL_SYNC', DEFAULT_SYNC):
+                try:
+                    render(*args)
+                except Exception:
+                    logger.exception('Rendering %s failed', target)
+                return None
+            try:
+                future = self.pool().submit(render, *args)
+            except BrokenProcessPool:
+                # A worker died; start over with a fresh pool
+                self.executor = None
+                future = self.pool().submit(render, *args)
+            self.pending[target] = future
+        future.add_done_callback(lambda done: self.finished(target, done))
+        return future
+    
+    def finished(self, target, future):
+        with self.lock:
+            if self.pending.get(target) is future:
+                del self.pending[target]
+        if not future.cancelled() and future.exception() is not None:
+            logger.error('Rendering %s failed', target, exc_info=future.exception())
+
+renderer = Renderer()
+
+def schedule(source, digest, sizes, crop):
+    """Render the derivatives of source (a path) in the background"""
+    for size in sizes:
+        renderer.submit(source, digest, size, crop)
+
+def schedule_avatar(user):
+    if user.avatar and user.avatar_digest:
+        schedule(user.avatar.path, user.avatar_digest, AVATAR_SIZES, crop=True)
+
+def schedule_preview(attachment):
+    if attachment.blob_id and is_image(attachment.filename):
+        schedule(attachment.file.path, attachment.blob_id, PREVIEW_SIZES, crop=False)
+
+def derivative(source, digest, size, crop):
+    """Path of a derivative if it is rendered; otherwise schedules it and returns None"""
+    path = default_storage.path(derivative_name(digest, size, crop))
+    if os.path.exists(path):
+        return path
+    renderer.submit(source, digest, size, crop)
+    # Already there when rendered inline (TODO_THUMBNAIL_SYNC)
+    return path if os.path.exists(path) else None
@@ -21,10 +21,26 @@ urlpatterns = [
     
     # Todo-related endpoints
     path('todos/<uuid:todo_id>/comments/', views.todo_comments, name='todo_comments'),
+    path('todos/<uuid:todo_id>/attachments/', views.todo_attachments, name='todo_attachments'),
+    path('todos/<uuid:todo_id>/uploads/', views.todo_uploads, name='todo_uploads'),
+    path('uploads/<uuid:upload_id>/', views.upload_detail, name='upload_detail'),
+    path('attachments/<uuid:attachment_id>/', views.attachment_detail, name='attachment_detail'),
+    path('attachments/<uuid:attachment_id>/download/', views.attachment_download, name='attachment_download'),
+    path('attachments/<uuid:attachment_id>/preview/<int:size>/', views.attachment_preview, name='attachment_preview'),
+    path('users/<int:user_id>/avatar/<int:size>/', views.user_avatar, name='user_avatar'),
     
     # Statistics and activity
     path('stats/', views.get_statistics, name='statistics'),
+    path('calendar/', views.get_calendar, name='calendar'),
+    path('board/', views.get_board, name='board'),
+    path('board/column/', views.get_board_column, name='board_column'),
     path('activity/', views.get_activity_feed, name='activity_feed'),
+    path('activity/history/', views.get_activity_history, name='activity_history'),
+    path('tags/', views.get_tag_facets, name='tag_facets'),
+    
+    # Delta sync
+    path('sync/', views.get_sync, name='sync'),
+    path('events/', views.event_stream, name='event_stream'),
     
     # User search
     path('users/search/', views.search_users, name='search_users'),
@@ -4,19 +4,42 @@ from django.shortcuts import render
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.csrf import ensure_csrf_cookie
+from django.views.decorators.http import require_safe
 from django.middleware.csrf import get_token
-from django.http import JsonResponse
-from django.db.models import Q, Count, Avg, Sum, F  # Added F here
+from django.http import FileResponse, HttpResponseNotModified, JsonResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.core.exceptions import ValidationError
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q, Count, Sum
 from django.utils import timezone
+from django.urls import reverse
+from django.utils.http import parse_etags, urlencode
 from rest_framework import status, viewsets, permissions
-from rest_framework.decorators import api_view, permission_classes, action
+from rest_framework.decorators import api_view, permission_classes, parser_classes, action
 from rest_framework.response import Response
+from rest_framework.parsers import MultiPartParser
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.utils.urls import replace_query_param
 from rest_framework.permissions import AllowAny, IsAuthenticated
-from rest_framework.pagination import PageNumberPagination
+from asgiref.sync import sync_to_async
 from datetime import datetime, timedelta
 import json
 
-from .models import User, Todo, Category, TodoComment, TodoAttachment, ActivityLog, TodoTemplate
+from .models import (
+    User, Todo, Category, TodoComment, TodoAttachment, AttachmentUpload, ActivityLog, TodoTemplate
+)
+from .conditional import ConditionalGetMixin, conditional_get, next_overdue
+from .export import RENDERERS as EXPORT_RENDERERS, export_response, parse_include
+from .imports import ImportFileError, import_todos
+from .pagination import KeysetPagination, TodoPagination, uses_keyset
+from .retention import activity_history, decode_cursor, encode_cursor
+from . import activity, attachments, bulk, caching, events, ordering, recurrence, sync, thumbnails
+from .boards import CARD_FIELDS, ColumnPagination, board, board_todos, card, column_filter, parse_group_by, parse_limit
+from .calendars import MAX_DAYS as CALENDAR_MAX_DAYS, calendar_days
+from .search import search_todos
+from .stats import compute_statistics, parse_timezone, parse_window
+from .tags import tag_facets
 from .serializers import (
     UserSerializer, TodoSerializer, CategorySerializer, 
     TodoCommentSerializer, TodoAttachmentSerializer, 
@@ -56,7 +79,7 @@ def register_user(request):
             Category.objects.create(user=user, **cat_data)
         
         # Log activity
-        ActivityLog.objects.create(
+        activity.log(
             user=user,
             action='created',
             todo_title='Account',
@@ -124,18 +147,38 @@ def update_user_profile(request):
     
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+def json_changes(validated_data):
+    """Validated fields as JSON values: dates as ISO strings, related objects as their pk"""
+    return json.loads(json.dumps(
+        {field: getattr(value, 'pk', value) for field, value in validated_data.items()}, cls=JSONEncoder
+    ))
+
 # Todo ViewSet
-class TodoViewSet(viewsets.ModelViewSet):
-    """ViewSet for Todo CRUD operations"""
+class TodoViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
+    """
+    ViewSet for Todo CRUD operations
+    
+    Query budget for a list page, independent of page size and of how many
+    users each todo is shared with:
+      1 COUNT for pagination
+      1 page query (comment/attachment counts are subquery annotations)
+      3 prefetches: user, category, shared_with
+      1 query for every subtask of the page at any depth (materialized
+      path range scans), plus the same 3 prefetches if there are any
+    Prefetches whose ids are all empty (e.g. no categories) are skipped.
+    ?subtask_depth=N limits how many subtask levels are loaded.
+    
+    ?pagination=cursor switches to keyset pagination, which drops the COUNT
+    (unless ?total=true) and the OFFSET scan. It keys on the list order, so
+    it cannot page through ?search= results, which are ordered by relevance.
+    """
     serializer_class = TodoSerializer
     permission_classes = [IsAuthenticated]
-    pagination_class = PageNumberPagination
+    pagination_class = TodoPagination
     
     def get_queryset(self):
         """Get todos for current user with filters"""
-        queryset = Todo.objects.filter(
-            Q(user=self.request.user) | Q(shared_with=self.request.user)
-        ).distinct()
+        queryset = Todo.objects.visible_to(self.request.user).with_list_data()
         
         # Apply filters
         category = self.request.query_params.get('category', None)
@@ -144,6 +187,8 @@ class TodoViewSet(viewsets.ModelViewSet):
         archived = self.request.query_params.get('archived', None)
         search = self.request.query_params.get('search', None)
         due_date = self.request.query_params.get('due_date', None)
+        tags = self.request.query_params.get('tags', None)
+        tags_match = self.request.query_params.get('tags_match', 'any')
         
         if category and category != 'all':
             queryset = queryset.filter(category__id=category)
@@ -159,12 +204,11 @@ class TodoViewSet(viewsets.ModelViewSet):
         else:
             queryset = queryset.filter(is_archived=False)
         
+        if tags:
+            queryset = queryset.with_tags(tags.split(','), match_all=tags_match == 'all')
+        
         if search:
-            queryset = queryset.filter(
-                Q(title__icontains=search) | 
-                Q(description__icontains=search) |
-                Q(tags__icontains=search)
-            )
+            queryset = search_todos(queryset, search)
         
         if due_date:
             today = timezone.now().date()
@@ -178,54 +222,98 @@ class TodoViewSet(viewsets.ModelViewSet):
         
         return queryset
     
+    def list(self, request, *args, **kwargs):
+        if request.query_params.get('search') and uses_keyset(request):
+            return Response(
+                {'error': 'Cursor pagination is not available with search; use page numbers'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return super().list(request, *args, **kwargs)
+    
+    def conditional_valid_until(self, response):
+        # is_overdue flips when the next open todo on the page falls due
+        data = response.data
+        todos = data.get('results', [data]) if isinstance(data, dict) else data
+        return next_overdue(todos)
+    
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        subtask_depth = self.request.query_params.get('subtask_depth')
+        if subtask_depth is not None and subtask_depth.isdigit():
+            context['subtask_depth'] = int(subtask_depth)
+        return context
+    
     def perform_create(self, serializer):
-        """Create todo and log activity"""
-        todo = serializer.save(user=self.request.user)
-        
-        ActivityLog.objects.create(
-            user=self.request.user,
-            action='created',
-            todo=todo,
-            todo_title=todo.title
-        )
+        """Create todo at the top of the list and log activity"""
+        with transaction.atomic():
+            if 'position' in serializer.validated_data:
+                todo = serializer.save(user=self.request.user)
+            else:
+                todo = serializer.save(user=self.request.user, position=ordering.top_position(self.request.user.pk))
+            
+            activity.log(
+                user=self.request.user,
+                action='created',
+                todo=todo,
+                todo_title=todo.title
+            )
     
     def perform_update(self, serializer):
         """Update todo and log activity"""
-        todo = serializer.save()
-        
-        ActivityLog.objects.create(
-            user=self.request.user,
-            action='updated',
-            todo=todo,
-            todo_title=todo.title,
-            details={'changes': serializer.validated_data}
-        )
+        with transaction.atomic():
+            todo = serializer.save()
+            
+            activity.log(
+                user=self.request.user,
+                action='updated',
+                todo=todo,
+                todo_title=todo.title,
+                details={'changes': json_changes(serializer.validated_data)}
+            )
     
     def perform_destroy(self, instance):
         """Delete todo and log activity"""
-        ActivityLog.objects.create(
-            user=self.request.user,
-            action='deleted',
-            todo_title=instance.title
-        )
-        instance.delete()
+        with transaction.atomic():
+            activity.log(
+                user=self.request.user,
+                action='deleted',
+                todo_title=instance.title
+            )
+            instance.delete_subtree()
     
     @action(detail=True, methods=['post'])
     def toggle(self, request, pk=None):
         """Toggle todo completion status"""
         todo = self.get_object()
-        todo.completed = not todo.completed
-        todo.save()
-        
-        ActivityLog.objects.create(
-            user=request.user,
-            action='completed' if todo.completed else 'updated',
-            todo=todo,
-            todo_title=todo.title
-        )
+        with transaction.atomic():
+            todo.completed = not todo.completed
+            todo.save()
+            
+            activity.log(
+                user=request.user,
+                action='completed' if todo.completed else 'updated',
+                todo=todo,
+                todo_title=todo.title
+            )
         
         return Response(TodoSerializer(todo).data)
     
+    @action(detail=True, methods=['get'])
+    def occurrences(self, request, pk=None):
+        """Coming occurrences of a recurring todo, computed rather than stored"""
+        todo = self.get_object()
+        try:
+            start, end = recurrence.parse_range(request.query_params.get('start'), request.query_params.get('end'))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        limit = request.query_params.get('limit', '')
+        limit = min(int(limit), recurrence.MAX_OCCURRENCES) if limit.isdigit() and int(limit) else 50
+        
+        return Response({'occurrences': [
+            {'due_date': item.due_date, 'reminder_date': item.reminder_date}
+            for item in recurrence.occurrences(todo, start, end, limit)
+        ]})
+    
     @action(detail=True, methods=['post'])
     def share(self, request, pk=None):
         """Share todo with other users"""
@@ -236,17 +324,18 @@ class TodoViewSet(viewsets.ModelViewSet):
             return Response({'error': 'No users specified'}, status=status.HTTP_400_BAD_REQUEST)
         
         users = User.objects.filter(id__in=user_ids)
-        todo.shared_with.set(users)
-        todo.is_shared = True
-        todo.save()
-        
-        ActivityLog.objects.create(
-            user=request.user,
-            action='shared',
-            todo=todo,
-            todo_title=todo.title,
-            details={'shared_with': [u.username for u in users]}
-        )
+        with transaction.atomic():
+            todo.shared_with.set(users)
+            todo.is_shared = True
+            todo.save()
+            
+            activity.log(
+                user=request.user,
+                action='shared',
+                todo=todo,
+                todo_title=todo.title,
+                details={'shared_with': [u.username for u in users]}
+            )
         
         return Response({
             'message': 'Todo shared successfully',
@@ -255,46 +344,104 @@ class TodoViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['post'])
     def reorder(self, request):
-        """Update todo positions for drag and drop"""
-        positions = request.data.get('positions', {})
+        """
+        Update todo positions for drag and drop: move one todo with todo_id
+        and after_id or before_id, reorder several among the slots they hold
+        with order=[ids], or write positions={id: position} as given
+        """
+        data = request.data
+        to_pk = Todo._meta.pk.to_python
+        todos = Todo.objects.filter(user=request.user)
+        response = {'message': 'Positions updated successfully'}
         
-        for todo_id, position in positions.items():
-            Todo.objects.filter(id=todo_id, user=request.user).update(position=position)
+        try:
+            if data.get('todo_id'):
+                anchor_id = data.get('after_id') or data.get('before_id')
+                if not anchor_id or to_pk(anchor_id) == to_pk(data['todo_id']):
+                    return Response({'error': 'after_id or before_id of another todo is required'}, status=status.HTTP_400_BAD_REQUEST)
+                todo = todos.get(pk=to_pk(data['todo_id']))
+                anchor = todos.get(pk=to_pk(anchor_id))
+                placement = 'after' if data.get('after_id') else 'before'
+                response['position'] = ordering.move(todo, **{placement: anchor})
+            elif data.get('order'):
+                ordering.apply_order(request.user.pk, [to_pk(pk) for pk in data['order']])
+            else:
+                positions = {to_pk(pk): int(position) for pk, position in data.get('positions', {}).items()}
+                ordering.set_positions(request.user.pk, positions)
+        except (ValidationError, TypeError, ValueError, AttributeError):
+            return Response({'error': 'Invalid request'}, status=status.HTTP_400_BAD_REQUEST)
+        except Todo.DoesNotExist:
+            return Response({'error': 'Todo not found'}, status=status.HTTP_404_NOT_FOUND)
+        caching.bump_version(request.user.pk)
+        events.publish([request.user.pk], 'todos.reordered')
         
-        return Response({'message': 'Positions updated successfully'})
+        return Response(response)
     
     @action(detail=False, methods=['post'])
     def bulk_action(self, request):
-        """Perform bulk actions on multiple todos"""
+        """
+        Perform a bulk action on many todos in chunked transactions and
+        report what it affected; see todos/bulk.py for actions and params
+        """
         action = request.data.get('action')
         todo_ids = request.data.get('todo_ids', [])
         
-        if not action or not todo_ids:
+        if not action or not todo_ids or not isinstance(todo_ids, list):
             return Response({'error': 'Invalid request'}, status=status.HTTP_400_BAD_REQUEST)
         
-        todos = Todo.objects.filter(id__in=todo_ids, user=request.user)
+        try:
+            result = bulk.run(request.user, action, todo_ids, request.data.get('params'))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
-        if action == 'complete':
-            todos.update(completed=True, completed_at=timezone.now())
-        elif action == 'incomplete':
-            todos.update(completed=False, completed_at=None)
-        elif action == 'archive':
-            todos.update(is_archived=True)
-        elif action == 'unarchive':
-            todos.update(is_archived=False)
-        elif action == 'delete':
-            todos.delete()
-        
-        return Response({'message': f'Bulk {action} completed successfully'})
+        return Response({'message': f'Bulk {action} completed successfully', **result})
+    
+    @action(detail=False, methods=['get'], renderer_classes=EXPORT_RENDERERS)
+    def export(self, request):
+        """
+        Stream the user's todos as ?format=json|ndjson|csv, with optional
+        ?include=comments,subtasks,categories and ?compress=gzip
+        """
+        try:
+            include = parse_include(request.query_params.get('include'))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        compress = request.query_params.get('compress')
+        if compress not in (None, '', 'gzip'):
+            return Response({'error': 'compress must be gzip'}, status=status.HTTP_400_BAD_REQUEST)
+        return export_response(request.user, request.accepted_renderer.format, include, compress == 'gzip')
+    
+    @action(detail=False, methods=['post'], url_path='import', url_name='import', parser_classes=[MultiPartParser])
+    def import_file(self, request):
+        """
+        Import todos from an uploaded JSON, NDJSON or CSV file (optionally
+        gzipped), with a per-row error report; dry_run=true only validates
+        """
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'error': 'file is required'}, status=status.HTTP_400_BAD_REQUEST)
+        dry_run = str(request.data.get('dry_run', 'false')).lower() == 'true'
+        try:
+            report = import_todos(request.user, upload, request.data.get('format') or None, dry_run)
+        except ImportFileError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if 'error' in report and not report['created']:
+            return Response(report, status=status.HTTP_400_BAD_REQUEST)
+        # Rows before a point where the file became unreadable are kept, so
+        # the import succeeded for them and must not be retried whole
+        return Response(report, status=status.HTTP_200_OK if dry_run else status.HTTP_201_CREATED)
 
 # Category ViewSet
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """ViewSet for Category CRUD operations"""
     serializer_class = CategorySerializer
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
-        return Category.objects.filter(user=self.request.user)
+        # The GROUP BY of the count drops Meta.ordering, so restate it
+        return Category.objects.filter(user=self.request.user).annotate(
+            num_todos=Count('todo', filter=Q(todo__is_archived=False))
+        ).order_by('name')
     
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -321,7 +468,7 @@ def todo_comments(request, todo_id):
             if serializer.is_valid():
                 comment = serializer.save(user=request.user, todo=todo)
                 
-                ActivityLog.objects.create(
+                activity.log(
                     user=request.user,
                     action='commented',
                     todo=todo,
@@ -335,92 +482,354 @@ def todo_comments(request, todo_id):
     except Todo.DoesNotExist:
         return Response({'error': 'Todo not found'}, status=status.HTTP_404_NOT_FOUND)
 
+# Attachment Views
+def can_access(todo, user):
+    return todo.user_id == user.pk or todo.shared_with.filter(pk=user.pk).exists()
+
+def upload_state(upload, attachment=None, request=None):
+    return {
+        'id': upload.pk,
+        'filename': upload.filename,
+        'size': upload.size,
+        'offset': upload.received,
+        'chunk_size': attachments.chunk_size(),
+        'attachment': TodoAttachmentSerializer(attachment, context={'request': request}).data if attachment else None,
+    }
+
+@api_view(['GET', 'POST'])
+@permission_classes([IsAuthenticated])
+@parser_classes([MultiPartParser])
+def todo_attachments(request, todo_id):
+    """List a todo's attachments, or attach a file posted as multipart `file`"""
+    try:
+        todo = Todo.objects.get(id=todo_id)
+    except Todo.DoesNotExist:
+        return Response({'error': 'Todo not found'}, status=status.HTTP_404_NOT_FOUND)
+    if not can_access(todo, request.user):
+        return Response({'error': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
+    
+    if request.method == 'GET':
+        queryset = todo.attachments.select_related('uploaded_by').order_by('-uploaded_at')
+        return Response(TodoAttachmentSerializer(queryset, many=True, context={'request': request}).data)
+    
+    upload = request.FILES.get('file')
+    if upload is None:
+        return Response({'error': 'Upload a file as "file"'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        attachment = attachments.attach(todo, request.user, upload)
+    except attachments.UploadTooLarge as e:
+        return Response({'error': str(e)}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+    return Response(TodoAttachmentSerializer(attachment, context={'request': request}).data, status=status.HTTP_201_CREATED)
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def todo_uploads(request, todo_id):
+    """Start a resumable upload of {filename, size}, whose chunks are then PATCHed to the upload"""
+    try:
+        todo = Todo.objects.get(id=todo_id)
+    except Todo.DoesNotExist:
+        return Response({'error': 'Todo not found'}, status=status.HTTP_404_NOT_FOUND)
+    if not can_access(todo, request.user):
+        return Response({'error': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
+    
+    filename = request.data.get('filename')
+    size = request.data.get('size')
+    if not filename or not isinstance(size, int) or isinstance(size, bool) or size < 0:
+        return Response({'error': 'filename and a size in bytes are required'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        upload = attachments.start_upload(todo, request.user, filename, size)
+    except attachments.UploadTooLarge as e:
+        return Response({'error': str(e)}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+    attachment = attachments.complete_upload(upload) if size == 0 else None
+    return Response(upload_state(upload, attachment, request), status=status.HTTP_201_CREATED)
+
+@api_view(['GET', 'PATCH', 'DELETE'])
+@permission_classes([IsAuthenticated])
+def upload_detail(request, upload_id):
+    """
+    Where an upload stands (GET), append the chunk in the body at its
+    Content-Range (PATCH) or cancel it (DELETE). The chunk that completes
+    the upload answers 201 with the attachment.
+    """
+    try:
+        upload = AttachmentUpload.objects.select_related('todo', 'user').get(id=upload_id, user=request.user)
+    except AttachmentUpload.DoesNotExist:
+        return Response({'error': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    if request.method == 'GET':
+        return Response(upload_state(upload))
+    if request.method == 'DELETE':
+        upload.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    
+    try:
+        start, end = attachments.parse_content_range(request.headers.get('Content-Range'), upload.size)
+        length = end - start + 1
+        if int(request.headers.get('Content-Length') or 0) != length:
+            raise ValueError('Content-Length does not match the Content-Range')
+        offset = attachments.write_chunk(upload, request.stream, start, length)
+    except attachments.UploadConflict as e:
+        return Response({'error': str(e), 'offset': e.offset}, status=status.HTTP_409_CONFLICT)
+    except attachments.UploadTooLarge as e:
+        return Response({'error': str(e)}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+    except ValueError as e:
+        return Response({'error': str(e), 'offset': upload.received}, status=status.HTTP_400_BAD_REQUEST)
+    
+    if offset < start + length:
+        return Response({'error': 'Chunk ended early', 'offset': offset}, status=status.HTTP_400_BAD_REQUEST)
+    if offset == upload.size:
+        return Response(upload_state(upload, attachments.complete_upload(upload), request), status=status.HTTP_201_CREATED)
+    return Response(upload_state(upload))
+
+@api_view(['GET', 'DELETE'])
+@permission_classes([IsAuthenticated])
+def attachment_detail(request, attachment_id):
+    """Get an attachment's details, or delete it (its uploader or the todo owner)"""
+    try:
+        attachment = TodoAttachment.objects.select_related('todo', 'uploaded_by').get(id=attachment_id)
+    except TodoAttachment.DoesNotExist:
+        return Response({'error': 'Attachment not found'}, status=status.HTTP_404_NOT_FOUND)
+    if not can_access(attachment.todo, request.user):
+        return Response({'error': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
+    
+    if request.method == 'GET':
+        return Response(TodoAttachmentSerializer(attachment, context={'request': request}).data)
+    if request.user.pk not in (attachment.uploaded_by_id, attachment.todo.user_id):
+        return Response({'error': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
+    attachment.delete()
+    return Response(status=status.HTTP_204_NO_CONTENT)
+
+@require_safe
+def attachment_download(request, attachment_id):
+    """The attachment's file, with Range and conditional request support"""
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=status.HTTP_403_FORBIDDEN)
+    attachment = TodoAttachment.objects.select_related('todo').filter(id=attachment_id).first()
+    if attachment is None:
+        return JsonResponse({'error': 'Attachment not found'}, status=status.HTTP_404_NOT_FOUND)
+    if not can_access(attachment.todo, request.user):
+        return JsonResponse({'error': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
+    return attachments.download_response(request, attachment)
+
+def image_response(request, path, etag, cache_control):
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponseNotModified()
+    else:
+        response = FileResponse(open(path, 'rb'), content_type='image/webp')
+    response['ETag'] = etag
+    response['Cache-Control'] = cache_control
+    return response
+
+@require_safe
+def attachment_preview(request, attachment_id, size):
+    """A smaller WebP rendition of an image attachment, size one of PREVIEW_SIZES"""
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=status.HTTP_403_FORBIDDEN)
+    attachment = TodoAttachment.objects.select_related('todo').filter(id=attachment_id).first()
+    if attachment is None or size not in thumbnails.PREVIEW_SIZES:
+        return JsonResponse({'error': 'Preview not found'}, status=status.HTTP_404_NOT_FOUND)
+    if not can_access(attachment.todo, request.user):
+        return JsonResponse({'error': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
+    if not attachment.blob_id or not thumbnails.is_image(attachment.filename):
+        return JsonResponse({'error': 'Preview not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    path = thumbnails.derivative(attachment.file.path, attachment.blob_id, size, crop=False)
+    if path is None:
+        response = JsonResponse({'error': 'Preview not ready'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        response['Retry-After'] = 5
+        return response
+    # Attachments never change, so neither do their previews
+    return image_response(request, path, f'"{attachment.blob_id}-{size}"', 'private, max-age=31536000, immutable')
+
+@require_safe
+def user_avatar(request, user_id, size):
+    """A square WebP thumbnail of a user's avatar, one of AVATAR_SIZES"""
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=status.HTTP_403_FORBIDDEN)
+    user = User.objects.filter(pk=user_id).only('avatar', 'avatar_digest').first()
+    if user is None or not user.avatar or not user.avatar_digest or size not in thumbnails.AVATAR_SIZES:
+        return JsonResponse({'error': 'Avatar not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    path = thumbnails.derivative(user.avatar.path, user.avatar_digest, size, crop=True)
+    if path is None:
+        response = JsonResponse({'error': 'Avatar not ready'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        response['Retry-After'] = 5
+        return response
+    # URLs carry the avatar's digest (?v=), so a new avatar gets new URLs
+    cache_control = 'private, max-age=31536000, immutable' if request.GET.get('v') else 'private, no-cache'
+    return image_response(request, path, f'"{user.avatar_digest}-{size}"', cache_control)
+
 # Statistics Views
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@conditional_get(valid_for=getattr(settings, 'TODO_CACHE_TIMEOUT', caching.DEFAULT_TIMEOUT))
 def get_statistics(request):
-    """Get user statistics"""
-    user = request.user
-    now = timezone.now()
-    
-    # Basic stats
-    total_todos = Todo.objects.filter(user=user).count()
-    completed_todos = Todo.objects.filter(user=user, completed=True).count()
-    active_todos = Todo.objects.filter(user=user, completed=False, is_archived=False).count()
-    overdue_todos = Todo.objects.filter(
-        user=user, 
-        completed=False, 
-        due_date__lt=now
-    ).count()
-    
-    # Completion rate
-    completion_rate = (completed_todos / total_todos * 100) if total_todos > 0 else 0
-    
-    # Category breakdown
-    category_stats = Todo.objects.filter(user=user).values(
-        'category__name', 'category__color'
-    ).annotate(
-        total=Count('id'),
-        completed=Count('id', filter=Q(completed=True))
-    )
-    
-    # Weekly activity
-    week_ago = now - timedelta(days=7)
-    daily_activity = []
-    for i in range(7):
-        day = week_ago + timedelta(days=i)
-        created = Todo.objects.filter(
-            user=user,
-            created_at__date=day.date()
-        ).count()
-        completed = Todo.objects.filter(
-            user=user,
-            completed=True,
-            completed_at__date=day.date()
-        ).count()
-        
-        daily_activity.append({
-            'date': day.strftime('%Y-%m-%d'),
-            'day': day.strftime('%a'),
-            'created': created,
-            'completed': completed
-        })
+    """Get user statistics for a ?days=7|30|90|365 window in ?tz="""
+    try:
+        days, tz = parse_window(request.query_params.get('days'), request.query_params.get('tz'))
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
     
-    # Productivity insights
-    avg_completion_time = Todo.objects.filter(
-        user=user,
-        completed=True,
-        completed_at__isnull=False
-    ).annotate(
-        completion_time=F('completed_at') - F('created_at')
-    ).aggregate(
-        avg_time=Avg('completion_time')
-    )['avg_time']
+    today = timezone.now().astimezone(tz).date()
+    return Response(caching.cached(
+        request.user.pk, 'statistics', {'days': days, 'tz': str(tz), 'today': today},
+        lambda: compute_statistics(request.user, days, tz)
+    ))
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@conditional_get()
+def get_calendar(request):
+    """Todos and recurring occurrences due in [?start, ?end), grouped by day in ?tz"""
+    params = request.query_params
+    if not params.get('start') or not params.get('end'):
+        return Response({'error': 'start and end are required'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        tz = parse_timezone(params.get('tz'))
+        start, end = recurrence.parse_range(params['start'], params['end'], max_days=CALENDAR_MAX_DAYS, tz=tz)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
     
-    return Response({
-        'overview': {
-            'total': total_todos,
-            'completed': completed_todos,
-            'active': active_todos,
-            'overdue': overdue_todos,
-            'completion_rate': round(completion_rate, 1)
-        },
-        'categories': list(category_stats),
-        'daily_activity': daily_activity,
-        'productivity': {
-            'avg_completion_time': avg_completion_time.days if avg_completion_time else None,
-            'most_productive_day': max(daily_activity, key=lambda x: x['completed'])['day'] if daily_activity else None
-        }
-    })
+    return Response(caching.cached(
+        request.user.pk, 'calendar', {'start': start, 'end': end, 'tz': str(tz)},
+        lambda: calendar_days(request.user, start, end, tz)
+    ))
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@conditional_get()
+def get_board(request):
+    """Kanban board grouped by ?group_by=category|priority|status, ?limit cards per column"""
+    try:
+        group_by = parse_group_by(request.query_params.get('group_by'))
+        limit = parse_limit(request.query_params.get('limit'))
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    column_url = request.build_absolute_uri(reverse('board_column'))
+    def next_link(key, todo):
+        url = f"{column_url}?{urlencode({'group_by': group_by, 'column': key, 'limit': limit})}"
+        return ColumnPagination().link_after(url, board_todos(request.user), todo)
+    
+    # Keyed on the full URL, which the column links are built from
+    return Response(caching.cached(
+        request.user.pk, 'board', {'url': request.build_absolute_uri()},
+        lambda: board(request.user, group_by, limit, next_link)
+    ))
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@conditional_get()
+def get_board_column(request):
+    """More cards of one board ?column, keyset paginated by ?cursor"""
+    try:
+        group_by = parse_group_by(request.query_params.get('group_by'))
+        condition = column_filter(group_by, request.query_params.get('column', ''))
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    paginator = ColumnPagination()
+    page = paginator.paginate_queryset(board_todos(request.user).filter(condition).only(*CARD_FIELDS), request)
+    return paginator.get_paginated_response([card(todo) for todo in page])
 
 # Activity Feed
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@conditional_get()
 def get_activity_feed(request):
-    """Get user's activity feed"""
-    activities = ActivityLog.objects.filter(user=request.user)[:50]
-    serializer = ActivityLogSerializer(activities, many=True)
-    return Response(serializer.data)
+    """Get user's activity feed, keyset paginated on ?pagination=cursor"""
+    # Keyed on the full URL, which the cursor links are built from
+    return Response(caching.cached(
+        request.user.pk, 'activity', {'url': request.build_absolute_uri()},
+        lambda: activity_feed(request)
+    ))
+
+def activity_feed(request):
+    activities = ActivityLog.objects.filter(user=request.user).prefetch_related('user')
+    
+    if uses_keyset(request):
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(activities, request)
+        serializer = ActivityLogSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data).data
+    
+    serializer = ActivityLogSerializer(activities[:50], many=True)
+    return serializer.data
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@conditional_get()
+def get_activity_history(request):
+    """Get user's full activity history, archived entries included (?before=<cursor>)"""
+    limit = request.query_params.get('limit', '50')
+    limit = min(int(limit), 100) if limit.isdigit() and int(limit) > 0 else 50
+    try:
+        before = request.query_params.get('before')
+        before = decode_cursor(before) if before else None
+    except ValueError:
+        return Response({'error': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    entries = activity_history(request.user, before, limit)
+    results = [
+        {**data, 'archived': getattr(entry, 'archived', False)}
+        for entry, data in zip(entries, ActivityLogSerializer(entries, many=True).data)
+    ]
+    next_link = None
+    if len(entries) == limit:
+        next_link = replace_query_param(request.build_absolute_uri(), 'before', encode_cursor(entries[-1]))
+    return Response({'next': next_link, 'results': results})
+
+# Tag Facets
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@conditional_get()
+def get_tag_facets(request):
+    """Get todo counts per tag across the user's active todos"""
+    archived = request.query_params.get('archived', 'false')
+    todos = Todo.objects.visible_to(request.user).filter(is_archived=archived.lower() == 'true')
+    return Response(tag_facets(todos))
+
+# Delta Sync
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_sync(request):
+    """Get todos, categories and comments changed since ?since=<token>, with tombstones for deletions"""
+    try:
+        since = sync.decode_token(request.query_params.get('since'))
+    except sync.TokenExpired:
+        return Response({'error': 'Sync token expired, reload everything'}, status=status.HTTP_410_GONE)
+    except ValueError:
+        return Response({'error': 'Invalid sync token'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    changes = sync.changes_since(request.user, since)
+    context = {'request': request, 'subtask_depth': 0}
+    comments = changes['comments']
+    return Response({
+        'token': changes['token'],
+        'has_more': changes['has_more'],
+        'todos': TodoSerializer(changes['todos'], many=True, context=context).data,
+        'categories': CategorySerializer(changes['categories'], many=True).data,
+        'comments': [
+            {**data, 'todo': comment.todo_id}
+            for comment, data in zip(comments, TodoCommentSerializer(comments, many=True).data)
+        ],
+        'deleted': changes['deleted'],
+    })
+
+# Event Stream
+async def event_stream(request):
+    """Server-sent events about the user's todos, comments and sharing (served under ASGI only)"""
+    if not await sync_to_async(lambda: request.user.is_authenticated)():
+        return JsonResponse({'error': 'Authentication required'}, status=status.HTTP_403_FORBIDDEN)
+    if not isinstance(request, ASGIRequest):
+        # A WSGI worker would be tied up for the whole stream
+        return JsonResponse({'error': 'Event stream requires the ASGI server'}, status=status.HTTP_501_NOT_IMPLEMENTED)
+    
+    response = StreamingHttpResponse(events.stream(events.subscribe(request.user.pk)), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Keep proxies such as nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
 
 # Template Views
 class TodoTemplateViewSet(viewsets.ModelViewSet):